@@ -1,51 +1,54 @@
-
-
 import cv2
 import face_recognition
-import pickle
-import os
 import sys
+from gallery import get_gallery
+from quality import CANDIDATES, ENROLL_SAMPLES, score_faces, screen
 video = cv2.VideoCapture(0)
 if len(sys.argv) > 1:
     name = sys.argv[1]
 else:
     name = input("Enter Your Name: ")
 
+# Candidate samples; only the best, most varied few are stored at the end
 encodings = []
+qualities = []
 
 while True:
     ret, frame = video.read()
     rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
     faces = face_recognition.face_locations(rgb_frame)
 
-    for (top, right, bottom, left) in faces:
+    if faces:
+        # The person enrolling is the largest face; anyone behind them is ignored
+        top, right, bottom, left = box = max(faces, key=lambda b: (b[2] - b[0]) * (b[1] - b[3]))
         cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-        face_enc = face_recognition.face_encodings(rgb_frame, [(top, right, bottom, left)])
+        face_enc = face_recognition.face_encodings(rgb_frame, [box])
         if face_enc:
+            parts = score_faces(rgb_frame, [box])[0]
             encodings.append(face_enc[0])
-            cv2.putText(frame, f"Samples: {len(encodings)}", (50, 50),
+            qualities.append(parts["quality"])
+            cv2.putText(frame, f"Samples: {len(encodings)}  quality {parts['quality']:.2f}", (50, 50),
                         cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
 
-    cv2.imshow("Capturing Faces", frame)
+    cv2.imshow("Capturing Faces (turn your head slowly)", frame)
 
-    if cv2.waitKey(1) & 0xFF == ord('q') or len(encodings) >= 20:  # capture 20 encodings
+    if cv2.waitKey(1) & 0xFF == ord('q') or len(encodings) >= CANDIDATES:
         break
 
 video.release()
 cv2.destroyAllWindows()
 
-# Save encodings
-os.makedirs("data", exist_ok=True)
-if os.path.exists("data/encodings.pkl"):
-    with open("data/encodings.pkl", "rb") as f:
-        known_encodings, known_names = pickle.load(f)
-else:
-    known_encodings, known_names = [], []
-
-known_encodings.extend(encodings)
-known_names.extend([name] * len(encodings))
+# Keep a small, diverse, good-quality subset; never store samples that look
+# like someone who is already enrolled
+gallery = get_gallery()
+keep, conflicts, low, existing = screen(encodings, qualities, name, gallery)
+for i, match in conflicts:
+    print(f"⚠️ Sample {i + 1} is closer to {match.roll} (distance {match.distance:.2f}) than to {name}; skipped")
+if low:
+    print(f"Skipped {len(low)} low-quality samples (blurry, small or turned away)")
 
-with open("data/encodings.pkl", "wb") as f:
-    pickle.dump((known_encodings, known_names), f)
+# Save encodings
+gallery.add([encodings[i] for i in keep], name)
 
-print(f"✅ Saved {len(encodings)} encodings for {name}")
+print(f"✅ Saved {len(keep)} of {len(encodings)} samples for {name} "
+      f"({existing + len(keep)}/{ENROLL_SAMPLES} stored)")
@@ -0,0 +1,347 @@
+"""Running attendance figures per student and chronic-absence alerts.
+
+Answering "how is this student doing" used to mean re-reading every day of
+attendance. ``student_stats`` keeps one row per student that is updated as
+attendance happens:
+
+- ``record_mark`` runs inside the ledger's write transaction for every new
+  mark (``api_mark_attendance``, the batch endpoint, the live feed), and
+  touches one row. It updates days present, the current and best streak,
+  the arrival-time sum and a bitmask of the last ``MASK_DAYS`` days present.
+- ``rollup`` books the absences. Once a school day is over, one UPDATE
+  charges an absence to every student who was not marked that day. It runs
+  in a background thread that each worker starts after the fork, at
+  start-up and then every ``ANALYTICS_ROLLUP_INTERVAL`` seconds; requests
+  only read the table. ``python analytics.py rollup`` does the same from
+  cron.
+
+School days are the days on which anyone was marked, as in report.py. A
+student's figures start on their ``since`` day: their first mark or the
+first rollup that saw them. The 30-day rate is computed on read from the
+bitmask and the window's school days.
+
+``compute`` derives the same rows from the attendance table from scratch.
+``python analytics.py verify`` compares the two, and ``rebuild`` replaces
+the stored rows with the recomputed ones. Marks that arrive for an earlier
+day than the student's latest (backfills) recompute just that student.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import date
+
+from db import get_db, seconds_of_day, transaction
+
+log = logging.getLogger(__name__)
+
+ROLLUP_INTERVAL = float(os.environ.get("ANALYTICS_ROLLUP_INTERVAL", "900"))
+AT_RISK_THRESHOLD = float(os.environ.get("ANALYTICS_AT_RISK", "0.75"))
+WINDOW_DAYS = 30
+MASK_DAYS = 62
+MASK = (1 << MASK_DAYS) - 1
+STAT_FIELDS = ["roll_number", "since", "days_present", "absent_days", "streak", "best_streak", "absent_streak",
+               "last_present", "arrival_total", "arrival_count", "recent_mask", "mask_date"]
+
+
+def _ordinal(iso):
+    return date.fromisoformat(iso).toordinal()
+
+
+def _iso(ordinal):
+    return date.fromordinal(ordinal).isoformat()
+
+
+def _new(roll, since):
+    stats = dict.fromkeys(STAT_FIELDS, 0)
+    stats.update(roll_number=roll, since=since, last_present=None, mask_date=None)
+    return stats
+
+
+def _apply_present(stats, day, at, previous_school_day):
+    stats["days_present"] += 1
+    seconds = seconds_of_day(at)
+    if seconds >= 0:
+        stats["arrival_total"] += seconds
+        stats["arrival_count"] += 1
+    # The streak carries on only if the student was there on the last school day
+    continues = stats["last_present"] is not None and stats["last_present"] == previous_school_day
+    stats["streak"] = stats["streak"] + 1 if continues else 1
+    stats["best_streak"] = max(stats["best_streak"], stats["streak"])
+    stats["absent_streak"] = 0
+    stats["last_present"] = day
+    if stats["mask_date"] is None:
+        stats["recent_mask"] = 1
+    else:
+        shift = _ordinal(day) - _ordinal(stats["mask_date"])
+        stats["recent_mask"] = ((stats["recent_mask"] << shift) & MASK) | 1 if shift < MASK_DAYS else 1
+    stats["mask_date"] = day
+
+
+def _apply_absent(stats, day):
+    # Must match the UPDATE in rollup()
+    stats["absent_days"] += 1
+    if stats["last_present"] is None or stats["last_present"] < day:
+        stats["streak"] = 0
+        stats["absent_streak"] += 1
+
+
+def _save(conn, rows):
+    conn.executemany(f"INSERT OR REPLACE INTO student_stats ({', '.join(STAT_FIELDS)}) VALUES "
+                     f"({', '.join(':' + k for k in STAT_FIELDS)})", rows)
+
+
+def rollup_day(conn):
+    """Last school day whose absences have been booked (ISO), or None."""
+    value = conn.execute("SELECT value FROM meta WHERE key = 'stats_rollup'").fetchone()[0]
+    return _iso(value) if value else None
+
+
+def _school_days(conn):
+    return [r[0] for r in conn.execute("SELECT DISTINCT date FROM daily_summary WHERE present > 0 ORDER BY date")]
+
+
+def _default_since(school, year_joined, first_mark):
+    """First school day of the year the student joined (or their first mark if earlier)."""
+    first = school[0] if school else None
+    if year_joined.isdigit() and school and f"{year_joined}-01-01" <= school[-1]:
+        first = school[bisect_left(school, f"{year_joined}-01-01")]
+    candidates = [d for d in (first, first_mark) if d]
+    return min(candidates) if candidates else None
+
+
+def compute(conn, until, rolls=None, since=None):
+    """Student rows derived from the attendance table alone.
+
+    ``until`` is the last day whose absences count (ISO or None).
+    ``since`` maps roll -> first day counted; other students start on
+    ``_default_since``. ``rolls`` limits the result to those students.
+    """
+    since = since or {}
+    school = _school_days(conn)
+    students = {r[0]: r[1] for r in conn.execute("SELECT roll_number, year_joined FROM students")}
+    marks = {}
+    if rolls is not None and len(rolls) <= 50:
+        for roll in rolls:
+            marks[roll] = {day: at for day, at in conn.execute(
+                "SELECT date, time FROM attendance WHERE roll_number = ?", (roll,))}
+    else:
+        for roll, day, at in conn.execute("SELECT roll_number, date, time FROM attendance"):
+            marks.setdefault(roll, {})[day] = at
+    if rolls is None:
+        rolls = set(students) | set(marks) | set(since)
+    rows = []
+    for roll in sorted(rolls):
+        present = marks.get(roll, {})
+        start = since.get(roll) or _default_since(school, students.get(roll) or "", min(present, default=None))
+        if start is None:
+            continue
+        stats = _new(roll, start)
+        for day in sorted(set(d for d in school if d >= start) | set(present)):
+            if day in present:
+                i = bisect_left(school, day)
+                _apply_present(stats, day, present[day], school[i - 1] if i else None)
+            elif until is not None and day <= until:
+                _apply_absent(stats, day)
+        rows.append(stats)
+    return rows
+
+
+def rebuild(conn, until=None):
+    """Recompute every row from scratch (also fills a new table).
+
+    Keeps each student's stored ``since``. Absences are booked up to
+    ``until`` (default: the last school day that is over).
+    """
+    until = until or _closed_until(conn)
+    with transaction(conn):
+        since = {r[0]: r[1] for r in conn.execute("SELECT roll_number, since FROM student_stats")}
+        rows = compute(conn, until, since=since)
+        conn.execute("DELETE FROM student_stats")
+        _save(conn, rows)
+        conn.execute("UPDATE meta SET value = ? WHERE key = 'stats_rollup'", (_ordinal(until) if until else 0,))
+    return len(rows)
+
+
+def _closed_until(conn):
+    """Last school day before today, i.e. the last day that is over."""
+    return conn.execute("SELECT MAX(date) FROM daily_summary WHERE date < ? AND present > 0",
+                        (date.today().isoformat(),)).fetchone()[0]
+
+
+def record_mark(conn, roll, day, at):
+    """Fold one new mark into the student's row; call inside the write transaction."""
+    row = conn.execute(f"SELECT {', '.join(STAT_FIELDS)} FROM student_stats WHERE roll_number = ?",
+                       (roll,)).fetchone()
+    done = rollup_day(conn)
+    if (done and day <= done) or (row is not None and row["last_present"] and day <= row["last_present"]):
+        # A backfill into already-booked days: recompute this one student
+        _save(conn, compute(conn, done, [roll], since={roll: row["since"] if row else day}))
+        return
+    stats = dict(row) if row is not None else _new(roll, day)
+    previous = conn.execute("SELECT MAX(date) FROM daily_summary WHERE date < ? AND present > 0",
+                            (day,)).fetchone()[0]
+    _apply_present(stats, day, at, previous)
+    _save(conn, [stats])
+
+
+def rollup(conn=None, until=None):
+    """Book absences for every school day up to ``until`` (default: the last closed day).
+
+    Returns the number of days booked. Safe to run from several workers at
+    once; the write transaction serialises them.
+    """
+    conn = conn or get_db()
+    until = until or _closed_until(conn)
+    if not until or (rollup_day(conn) or "") >= until:
+        return 0
+    with transaction(conn):
+        done = rollup_day(conn) or ""
+        days = [r[0] for r in conn.execute(
+            "SELECT DISTINCT date FROM daily_summary WHERE date > ? AND date <= ? AND present > 0 ORDER BY date",
+            (done, until))]
+        for day in days:
+            # Students enrolled since the last rollup start counting today
+            conn.execute("INSERT OR IGNORE INTO student_stats (roll_number, since) "
+                         "SELECT roll_number, ? FROM students", (day,))
+            conn.execute(
+                "UPDATE student_stats SET absent_days = absent_days + 1, "
+                "streak = CASE WHEN last_present IS NULL OR last_present < :day THEN 0 ELSE streak END, "
+                "absent_streak = CASE WHEN last_present IS NULL OR last_present < :day "
+                "THEN absent_streak + 1 ELSE absent_streak END "
+                "WHERE since <= :day AND roll_number NOT IN (SELECT roll_number FROM attendance WHERE date = :day)",
+                {"day": day})
+        conn.execute("UPDATE meta SET value = ? WHERE key = 'stats_rollup'", (_ordinal(until),))
+    return len(days)
+
+
+def verify(conn=None):
+    """Compare stored rows with a full recompute; returns the differences."""
+    conn = conn or get_db()
+    with transaction(conn, immediate=False):
+        stored = {r["roll_number"]: dict(r) for r in conn.execute(
+            f"SELECT {', '.join(STAT_FIELDS)} FROM student_stats")}
+        fresh = {r["roll_number"]: r for r in compute(conn, rollup_day(conn), list(stored),
+                                                       since={k: v["since"] for k, v in stored.items()})}
+    problems = []
+    for roll, row in stored.items():
+        expected = fresh.get(roll)
+        diff = {k: (row[k], expected[k]) for k in STAT_FIELDS if expected is None or row[k] != expected[k]}
+        if diff:
+            problems.append({"roll_number": roll, "stored_vs_recomputed": diff})
+    return problems
+
+
+def _window(conn, today, window):
+    start = _iso(_ordinal(today) - window + 1)
+    return [_ordinal(r[0]) for r in conn.execute(
+        "SELECT DISTINCT date FROM daily_summary WHERE date >= ? AND date <= ? AND present > 0", (start, today))]
+
+
+def describe(stats, window_days, done):
+    """Public figures of one stored row; ``window_days`` are school-day ordinals."""
+    since, done = _ordinal(stats["since"]), _ordinal(done) if done else 0
+    anchor = _ordinal(stats["mask_date"]) if stats["mask_date"] else None
+
+    def was_present(day):
+        return anchor is not None and 0 <= anchor - day < MASK_DAYS and stats["recent_mask"] >> (anchor - day) & 1
+
+    # A window day counts once it is booked, or as soon as the student was there
+    counted = [d for d in window_days if d >= since and (d <= done or was_present(d))]
+    present = sum(1 for d in counted if was_present(d))
+    total = stats["days_present"] + stats["absent_days"]
+    average = stats["arrival_total"] // stats["arrival_count"] if stats["arrival_count"] else None
+    return {
+        "roll_number": stats["roll_number"],
+        "since": stats["since"],
+        "days_present": stats["days_present"],
+        "absent_days": stats["absent_days"],
+        "rate": round(stats["days_present"] / total, 4) if total else None,
+        "recent_rate": round(present / len(counted), 4) if counted else None,
+        "recent_days": len(counted),
+        "streak": stats["streak"],
+        "best_streak": stats["best_streak"],
+        "absent_streak": stats["absent_streak"],
+        "last_present": stats["last_present"],
+        "average_arrival": f"{average // 3600:02d}:{average // 60 % 60:02d}" if average is not None else None,
+    }
+
+
+def student_stats(roll, conn=None, window=WINDOW_DAYS):
+    conn = conn or get_db()
+    row = conn.execute(f"SELECT {', '.join(STAT_FIELDS)} FROM student_stats WHERE roll_number = ?",
+                       (str(roll),)).fetchone()
+    if row is None:
+        return None
+    return describe(dict(row), _window(conn, date.today().isoformat(), window), rollup_day(conn))
+
+
+def at_risk(threshold=AT_RISK_THRESHOLD, standard=None, conn=None, window=WINDOW_DAYS):
+    """Students whose rate over the last ``window`` days is below ``threshold``, worst first."""
+    conn = conn or get_db()
+    window_days = _window(conn, date.today().isoformat(), window)
+    done = rollup_day(conn)
+    query = (f"SELECT {', '.join('t.' + k for k in STAT_FIELDS)}, s.full_name, s.standard FROM student_stats t "
+             "JOIN students s ON s.roll_number = t.roll_number")
+    params = ()
+    if standard:
+        query += " WHERE s.standard = ?"
+        params = (str(standard),)
+    result = []
+    for row in conn.execute(query, params):
+        figures = describe(dict(row), window_days, done)
+        if figures["recent_rate"] is not None and figures["recent_rate"] < threshold:
+            figures.update(full_name=row["full_name"], standard=row["standard"])
+            result.append(figures)
+    result.sort(key=lambda f: (f["recent_rate"], -f["absent_streak"]))
+    return result
+
+
+_job = None
+_job_lock = threading.Lock()
+
+
+def _rollup_loop(interval):
+    while True:
+        try:
+            rollup()
+        except Exception as e:
+            log.exception("Attendance rollup failed: %s", e)
+        time.sleep(interval)
+
+
+def start_rollup_job(interval=ROLLUP_INTERVAL):
+    """Start the periodic rollup thread once per process (not before a fork)."""
+    global _job
+    if _job is None:
+        with _job_lock:
+            if _job is None:
+                _job = threading.Thread(target=_rollup_loop, args=(interval,), daemon=True,
+                                        name="attendance-rollup")
+                _job.start()
+    return _job
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Per-student attendance statistics")
+    parser.add_argument("command", choices=["rollup", "verify", "rebuild", "at-risk"])
+    parser.add_argument("--threshold", type=float, default=AT_RISK_THRESHOLD)
+    args = parser.parse_args()
+    conn = get_db()
+    if args.command == "rollup":
+        print(f"✅ Booked absences for {rollup(conn)} school day(s)")
+    elif args.command == "rebuild":
+        print(f"✅ Rebuilt statistics for {rebuild(conn)} students")
+    elif args.command == "verify":
+        problems = verify(conn)
+        for problem in problems:
+            print(json.dumps(problem))
+        print(f"{'❌' if problems else '✅'} {len(problems)} student(s) differ from a full recompute")
+        raise SystemExit(1 if problems else 0)
+    else:
+        for figures in at_risk(args.threshold, conn=conn):
+            print(json.dumps(figures))
@@ -1,37 +1,52 @@
-
-
 from flask import Flask, render_template, request, redirect, url_for, session, Response, jsonify
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import subprocess
-import sys
-import cv2
-import face_recognition
-import pickle
+import gc
+import logging
+import tempfile
+import zipfile
 import os
 import time
 from datetime import datetime
-import csv
-import numpy as np
-import base64
 import io
-from PIL import Image, ImageDraw, ImageFont
+from roster import get_roster
+from ledger import MAX_PAGE_SIZE, PAGE_SIZE, attendance_page, daily_summaries, get_ledger
+from analytics import AT_RISK_THRESHOLD, at_risk, start_rollup_job, student_stats
+from db import from_iso, to_iso
+from pipeline import RecognitionPipeline
+from camera import CameraUnavailable, get_camera
+from notifier import (SMTP_USER, SMTPNotConfigured, SMTPPool, build_message, get_bulk_job, get_notifier,
+                      send_absent_notifications)
+import metrics
+from logs import configure_logging
+from metrics import count_faces, timed
+# OpenCV, dlib, NumPy and PIL load on first use (or in the background
+# warm-up), so starting a worker or serving the login page never waits on them
+from lazy import (WARMUP, LazyModule, cv2, face_recognition, lazy_callable, np, start_warm_up,
+                  warm_up, warm_up_status)
+
+Image = LazyModule("PIL.Image")
+ImageDraw = LazyModule("PIL.ImageDraw")
+ImageFont = LazyModule("PIL.ImageFont")
+quality = LazyModule("quality")
+get_gallery = lazy_callable("gallery", "get_gallery")
+train_missing_index = lazy_callable("gallery", "train_missing_index")
+get_reports = lazy_callable("report", "get_reports")
+report_csv = lazy_callable("report", "report_csv")
+read_mapping = lazy_callable("enroll", "read_mapping")
+start_enroll_job = lazy_callable("enroll", "start_enroll_job")
+FaceTracker = lazy_callable("tracker", "FaceTracker")
+FaceDetector = lazy_callable("detector", "FaceDetector")
+decode_data_url = lazy_callable("recognition", "decode_data_url")
+decode_image = lazy_callable("recognition", "decode_image")
+get_executor = lazy_callable("recognition", "get_executor")
+recognize_images = lazy_callable("recognition", "recognize_images")
+# Imported by the warm-up so the first recognition request finds them loaded
+WARM_MODULES = ("gallery", "recognition", "detector", "tracker", "quality", "report", "enroll")
 
 app = Flask(__name__)
-app.secret_key = "your_secret_key"  # required for login session
-
-# Optional imports: allow the Flask app to start even if OpenCV or
-# face_recognition (dlib) are not installed on the system.
-try:
-    import cv2
-except Exception:
-    cv2 = None
-
-try:
-    import face_recognition
-except Exception:
-    face_recognition = None
+# required for login session; set SECRET_KEY in production so every worker signs sessions alike
+app.secret_key = os.environ.get("SECRET_KEY", "your_secret_key")
+configure_logging()
+log = logging.getLogger(__name__)
 
 # Helper to create a JPEG bytes response with an error message
 def _make_text_jpeg(msg, width=640, height=480):
@@ -46,10 +61,6 @@ def _make_text_jpeg(msg, width=640, height=480):
     img.save(buf, format='JPEG')
     return buf.getvalue()
 
-# Remove any duplicate import blocks below (search for 'from flask import' etc.)
-
-# Diagnostic route for email testing
-
 # Camera-based attendance (PC/Mobile) routes
 @app.route("/take_attendance_camera")
 def take_attendance_camera():
@@ -57,133 +68,150 @@ def take_attendance_camera():
 
 @app.route("/api/mark_attendance", methods=["POST"])
 def api_mark_attendance():
-    import pandas as pd
-    data = request.get_json()
     # If heavy dependencies are missing, return clear error for API callers
-    if face_recognition is None or cv2 is None:
+    if not face_recognition.available() or not cv2.available():
         return jsonify({"success": False, "error": "Face recognition or OpenCV not installed on server. Install dlib and opencv-python to enable this feature."})
-    image_data = data.get("image", "")
-    if not image_data.startswith("data:image/jpeg;base64,"):
-        return jsonify({"success": False, "error": "Invalid image data"})
-    try:
-        img_str = image_data.split(",", 1)[1]
-        img_bytes = base64.b64decode(img_str)
-        img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-        frame = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-    except Exception as e:
-        return jsonify({"success": False, "error": f"Image decode error: {e}"})
-    # Load encodings
+    # Preferred: raw image/jpeg body. Still accepts the old JSON data URL.
+    with timed("api", "decode"):
+        if request.mimetype and request.mimetype.startswith("image/"):
+            img_bytes = request.get_data()
+        else:
+            image_data = (request.get_json(silent=True) or {}).get("image", "")
+            if not image_data.startswith("data:image/jpeg;base64,"):
+                return jsonify({"success": False, "error": "Invalid image data"})
+            try:
+                img_bytes = decode_data_url(image_data)
+            except Exception as e:
+                return jsonify({"success": False, "error": f"Image decode error: {e}"})
+        try:
+            # Decoded straight to RGB (and downscaled if large) for face_recognition
+            rgb_frame, _ = decode_image(img_bytes)
+        except Exception as e:
+            return jsonify({"success": False, "error": f"Image decode error: {e}"})
+    # Known encodings come from the shared in-memory gallery
     try:
-        with open("data/encodings.pkl", "rb") as f:
-            known_encodings, known_rolls = pickle.load(f)
-    except Exception as e:
+        matcher = get_gallery().matcher()
+    except Exception:
+        return jsonify({"success": False, "error": "No face encodings found. Please register students first."})
+    if not len(matcher):
         return jsonify({"success": False, "error": "No face encodings found. Please register students first."})
     # Recognize face
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    faces = face_recognition.face_locations(rgb_frame)
-    encodings = face_recognition.face_encodings(rgb_frame, faces)
+    with timed("api", "detect"):
+        faces = face_recognition.face_locations(rgb_frame)
+    with timed("api", "encode"):
+        encodings = face_recognition.face_encodings(rgb_frame, faces)
     if not encodings:
         return jsonify({"success": False, "error": "No face detected."})
-    # Use first face only
-    face_enc = encodings[0]
-    matches = face_recognition.compare_faces(known_encodings, face_enc, tolerance=0.5)
-    roll = "Unknown"
-    if True in matches:
-        first_match_index = matches.index(True)
-        roll = str(known_rolls[first_match_index])
-    # Load student info
-    student_file = "data/students.csv"
-    students = {}
-    if os.path.exists(student_file):
-        df = pd.read_csv(student_file, dtype=str)
-        for _, row in df.iterrows():
-            students[str(row['roll_number'])] = row
-    display_name = students[roll]['full_name'] if roll in students else roll
-    standard_val = students[roll]['standard'] if roll in students else ''
+    # Use first face only; nearest gallery identity within tolerance wins
+    with timed("api", "match"):
+        matches = matcher.match(encodings[:1])
+    count_faces("api", matches)
+    roll = matches[0].roll
+    # Look up student info
+    student = get_roster().get(roll)
+    display_name = student['full_name'] if student else roll
+    standard_val = student['standard'] if student else ''
     # Mark attendance if not already marked
     ts = time.time()
     date = datetime.fromtimestamp(ts).strftime("%d-%m-%Y")
-    file_path = f"Attendance/Attendance_{date}.csv"
-    marked_rolls = set()
-    if os.path.exists(file_path):
-        try:
-            df_check = pd.read_csv(file_path)
-            if 'ROLL' in df_check.columns:
-                marked_rolls = set(df_check['ROLL'].astype(str).tolist())
-        except Exception:
-            pass
     timestamp = datetime.fromtimestamp(ts).strftime("%H:%M:%S")
-    name_val = display_name
-    if roll != "Unknown" and roll not in marked_rolls:
-        write_header = not os.path.exists(file_path)
-        with open(file_path, "a", newline="") as csvfile:
-            writer = csv.writer(csvfile)
-            if write_header:
-                writer.writerow(['ROLL', 'NAME', 'STANDARD', 'TIME'])
-            writer.writerow([roll, name_val, standard_val, timestamp])
-        
-        # Send arrival email to parent
-        parent_email = students[roll].get('parent_email', '') if roll in students else ''
-        if parent_email:
-            email_error = None
-            try:
-                GMAIL_USER = 'nusumadithya13@gmail.com'
-                GMAIL_PASS = 'wymnrmhgnvflvagg'
-                msg = MIMEMultipart()
-                msg['From'] = GMAIL_USER
-                msg['To'] = parent_email
-                msg['Subject'] = 'School Arrival Notification'
-                message_body = f"Your ward '{name_val}' of standard '{standard_val}' is present at school at {timestamp}."
-                msg.attach(MIMEText(message_body, 'plain'))
-                server = smtplib.SMTP('smtp.gmail.com', 587, timeout=15)
-                server.starttls()
-                server.login(GMAIL_USER, GMAIL_PASS)
-                server.sendmail(GMAIL_USER, parent_email, msg.as_string())
-                server.quit()
-            except Exception as e:
-                import traceback
-                email_error = f"General error sending arrival email for {name_val} ({parent_email}): {e}\n{traceback.format_exc()}"
-            if email_error:
-                print(email_error)
-                try:
-                    log_path = os.path.join(os.path.dirname(__file__), 'email_errors.log')
-                    with open(log_path, 'a') as logf:
-                        logf.write(f"[{datetime.now()}] {email_error}\n")
-                except Exception as log_ex:
-                    print(f"Failed to write to email_errors.log: {log_ex}")
+    if roll != "Unknown":
+        with timed("api", "ledger"):
+            marked = get_ledger(date).mark(roll, display_name, standard_val, timestamp)
+        if marked:
+            log.info("Attendance marked", extra={"roll": roll, "path": "api"})
+            # Queue the arrival email; the notifier sends it in the background
+            parent_email = student.get('parent_email', '') if student else ''
+            with timed("api", "notify"):
+                get_notifier().notify_arrival(roll, display_name, standard_val, parent_email, timestamp, date)
 
     if roll == "Unknown":
         return jsonify({"success": False, "error": "Face not recognized."})
-    return jsonify({"success": True, "roll": roll, "name": name_val, "time": timestamp})
+    return jsonify({"success": True, "roll": roll, "name": display_name, "time": timestamp})
 
-# ...existing code for routes and logic...
+@app.route('/api/mark_attendance/batch', methods=['POST'])
+def api_mark_attendance_batch():
+    # Accepts multipart "images" files or JSON {"images": [data URL, ...]}
+    if not face_recognition.available() or not cv2.available():
+        return jsonify({"success": False, "error": "Face recognition or OpenCV not installed on server. Install dlib and opencv-python to enable this feature."})
+    try:
+        with timed("batch", "decode"):
+            if request.files:
+                images = [f.read() for f in request.files.getlist("images")]
+            else:
+                images = [decode_data_url(v) for v in (request.get_json(silent=True) or {}).get("images", [])]
+    except Exception as e:
+        return jsonify({"success": False, "error": f"Image decode error: {e}"}), 400
+    if not images:
+        return jsonify({"success": False, "error": "No images uploaded."}), 400
+    try:
+        matcher = get_gallery().matcher()
+    except Exception:
+        return jsonify({"success": False, "error": "No face encodings found. Please register students first."})
+    if not len(matcher):
+        return jsonify({"success": False, "error": "No face encodings found. Please register students first."})
+    faces, errors = recognize_images(images, matcher)
+    roster = get_roster()
+    ts = time.time()
+    date = datetime.fromtimestamp(ts).strftime("%d-%m-%Y")
+    timestamp = datetime.fromtimestamp(ts).strftime("%H:%M:%S")
+    entries = []
+    for _, _, match in faces:
+        if match.roll != "Unknown":
+            student = roster.get(match.roll)
+            entries.append((match.roll, student['full_name'] if student else match.roll,
+                            student['standard'] if student else '', timestamp))
+    # Every recognised roll is marked in one ledger transaction
+    with timed("batch", "ledger"):
+        written = get_ledger(date).mark_many(entries)
+    if written:
+        log.info("Attendance marked", extra={"rolls": [entry[0] for entry in written], "path": "batch"})
+    with timed("batch", "notify"):
+        for roll, name_val, standard_val, _ in written:
+            student = roster.get(roll)
+            parent_email = student.get('parent_email', '') if student else ''
+            get_notifier().notify_arrival(roll, name_val, standard_val, parent_email, timestamp, date)
+    marked = {entry[0] for entry in written}
+    results = []
+    for image_index, (top, right, bottom, left), match in faces:
+        student = roster.get(match.roll) if match.roll != "Unknown" else None
+        results.append({
+            "image": image_index,
+            "box": {"top": top, "right": right, "bottom": bottom, "left": left},
+            "roll": match.roll,
+            "name": student['full_name'] if student else match.roll,
+            "distance": round(match.distance, 4),
+            "margin": round(match.margin, 4) if np.isfinite(match.margin) else None,
+            "marked": match.roll in marked,
+        })
+    return jsonify({
+        "success": True,
+        "time": timestamp,
+        "faces": results,
+        "marked": sorted(marked),
+        "errors": [{"image": i, "error": e} for i, e in sorted(errors.items())],
+    })
 
 # Diagnostic route for email testing
 @app.route('/test_email')
 def test_email():
-    import traceback
-    GMAIL_USER = 'nusumadithya13@gmail.com'
-    GMAIL_PASS = 'wymnrmhgnvflvagg'
-    test_recipient = GMAIL_USER  # Send to yourself for testing
+    test_recipient = SMTP_USER  # Send to yourself for testing
     subject = 'Test Email from Attendance System'
     body = 'This is a test email sent from your Flask attendance system.'
-    msg = MIMEMultipart()
-    msg['To'] = test_recipient
-    msg['Subject'] = subject
-    msg.attach(MIMEText(body, 'plain'))
-    server = smtplib.SMTP('smtp.gmail.com', 587, timeout=15)
-    server.ehlo()
-    server.starttls()
-    server.ehlo()
-    server.login(GMAIL_USER, GMAIL_PASS)
-    response = server.sendmail(GMAIL_USER, test_recipient, msg.as_string())
-    server.quit()
-    print(f"Test email sent to {test_recipient}. SMTP response: {response}")
+    # Send synchronously on a fresh connection so configuration errors surface here
+    pool = SMTPPool()
+    if not pool.configured():
+        return "Email is not configured: set SMTP_USER and SMTP_PASS on the server.", 503
+    try:
+        response = pool.send(build_message(test_recipient, subject, body), test_recipient)
+    finally:
+        pool.close()
+    log.info("Test email sent", extra={"recipient": test_recipient, "response": response})
     return f"Test email sent to {test_recipient}. Check your inbox and spam folder. SMTP response: {response}"
 
 # ---------- LOGIN CONFIG ----------
-USERNAME = "TEACHER"
-PASSWORD = "123456"
+USERNAME = os.environ.get("TEACHER_USERNAME", "TEACHER")
+PASSWORD = os.environ.get("TEACHER_PASSWORD", "123456")
 
 @app.route("/")
 def home():
@@ -215,33 +243,15 @@ def logout():
 
 @app.route("/add_details", methods=["GET", "POST"])
 def add_details():
-    import csv
-    import datetime
-    student_file = "data/students.csv"
     if request.method == "POST":
         full_name = request.form.get("full_name")
         dob = request.form.get("dob")
         parent_mobile = request.form.get("parent_mobile")
         parent_email = request.form.get("parent_email")
         standard = request.form.get("standard")
-        year_joined = datetime.datetime.now().year
-        # Generate roll number: YYYY-000X (FCFS)
-        roll_number = None
-        os.makedirs("data", exist_ok=True)
-        students = []
-        if os.path.exists(student_file):
-            with open(student_file, "r", newline="") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    students.append(row)
-        count_this_year = sum(1 for s in students if s.get("year_joined") == str(year_joined))
-        roll_number = f"{year_joined}{count_this_year+1:04d}"
-        # Save student details
-        with open(student_file, "a", newline="") as f:
-            writer = csv.writer(f)
-            if f.tell() == 0:
-                writer.writerow(["roll_number", "full_name", "dob", "parent_mobile", "parent_email", "standard", "year_joined"])
-            writer.writerow([roll_number, full_name, dob, parent_mobile, parent_email, standard, year_joined])
+        # Save student details; the roster assigns the roll number: YYYY-000X (FCFS)
+        student = get_roster().add(full_name, dob, parent_mobile, parent_email, standard)
+        roll_number = student["roll_number"]
         # Store for face capture
         session["add_details_name"] = full_name
         session["add_details_roll"] = roll_number
@@ -252,22 +262,28 @@ def add_details():
 def gen_frames():
     # If OpenCV is not available, stream a single error frame so the
     # video endpoint still responds instead of crashing the server.
-    if cv2 is None:
+    if not cv2.available():
         frame = _make_text_jpeg("OpenCV not available on server.")
         yield (b'--frame\r\n'
                b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
         return
-    video = cv2.VideoCapture(0)
-    while True:
-        success, frame = video.read()
-        if not success:
-            break
-        else:
-            ret, buffer = cv2.imencode('.jpg', frame)
-            frame = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-    video.release()
+    try:
+        video = get_camera().subscribe()
+    except CameraUnavailable as e:
+        yield (b'--frame\r\n'
+               b'Content-Type: image/jpeg\r\n\r\n' + _make_text_jpeg(str(e)) + b'\r\n')
+        return
+    # Shared camera: this client only holds a cursor into the frame ring
+    with video:
+        while True:
+            success, frame = video.read()
+            if not success:
+                break
+            else:
+                ret, buffer = cv2.imencode('.jpg', frame)
+                frame = buffer.tobytes()
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
 
 @app.route('/video_feed')
 def video_feed():
@@ -284,286 +300,287 @@ def start_add_details():
     message = None
     if request.method == "POST":
         # Check availability of camera and face libs before capturing
-        if cv2 is None or face_recognition is None:
+        if not cv2.available() or not face_recognition.available():
             message = "Camera or face recognition library not available on server. Can't capture faces here."
         else:
-            # Capture a frame from the webcam
-            video = cv2.VideoCapture(0)
-            ret, frame = video.read()
-            video.release()
-            if not ret:
+            # Grab a frame from the shared camera (no re-open if a feed is live)
+            frame = get_camera().snapshot()
+            if frame is None:
                 message = "Could not access camera."
             else:
                 rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
                 faces = face_recognition.face_locations(rgb_frame)
-                encodings = []
-                for (top, right, bottom, left) in faces:
-                    face_enc = face_recognition.face_encodings(rgb_frame, [(top, right, bottom, left)])
-                    if face_enc:
-                        encodings.append(face_enc[0])
-                if encodings:
-                    os.makedirs("data", exist_ok=True)
-                    if os.path.exists("data/encodings.pkl"):
-                        with open("data/encodings.pkl", "rb") as f:
-                            known_encodings, known_names = pickle.load(f)
-                    else:
-                        known_encodings, known_names = [], []
-                    # Save roll_number as the face label
-                    known_encodings.extend(encodings)
-                    known_names.extend([roll_number] * len(encodings))
-                    with open("data/encodings.pkl", "wb") as f:
-                        pickle.dump((known_encodings, known_names), f)
-                    captured = True
-                    message = f"✅ Saved {len(encodings)} face(s) for {name} (Roll: {roll_number})."
-                else:
+                # Only the largest face is the student; bystanders are never stored
+                box = max(faces, key=lambda b: (b[2] - b[0]) * (b[1] - b[3])) if faces else None
+                face_enc = face_recognition.face_encodings(rgb_frame, [box]) if faces else []
+                if not face_enc:
                     message = "No face detected. Please try again."
+                else:
+                    parts = quality.score_faces(rgb_frame, [box])[0]
+                    gallery = get_gallery()
+                    keep, conflicts, low, existing = quality.screen(face_enc, [parts["quality"]], roll_number, gallery)
+                    if low:
+                        message = (f"Sample quality too low ({parts['quality']:.2f} < {quality.MIN_QUALITY:.2f}, "
+                                   f"weakest: {quality.weakest(parts)}). Face the camera in good light and try again.")
+                    elif conflicts:
+                        match = conflicts[0][1]
+                        message = (f"⚠️ This face is closer to enrolled student {match.roll} "
+                                   f"(distance {match.distance:.2f}). Sample not saved.")
+                    elif existing >= quality.ENROLL_SAMPLES:
+                        captured = True
+                        message = f"✅ {name} already has {existing} samples; no more are needed."
+                    elif not keep:
+                        message = "Too similar to a saved sample. Turn your head slightly and capture again."
+                    else:
+                        # Save roll_number as the face label
+                        gallery.add([face_enc[i] for i in keep], roll_number)
+                        captured = True
+                        message = (f"✅ Saved sample {existing + 1}/{quality.ENROLL_SAMPLES} for {name} "
+                                   f"(Roll: {roll_number}, quality {parts['quality']:.2f}).")
+                    if len(faces) > 1:
+                        message += f" Ignored {len(faces) - 1} other face(s) in the frame."
     return render_template("camera_started.html", name=name, roll_number=roll_number, standard=standard, captured=captured, message=message)
 
 
+@app.route("/api/enroll/bulk", methods=["POST"])
+def api_enroll_bulk():
+    # Multipart: "photos" (a .zip of ID photos) and "mapping" (CSV: file, roll_number).
+    # Encoding runs in the background; poll the returned status_url for progress.
+    photos = request.files.get("photos")
+    mapping_file = request.files.get("mapping")
+    if photos is None or mapping_file is None:
+        return jsonify({"error": "Send a 'photos' zip and a 'mapping' CSV"}), 400
+    try:
+        mapping = read_mapping(mapping_file.read().decode("utf-8-sig"))
+    except (UnicodeDecodeError, ValueError) as e:
+        return jsonify({"error": f"Bad mapping CSV: {e}"}), 400
+    fd, archive_path = tempfile.mkstemp(suffix=".zip")
+    with os.fdopen(fd, "wb") as f:
+        photos.save(f)
+    if not zipfile.is_zipfile(archive_path):
+        os.remove(archive_path)
+        return jsonify({"error": "'photos' must be a zip file"}), 400
+    job = start_enroll_job(archive_path, mapping, get_executor())
+    return jsonify({"job_id": job.id, "status_url": url_for("enroll_job_status", job_id=job.id)}), 202
+
+@app.route("/api/enroll/jobs/<job_id>")
+def enroll_job_status(job_id):
+    job = get_bulk_job(job_id)
+    if job is None or job.get("kind") != "enroll":
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
+
+
 # Take Attendance: Show name entry form, then POST to /start_attendance
 
 
 # Real-time continuous attendance system
-attendance_log = set()
+_active_pipelines = set()
+
+class AttendanceRecognizer:
+    """Recognition stage of the realtime pipeline: returns [(box, label), ...].
+
+    A face tracker decides when to detect and which faces need encoding, so a
+    student standing still is not re-encoded on every frame; detection itself
+    goes through the cascaded detector.
+    """
+
+    def __init__(self):
+        self.detector = FaceDetector()
+        self.tracker = FaceTracker(self.detect, self.identify)
+
+    def detect(self, rgb_frame):
+        with timed("stream", "detect"):
+            return self.detector(rgb_frame)
+
+    def identify(self, rgb_frame, boxes):
+        with timed("stream", "encode"):
+            encodings = face_recognition.face_encodings(rgb_frame, boxes)
+        # Match every new face in the frame against the gallery in one batch
+        with timed("stream", "match"):
+            matches = get_gallery().matcher().match(encodings)
+        count_faces("stream", matches)
+        return matches
+
+    def stats(self):
+        return {**self.tracker.stats(), **self.detector.stats()}
+
+    def __call__(self, frame):
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        roster = get_roster()
+        overlays = []
+        for track in self.tracker.update(rgb_frame):
+            roll = track.roll
+            display_name = "Unknown"
+            student = roster.get(roll) if roll != "Unknown" else None
+            if roll != "Unknown":
+                display_name = student['full_name'] if student else roll
+            overlays.append((track.box, display_name))
+            # Mark attendance when a track is (re)identified; the ledger
+            # answers "already marked" from memory
+            if track.fresh and roll != "Unknown":
+                now = datetime.now()
+                timestamp = now.strftime("%H:%M:%S")
+                standard_val = student['standard'] if student else ''
+                name_val = student['full_name'] if student else roll
+                date = now.strftime("%d-%m-%Y")
+                with timed("stream", "ledger"):
+                    marked = get_ledger(date).mark(roll, name_val, standard_val, timestamp)
+                if marked:
+                    log.info("Attendance marked", extra={"roll": roll, "path": "stream"})
+                    # Only enqueue; the notifier sends at most one arrival email per roll per day
+                    parent_email = student.get('parent_email', '') if student else ''
+                    with timed("stream", "notify"):
+                        get_notifier().notify_arrival(roll, name_val, standard_val, parent_email, timestamp, date)
+        return overlays
+
 def gen_attendance_frames():
-    import pandas as pd
-    import logging
+    gallery = get_gallery()
     try:
-        with open("data/encodings.pkl", "rb") as f:
-            known_encodings, known_rolls = pickle.load(f)
+        gallery.refresh()
     except Exception as e:
-        logging.error(f"Error loading encodings: {e}")
-        known_encodings, known_rolls = [], []
-    import time
-    time.sleep(1)  # Short delay to allow camera sensor to reset
+        log.error("Error loading encodings: %s", e)
     # If OpenCV or face_recognition are missing, stream an explanatory image
-    if cv2 is None or face_recognition is None:
+    if not cv2.available() or not face_recognition.available():
         frame = _make_text_jpeg("OpenCV or face_recognition not installed on server.")
         yield (b'--frame\r\n'
                b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
         return
-    video = cv2.VideoCapture(0)
-    # Reduce frame size for speed
-    video.set(cv2.CAP_PROP_FRAME_WIDTH, 480)
-    video.set(cv2.CAP_PROP_FRAME_HEIGHT, 360)
-    if not video.isOpened():
-        import numpy as np
+    try:
+        video = get_camera().subscribe()
+    except CameraUnavailable:
         error_frame = np.ones((300, 600, 3), dtype=np.uint8) * 255
         cv2.putText(error_frame, "Camera not accessible!", (30, 150), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0,0,255), 3)
         ret, buffer = cv2.imencode('.jpg', error_frame)
         frame = buffer.tobytes()
         yield (b'--frame\r\n'
                b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-        video.release()
         return
-    ts = time.time()
-    date = datetime.fromtimestamp(ts).strftime("%d-%m-%Y")
-    file_path = f"Attendance/Attendance_{date}.csv"
-    already_marked = set()
-    if os.path.exists(file_path):
-        df = pd.read_csv(file_path)
-        if 'ROLL' in df.columns:
-            already_marked = set(df['ROLL'].tolist())
-        elif 'NAME' in df.columns:
-            already_marked = set(df['NAME'].tolist())
-    # Load student info for display
-    student_file = "data/students.csv"
-    students = {}
-    if os.path.exists(student_file):
-        with open(student_file, "r") as f:
-            reader = pd.read_csv(f)
-            for _, row in reader.iterrows():
-                students[str(row['roll_number'])] = row
+    pipeline = RecognitionPipeline(video, AttendanceRecognizer()).start()
+    _active_pipelines.add(pipeline)
     try:
-        while True:
-            success, frame = video.read()
-            if not success:
-                logging.error("Failed to read frame from camera.")
-                break
-            # Resize frame for faster processing
-            frame = cv2.resize(frame, (480, 360))
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            faces = face_recognition.face_locations(rgb_frame)
-            encodings = face_recognition.face_encodings(rgb_frame, faces)
-            for (top, right, bottom, left), face_enc in zip(faces, encodings):
-                matches = face_recognition.compare_faces(known_encodings, face_enc, tolerance=0.5)
-                roll = "Unknown"
-                display_name = "Unknown"
-                if True in matches:
-                    first_match_index = matches.index(True)
-                    roll = str(known_rolls[first_match_index])
-                    display_name = students[roll]['full_name'] if roll in students else roll
-                cv2.rectangle(frame, (left, top), (right, bottom), (50, 50, 255), 2)
-                cv2.putText(frame, display_name, (left, top - 10), cv2.FONT_HERSHEY_COMPLEX, 1, (255, 255, 255), 2)
-                # Mark attendance only once per student per day
-                if roll != "Unknown":
-                    marked_rolls = set()
-                    if os.path.exists(file_path):
-                        try:
-                            df_check = pd.read_csv(file_path)
-                            if 'ROLL' in df_check.columns:
-                                marked_rolls = set(df_check['ROLL'].astype(str).tolist())
-                        except Exception:
-                            pass
-                    timestamp = datetime.fromtimestamp(ts).strftime("%H:%M:%S")
-                    standard_val = students[roll]['standard'] if roll in students else ''
-                    name_val = students[roll]['full_name'] if roll in students else roll
-                    if roll not in marked_rolls:
-                        write_header = not os.path.exists(file_path)
-                        with open(file_path, "a", newline="") as csvfile:
-                            writer = csv.writer(csvfile)
-                            if write_header:
-                                writer.writerow(['ROLL', 'NAME', 'STANDARD', 'TIME'])
-                            writer.writerow([roll, name_val, standard_val, timestamp])
-                        already_marked.add(roll)
-                    # Send arrival email to parent immediately after attendance is marked
-                    parent_email = students[roll].get('parent_email', '') if roll in students else ''
-                    if parent_email:
-                        email_error = None
-                        try:
-                            GMAIL_USER = 'nusumadithya13@gmail.com'
-                            GMAIL_PASS = 'wymnrmhgnvflvagg'
-                            msg = MIMEMultipart()
-                            msg['From'] = GMAIL_USER
-                            msg['To'] = parent_email
-                            msg['Subject'] = 'School Arrival Notification'
-                            message_body = f"Your ward '{display_name}' of standard '{standard_val}' is present at school at {timestamp}."
-                            msg.attach(MIMEText(message_body, 'plain'))
-                            print(f"Connecting to Gmail SMTP server...")
-                            server = smtplib.SMTP('smtp.gmail.com', 587, timeout=15)
-                            server.set_debuglevel(1)
-                            server.ehlo()
-                            server.starttls()
-                            server.ehlo()
-                            print(f"Logging in as {GMAIL_USER}")
-                            server.login(GMAIL_USER, GMAIL_PASS)
-                            print(f"Sending email to {parent_email}")
-                            response = server.sendmail(GMAIL_USER, parent_email, msg.as_string())
-                            print(f"SMTP sendmail response: {response}")
-                            server.quit()
-                            print(f"Email sent to {parent_email} for {display_name} at {timestamp}")
-                        except smtplib.SMTPAuthenticationError as e:
-                            email_error = f"Gmail SMTP Authentication Error: {e}"
-                        except smtplib.SMTPRecipientsRefused as e:
-                            email_error = f"Gmail SMTP Recipients Refused: {e.recipients}"
-                        except smtplib.SMTPDataError as e:
-                            email_error = f"Gmail SMTP Data Error: {e.smtp_code} {e.smtp_error}"
-                        except smtplib.SMTPException as e:
-                            email_error = f"Gmail SMTP Error: {e}"
-                        except Exception as e:
-                            import traceback
-                            email_error = f"General error sending arrival email for {display_name} ({parent_email}): {e}\n{traceback.format_exc()}"
-                        if email_error:
-                            print(email_error)
-                            try:
-                                log_path = os.path.join(os.path.dirname(__file__), 'email_errors.log')
-                                with open(log_path, 'a') as logf:
-                                    logf.write(f"[{datetime.now()}] {email_error}\n")
-                                print(f"Error logged to {log_path}")
-                            except Exception as log_ex:
-                                print(f"Failed to write to email_errors.log: {log_ex}")
-            # Encode frame for streaming (restore JPEG quality)
-            ret, buffer = cv2.imencode('.jpg', frame)
-            frame = buffer.tobytes()
+        for frame in pipeline.stream():
             yield (b'--frame\r\n'
                    b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-            # Restore original frame delay
-            time.sleep(0.08)  # ~12 FPS
+        if pipeline.error:
+            log.error("Realtime stream stopped: %s", pipeline.error, extra={"stream": pipeline.stats()})
     finally:
+        _active_pipelines.discard(pipeline)
+        pipeline.stop()
         video.release()
 
 @app.route('/attendance_feed')
 def attendance_feed():
     return Response(gen_attendance_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/attendance_feed/stats')
+def attendance_feed_stats():
+    # Per-stage fps and tracker counters of every realtime stream currently open
+    return jsonify([p.stats() for p in list(_active_pipelines)])
+
+metrics.gauge("active_streams", "Realtime attendance streams open in this process",
+              lambda: len(_active_pipelines))
+metrics.gauge("notification_queue_depth", "Emails waiting to be sent (all workers)",
+              lambda: get_notifier().queue_depth())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Prometheus text format: stage latency histograms, face/frame/email counters, gauges
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/debug/metrics')
+def debug_metrics():
+    # The same figures as JSON with percentiles and rates, plus live component state
+    snapshot = metrics.snapshot()
+    notifier = get_notifier()
+    snapshot.update({
+        "streams": [p.stats() for p in list(_active_pipelines)],
+        "notifier": {**notifier.stats, "leader": notifier.leader},
+        "warm_up": warm_up_status(),
+    })
+    return jsonify(snapshot)
+
 @app.route("/take_attendance")
 def take_attendance():
     return render_template("take_attendance_realtime.html")
 
-import glob
-import pandas as pd
-
-import glob
-import pandas as pd
-
 @app.route("/see_attendance", methods=["GET"])
 def see_attendance():
-    import glob
-    import pandas as pd
-    files = sorted(glob.glob("Attendance/Attendance_*.csv"))
-    all_attendance = []
-    for f in files:
-        date = f.split("Attendance_")[1].split(".csv")[0]
-        try:
-            df = pd.read_csv(f)
-            for row in df.values.tolist():
-                # Add date to each record
-                if len(row) == 4:
-                    all_attendance.append([date] + row)
-        except Exception:
-            continue
-    return render_template("see_attendance_calendar.html", attendance=all_attendance)
+    # The page loads its month summary and day records from the JSON API
+    return render_template("see_attendance_calendar.html")
+
+@app.route("/api/attendance")
+def api_attendance():
+    # Filtered, cursor-paginated history: ?start=&end=&standard=&roll=&cursor=&limit=
+    args = request.args
+    try:
+        limit = min(max(int(args.get("limit", PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        records, next_cursor = attendance_page(
+            start=args.get("start") or None, end=args.get("end") or None,
+            standard=args.get("standard") or None, roll=args.get("roll") or None,
+            cursor=args.get("cursor") or None, limit=limit)
+    except ValueError as e:
+        return jsonify({"error": f"Bad query: {e}"}), 400
+    return jsonify({"records": records, "next_cursor": next_cursor})
+
+@app.route("/api/attendance/summary")
+def api_attendance_summary():
+    # Present count per day (and per standard) for calendar views
+    args = request.args
+    try:
+        days = daily_summaries(start=args.get("start") or None, end=args.get("end") or None,
+                               standard=args.get("standard") or None)
+    except ValueError as e:
+        return jsonify({"error": f"Bad query: {e}"}), 400
+    roster = get_roster()
+    roster.refresh()
+    enrolled = {std: len(students) for std, students in roster.by_standard.items()}
+    return jsonify({"days": days, "enrolled": enrolled})
 
 
 # See Students main page
 @app.route("/see_students")
 def see_students():
-    import pandas as pd
-    student_file = "data/students.csv"
     students_by_standard = {str(i): [] for i in range(1, 11)}
-    if os.path.exists(student_file):
-        df = pd.read_csv(student_file)
-        for _, row in df.iterrows():
-            # Skip rows missing 'standard' (e.g., empty or header-only)
-            if 'standard' in row and not pd.isna(row['standard']):
-                students_by_standard[str(row['standard'])].append(row)
+    roster = get_roster()
+    for key in students_by_standard:
+        students_by_standard[key] = roster.standard(key)
     return render_template("see_students.html", students_by_standard=students_by_standard)
 
 
 # Dynamic route for each standard
 def send_absent_sms(absent_students, selected_date):
-    # Email sending for absentees using Gmail SMTP
-    # Set your Gmail credentials here
-    GMAIL_USER = 'nusumadithya13@gmail.com'
-    GMAIL_PASS = 'wymnrmhgnvflvagg'
-    results = []
-    for s in absent_students:
-        email = str(s.get('parent_email', ''))
-        name = s['full_name']
-        standard = s['standard']
-        message_body = f"Your ward '{name}' of standard '{standard}' was absent to school today ({selected_date})."
-        if email:
-            try:
-                msg = MIMEMultipart()
-                msg['From'] = GMAIL_USER
-                msg['To'] = email
-                msg['Subject'] = 'School Absence Notification'
-                msg.attach(MIMEText(message_body, 'plain'))
-                server = smtplib.SMTP('smtp.gmail.com', 587)
-                server.starttls()
-                server.login(GMAIL_USER, GMAIL_PASS)
-                server.sendmail(GMAIL_USER, email, msg.as_string())
-                server.quit()
-                results.append((email, True, None))
-            except Exception as e:
-                results.append((email, False, str(e)))
-        else:
-            results.append((email, False, 'No email provided'))
-    return results
+    # Emails absentees' parents in the background over pooled SMTP sessions;
+    # returns the job so callers can report its id instead of waiting
+    return send_absent_notifications(absent_students, selected_date)
+
+@app.route("/notifications/jobs/<job_id>")
+def notification_job_status(job_id):
+    job = get_bulk_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
+
+@app.route("/api/analytics/at_risk")
+def api_at_risk():
+    # Students whose 30-day attendance rate is under ?threshold= (default ANALYTICS_AT_RISK);
+    # reads student_stats as the worker's rollup job left it
+    try:
+        threshold = float(request.args.get("threshold", AT_RISK_THRESHOLD))
+    except ValueError:
+        return jsonify({"error": "Bad threshold"}), 400
+    students = at_risk(threshold, standard=request.args.get("standard") or None)
+    return jsonify({"threshold": threshold, "students": students})
+
+@app.route("/api/analytics/student/<roll>")
+def api_student_stats(roll):
+    stats = student_stats(roll)
+    if stats is None:
+        return jsonify({"error": "Unknown student"}), 404
+    return jsonify(stats)
 
 @app.route("/students/standard<int:std>", methods=["GET", "POST"])
 def students_by_standard(std):
-    import pandas as pd
-    from flask import request
-    student_file = "data/students.csv"
-    attendance_file = None
-    students = []
-    present_rolls = set()
-    absent_rolls = set()
-    total_students = 0
-    total_present = 0
-    total_absent = 0
-    # Get selected date from query param
     # Support GET for attendance view, POST for sending SMS
     if request.method == "POST" and request.form.get("send_sms"):
         selected_date = request.form.get('date')
@@ -571,109 +588,100 @@ def students_by_standard(std):
     else:
         selected_date = request.args.get('date')
         send_sms_triggered = False
-    from datetime import datetime
-    import time
     today_str = datetime.now().strftime("%Y-%m-%d")
-    if not selected_date:
-        selected_date = datetime.fromtimestamp(time.time()).strftime("%d-%m-%Y")
-    if os.path.exists(student_file):
-        df = pd.read_csv(student_file, dtype=str)
-        students = [row for _, row in df.iterrows() if str(row['standard']) == str(std)]
-        total_students = len(students)
-    attendance_file = f"Attendance/Attendance_{selected_date}.csv"
-    attendance_times = {}  # roll_number -> time
-    if os.path.exists(attendance_file):
-        import csv
-        with open(attendance_file, 'r') as f:
-            reader = csv.reader(f)
-            header = next(reader, None)
-            for row in reader:
-                if len(row) >= 4:
-                    attendance_times[str(row[0])] = row[3]
-    present_rolls = set(attendance_times.keys())
-    absent_rolls = set([s['roll_number'] for s in students if s['roll_number'] not in present_rolls])
-    total_present = len(present_rolls & set([s['roll_number'] for s in students]))
-    total_absent = len(absent_rolls)
+    try:
+        # The date picker sends YYYY-MM-DD; the rest of the app uses dd-mm-YYYY
+        selected_date = from_iso(to_iso(selected_date))
+    except (TypeError, ValueError):
+        selected_date = datetime.now().strftime("%d-%m-%Y")
+    report = get_reports().report(std, selected_date)
+    students = report.students
+    present = report.present[:, 0]
+    absent_students = [s for s, here in zip(students, present) if not here]
     # Send SMS only if triggered by button
-    sms_sent = False
-    absent_students = [s for s in students if s['roll_number'] in absent_rolls]
-    sms_results = None
-    if send_sms_triggered and absent_students:
-        sms_results = send_absent_sms(absent_students, selected_date)
-        sms_sent = True
+    if send_sms_triggered:
+        # Don't hold the request open while emails go out; the page polls the job
+        try:
+            job = send_absent_sms(absent_students, selected_date)
+        except SMTPNotConfigured as e:
+            return jsonify({"error": str(e)}), 503
+        return jsonify({"job_id": job.id, "status_url": url_for("notification_job_status", job_id=job.id)}), 202
+    totals = report.totals()
     return render_template(
         "students_standard.html",
         standard=std,
         students=students,
-        total_students=total_students,
-        total_present=total_present,
-        total_absent=total_absent,
-        present_rolls=present_rolls,
-        absent_rolls=absent_rolls,
+        total_students=totals["students"],
+        total_present=totals["present"],
+        total_absent=totals["absent"],
+        total_late=totals["late"],
+        present_rolls={s["roll_number"] for s, here in zip(students, present) if here},
+        absent_rolls={s["roll_number"] for s in absent_students},
         selected_date=selected_date,
-        sms_sent=sms_sent,
-        sms_results=sms_results,
-        attendance_times=attendance_times,
+        selected_iso=report.start,
+        attendance_times=report.times(selected_date),
         today_str=today_str
     )
 
-def students_by_standard(std):
-    import pandas as pd
-    from flask import request
-    student_file = "data/students.csv"
-    attendance_file = None
-    students = []
-    present_rolls = set()
-    absent_rolls = set()
-    total_students = 0
-    total_present = 0
-    total_absent = 0
-    # Get selected date from query param
-    # Support GET for attendance view, POST for sending SMS
-    if request.method == "POST" and request.form.get("send_sms"):
-        selected_date = request.form.get('date')
-        send_sms_triggered = True
-    else:
-        selected_date = request.args.get('date')
-        send_sms_triggered = False
-    if not selected_date:
-        import time
-        from datetime import datetime
-        selected_date = datetime.fromtimestamp(time.time()).strftime("%d-%m-%Y")
-    if os.path.exists(student_file):
-        df = pd.read_csv(student_file)
-        students = [row for _, row in df.iterrows() if str(row['standard']) == str(std)]
-        total_students = len(students)
-    attendance_file = f"Attendance/Attendance_{selected_date}.csv"
-    if os.path.exists(attendance_file):
-        try:
-            adf = pd.read_csv(attendance_file)
-        except Exception:
-            import csv
-            with open(attendance_file, 'r') as f:
-                reader = csv.reader(f)
-                rows = list(reader)
-            present_rolls = set()
-            for row in rows:
-                if len(row) == 4:
-                    present_rolls.add(row[0])
-                elif len(row) == 2:
-                    present_rolls.update([s['roll_number'] for s in students if s['full_name'] == row[0]])
-        else:
-            if 'ROLL' in adf.columns:
-                present_rolls = set(adf['ROLL'].tolist())
-            elif 'NAME' in adf.columns:
-                present_rolls = set([s['roll_number'] for s in students if s['full_name'] in adf['NAME'].tolist()])
-    absent_rolls = set([s['roll_number'] for s in students if s['roll_number'] not in present_rolls])
-    total_present = len(present_rolls & set([s['roll_number'] for s in students]))
-    total_absent = len(absent_rolls)
-    # Send SMS only if triggered by button
-    sms_sent = False
-    absent_students = [s for s in students if s['roll_number'] in absent_rolls]
-    if send_sms_triggered and absent_students:
-        send_absent_sms(absent_students, selected_date)
-        sms_sent = True
-    return render_template("students_standard.html", standard=std, students=students, total_students=total_students, total_present=total_present, total_absent=total_absent, present_rolls=present_rolls, absent_rolls=absent_rolls, selected_date=selected_date, sms_sent=sms_sent)
+@app.route("/students/standard<int:std>/report")
+def standard_report(std):
+    # Present/absent/late/rate per student and per school day:
+    # ?start=&end= (default today), &format=json|csv
+    start = request.args.get("start") or datetime.now().strftime("%d-%m-%Y")
+    end = request.args.get("end") or start
+    try:
+        report = get_reports().report(std, start, end)
+    except ValueError as e:
+        return jsonify({"error": f"Bad date: {e}"}), 400
+    if request.args.get("format") == "csv":
+        filename = f"standard{std}_{report.start}_{report.end}.csv"
+        return Response(report_csv(report), mimetype="text/csv",
+                        headers={"Content-Disposition": f"attachment; filename={filename}"})
+    return jsonify(report.to_dict())
+
+def create_app():
+    """WSGI entry point for multi-worker servers (see wsgi.py).
+
+    Loads the face gallery, its matcher and the roster in the calling
+    (master) process so that forked workers share those pages copy-on-write
+    instead of each loading a private copy. Nothing here starts a thread,
+    which would not survive the fork. With ``FACE_WARMUP=preload`` the dlib
+    models are loaded here too; otherwise each worker warms up in the
+    background once it serves (gunicorn.conf.py).
+    """
+    if WARMUP == "preload":
+        warm_up(WARM_MODULES)
+    gallery = get_gallery()
+    try:
+        gallery.refresh()
+        gallery.matcher()
+    except Exception as e:
+        log.warning("Gallery preload failed: %s", e)
+    get_roster()
+    # Keep the garbage collector from touching (and so copying) preloaded objects
+    gc.freeze()
+    return app
+
+def start_worker_jobs():
+    """Start one serving process's background threads.
+
+    Called after the fork by gunicorn's ``post_worker_init`` and by the
+    development server: dlib warm-up, the attendance rollup job (the
+    analytics endpoints only read what it maintains) and, with
+    ``FACE_MATCH_INDEX=ivf``, training missing IVF centroids.
+    """
+    start_warm_up(WARM_MODULES)
+    start_rollup_job()
+    try:
+        train_missing_index()
+    except Exception as e:
+        log.warning("IVF training not started: %s", e)
 
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0")
+    # Development server; use `gunicorn -c gunicorn.conf.py wsgi:app` in production
+    debug = os.environ.get("FLASK_DEBUG", "1") == "1"
+    # With the reloader only the child process serves, so only it warms up
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_worker_jobs()
+    app.run(debug=debug, host=os.environ.get("HOST", "0.0.0.0"),
+            port=int(os.environ.get("PORT", "5000")))
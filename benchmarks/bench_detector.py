@@ -0,0 +1,83 @@
+"""Detection latency and recall of the cascaded detector on a sample clip.
+
+Every configuration is compared with full-resolution HOG on every frame,
+which is taken as ground truth. Recall is the fraction of those boxes found
+with IoU >= 0.3. Needs ``face_recognition`` (dlib) for the HOG/CNN rows and
+an OpenCV build with ``CascadeClassifier`` for the Haar rows.
+
+Usage: python benchmarks/bench_detector.py --clip classroom.mp4 [--frames 300]
+       (``--clip`` may also be a directory of images)
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from camera import FileSource  # noqa: E402
+from detector import FaceDetector  # noqa: E402
+from tracker import iou  # noqa: E402
+
+CONFIGS = [
+    ("none", "hog", 1.0),
+    ("haar", "hog", 0.5),
+    ("haar", "hog", 0.25),
+    ("motion", "hog", 0.5),
+    ("haar", "haar", 0.5),
+]
+
+
+def load_clip(path, frames, size):
+    source = FileSource(path, fps=0, loop=False)
+    clip = []
+    while len(clip) < frames:
+        ok, frame = source.read()
+        if not ok:
+            break
+        if size and (frame.shape[1], frame.shape[0]) != size:
+            frame = cv2.resize(frame, size)
+        clip.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    source.release()
+    return clip
+
+
+def recall(truth, found, threshold=0.3):
+    hits = total = 0
+    for expected, got in zip(truth, found):
+        total += len(expected)
+        hits += sum(1 for box in expected if any(iou(box, g) >= threshold for g in got))
+    return hits / total if total else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clip", required=True)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--width", type=int, default=480)
+    parser.add_argument("--height", type=int, default=360)
+    args = parser.parse_args()
+
+    clip = load_clip(args.clip, args.frames, (args.width, args.height))
+    if not clip:
+        sys.exit(f"No frames could be read from {args.clip}")
+    print(f"{len(clip)} frames at {args.width}x{args.height}")
+    print(f"{'prefilter':>9} {'model':>6} {'scale':>6} {'ms/frame':>9} {'speedup':>8} {'skipped':>8} {'recall':>7}")
+    truth, base_ms = None, None
+    for prefilter, model, scale in CONFIGS:
+        detector = FaceDetector(model=model, prefilter=prefilter, scale=scale)
+        if (detector.prefilter, detector.model) != (prefilter, model):
+            print(f"{prefilter:>9} {model:>6} {scale:>6} (unavailable in this OpenCV build)")
+            continue
+        start = time.perf_counter()
+        found = [detector(frame) for frame in clip]
+        ms = (time.perf_counter() - start) * 1000.0 / len(clip)
+        if truth is None:
+            truth, base_ms = found, ms
+        print(f"{prefilter:>9} {model:>6} {scale:>6} {ms:>9.2f} {base_ms / ms:>7.1f}x "
+              f"{detector.skipped:>8} {recall(truth, found):>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
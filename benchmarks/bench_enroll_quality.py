@@ -0,0 +1,98 @@
+"""Webcam enrollment: first 20 frames vs quality-scored diverse selection.
+
+old:  add_faces.py stored the first 20 encodings it saw
+new:  ``--candidates`` frames are scored, low-quality ones dropped and at
+      most ``ENROLL_SAMPLES`` kept by farthest-point selection
+
+Each student's capture is a slow head turn: consecutive frames move a
+little along the student's pose direction, so neighbours are
+near-duplicates. Every ``--blur-every``-th frame is blurred: much noisier,
+with a low quality score. Probes are fresh captures at any point of the
+turn. The printout shows gallery rows, rank-1 accuracy, the share of probes
+left unknown or given to the wrong student, and the match time.
+
+Usage: python benchmarks/bench_enroll_quality.py [--students 500] [--candidates 40]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from matcher import UNKNOWN, ExhaustiveMatcher  # noqa: E402
+from quality import ENROLL_SAMPLES, MIN_QUALITY, select_diverse  # noqa: E402
+
+
+def captures(students, frames, blur_every, dim=128, seed=0):
+    """``(centres, poses, encodings, qualities)``; encodings are students x frames x dim."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(0, 0.1, (students, dim))
+    poses = rng.normal(0, 1, (students, dim))
+    poses *= 0.35 / np.linalg.norm(poses, axis=1, keepdims=True)
+    # Head turn from -1 (left) to +1 (right) over the capture
+    turn = np.linspace(-1, 1, frames)
+    encodings = centres[:, None] + turn[None, :, None] * poses[:, None] + rng.normal(0, 0.02, (students, frames, dim))
+    qualities = rng.uniform(0.6, 0.95, (students, frames)) * (1 - 0.3 * np.abs(turn))
+    blurred = np.zeros(frames, dtype=bool)
+    blurred[blur_every - 1::blur_every] = True
+    encodings[:, blurred] += rng.normal(0, 0.05, (students, blurred.sum(), dim))
+    qualities[:, blurred] = rng.uniform(0.1, 0.3, (students, blurred.sum()))
+    return centres, poses, encodings.astype(np.float32), qualities
+
+
+def evaluate(encodings, rolls, probes, expected, repeat=3):
+    matcher = ExhaustiveMatcher(encodings, rolls)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        got = np.array([m.roll for m in matcher.match(probes)], dtype=object)
+        best = min(best, time.perf_counter() - start)
+    return {"rows": len(rolls), "accuracy": float(np.mean(got == expected)),
+            "unknown": float(np.mean(got == UNKNOWN)),
+            "wrong": float(np.mean((got != expected) & (got != UNKNOWN))), "ms": best * 1000.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--candidates", type=int, default=40)
+    parser.add_argument("--blur-every", type=int, default=4)
+    parser.add_argument("--probes", type=int, default=4000)
+    args = parser.parse_args()
+
+    centres, poses, encodings, qualities = captures(args.students, args.candidates, args.blur_every)
+    student_rolls = np.array([str(20250000 + i) for i in range(args.students)], dtype=object)
+
+    rng = np.random.default_rng(1)
+    labels = rng.integers(0, args.students, args.probes)
+    probes = (centres[labels] + rng.uniform(-1, 1, (args.probes, 1)) * poses[labels]
+              + rng.normal(0, 0.02, (args.probes, centres.shape[1]))).astype(np.float32)
+    expected = student_rolls[labels]
+
+    old = encodings[:, :20].reshape(-1, encodings.shape[2])
+    old_rolls = np.repeat(student_rolls, min(20, args.candidates))
+
+    start = time.perf_counter()
+    kept, kept_rolls = [], []
+    for s in range(args.students):
+        good = np.flatnonzero(qualities[s] >= MIN_QUALITY)
+        chosen = good[select_diverse(encodings[s, good], qualities[s, good], ENROLL_SAMPLES)]
+        kept.append(encodings[s, chosen])
+        kept_rolls.extend([student_rolls[s]] * len(chosen))
+    select_ms = (time.perf_counter() - start) * 1000.0 / args.students
+    new = np.vstack(kept)
+
+    print(f"{args.students} students, {args.candidates} candidate frames each, {args.probes} probes "
+          f"(selection {select_ms:.2f} ms per student)")
+    print(f"{'':>26} {'rows':>7} {'accuracy':>9} {'unknown':>8} {'wrong':>7} {'match ms':>9}")
+    for label, rows, rolls in (("old: first 20 frames", old, old_rolls),
+                               (f"new: scored, <= {ENROLL_SAMPLES} diverse", new, kept_rolls)):
+        r = evaluate(rows, rolls, probes, expected)
+        print(f"{label:>26} {r['rows']:>7} {r['accuracy']:>9.3f} {r['unknown']:>8.3f} {r['wrong']:>7.3f} "
+              f"{r['ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
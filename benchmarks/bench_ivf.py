@@ -0,0 +1,57 @@
+"""Recall@1 and latency of the IVF index against exhaustive search.
+
+Usage: python benchmarks/bench_ivf.py [--sizes 50000 200000] [--nprobe 1 4 8 16]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ivf import IVFMatcher  # noqa: E402
+from matcher import ExhaustiveMatcher  # noqa: E402
+from synthetic import synthetic_gallery, synthetic_probes  # noqa: E402
+
+
+def run(matcher, probes, batch):
+    rolls = []
+    start = time.perf_counter()
+    for i in range(0, len(probes), batch):
+        rolls.extend(m.roll for m in matcher.match(probes[i:i + batch]))
+    return np.array(rolls, dtype=object), (time.perf_counter() - start) / len(probes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50000, 200000])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--probes", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{'gallery':>8} {'index':>10} {'build s':>8} {'us/face':>9} {'speedup':>8} {'recall@1':>9}")
+    for n in args.sizes:
+        encodings, rolls, centres = synthetic_gallery(n)
+        probes, _ = synthetic_probes(centres, args.probes)
+        exhaustive = ExhaustiveMatcher(encodings, rolls)
+        base, base_t = run(exhaustive, probes, args.batch)
+        print(f"{n:>8} {'exhaustive':>10} {'':>8} {base_t * 1e6:>9.1f} {1.0:>7.1f}x {1.0:>9.3f}")
+
+        # Train on 90% of the gallery and insert the rest incrementally,
+        # the way enrollments arrive after the index is built
+        split = int(n * 0.9)
+        start = time.perf_counter()
+        ivf = IVFMatcher(encodings[:split], rolls[:split])
+        ivf.add(encodings[split:], rolls[split:])
+        build = time.perf_counter() - start
+        for nprobe in args.nprobe:
+            ivf.nprobe = nprobe
+            got, t = run(ivf, probes, args.batch)
+            print(f"{n:>8} {f'ivf/{nprobe}':>10} {build:>8.1f} {t * 1e6:>9.1f} "
+                  f"{base_t / t:>7.1f}x {np.mean(got == base):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
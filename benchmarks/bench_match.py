@@ -0,0 +1,53 @@
+"""Micro-benchmark: per-probe compare_faces loop vs. the batched matcher.
+
+Usage: python benchmarks/bench_match.py [--probes 4] [--sizes 1000 10000 100000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from matcher import TOLERANCE, ExhaustiveMatcher  # noqa: E402
+from synthetic import synthetic_gallery, synthetic_probes  # noqa: E402
+
+
+def compare_faces_loop(encodings, rolls, probes):
+    # Same arithmetic as face_recognition.compare_faces + matches.index(True)
+    out = []
+    for probe in probes:
+        matches = list(np.linalg.norm(encodings - probe, axis=1) <= TOLERANCE)
+        out.append(str(rolls[matches.index(True)]) if True in matches else "Unknown")
+    return out
+
+
+def timeit(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--probes", type=int, default=4, help="faces per frame")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'gallery':>8} {'loop ms':>10} {'batched ms':>11} {'speedup':>8}")
+    for n in args.sizes:
+        encodings, rolls, centres = synthetic_gallery(n)
+        probes, _ = synthetic_probes(centres, args.probes)
+        matcher = ExhaustiveMatcher(encodings, rolls)
+        loop = timeit(lambda: compare_faces_loop(encodings, rolls, probes), args.repeat)
+        batched = timeit(lambda: matcher.match(probes), args.repeat)
+        print(f"{n:>8} {loop * 1e3:>10.2f} {batched * 1e3:>11.2f} {loop / batched:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
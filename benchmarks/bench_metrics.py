@@ -0,0 +1,118 @@
+"""Cost of the hot-path instrumentation against the frame time.
+
+Measures one stage timer, one counter increment and ``count_faces``, both
+alone and with several threads recording at once (the capture, recognise
+and stream threads plus request handlers contend for the same locks). The
+contended figure is CPU time per call: wall time over all calls.
+
+It then adds up the instrumentation of one realtime frame:
+
+- typical: 3 timers (recognise, detect, jpeg) and 3 counters (captured,
+  recognized, streamed);
+- worst case: 7 timers (plus encode, match, ledger and notify when a new
+  face is marked), 5 counters (plus dropped) and ``count_faces``.
+
+Each is compared with two frame times. One is ``--frame-ms``, by default a
+measured BGR->RGB conversion plus JPEG encode at 480x360. That is a lower
+bound that leaves out detection; HOG alone takes tens of ms. The other is
+the stream's frame interval at ``STREAM_MAX_FPS``. Also times ``render()``
+and ``snapshot()`` with every stage series filled in.
+
+Usage: python benchmarks/bench_metrics.py [--calls 200000] [--threads 4] [--frame-ms 0]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import metrics  # noqa: E402
+from matcher import Match  # noqa: E402
+from pipeline import STREAM_MAX_FPS  # noqa: E402
+
+# (timers, counters, count_faces calls) recorded for one realtime frame
+FRAME_COSTS = {"typical": (3, 3, 0), "worst case": (7, 5, 1)}
+
+
+def per_call(fn, calls, threads=1):
+    """Mean wall-clock seconds per ``fn()`` when ``threads`` threads each call it ``calls`` times."""
+    barrier = threading.Barrier(threads + 1)
+
+    def run():
+        barrier.wait()
+        for _ in range(calls):
+            fn()
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) / calls
+
+
+def timer():
+    with metrics.timed("bench", "stage"):
+        pass
+
+
+def frame_ms():
+    """BGR->RGB plus JPEG encode of a 480x360 frame, in ms (best of 50)."""
+    import cv2
+    frame = np.random.default_rng(0).integers(0, 255, (360, 480, 3), dtype=np.uint8)
+    best = float("inf")
+    for _ in range(50):
+        start = time.perf_counter()
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--frame-ms", type=float, default=0.0, help="frame time to compare with (0: measure)")
+    args = parser.parse_args()
+
+    counter = metrics.FRAMES.labels("bench")
+    matches = [Match("1", 0.3, 0.2), Match("Unknown", 0.7, 0.0)]
+    results = {}
+    print(f"{'':>14} {'1 thread us':>12} {f'{args.threads} threads us':>14}")
+    for label, fn in (("timer", timer), ("counter", counter.inc),
+                      ("count_faces", lambda: metrics.count_faces("bench", matches))):
+        single = per_call(fn, args.calls) * 1e6
+        # Threads take turns on the GIL, so wall time over all calls is the CPU cost of one
+        contended = per_call(fn, args.calls // args.threads, args.threads) * 1e6 / args.threads
+        results[label] = max(single, contended)
+        print(f"{label:>14} {single:>12.3f} {contended:>14.3f}")
+
+    reference = args.frame_ms or frame_ms()
+    interval = 1000.0 / STREAM_MAX_FPS
+    print(f"\n{'per frame':>14} {'us':>8} {f'% of {reference:.2f} ms':>14} {f'% of {interval:.1f} ms':>14}")
+    for label, (timers, counters, faces) in FRAME_COSTS.items():
+        us = timers * results["timer"] + counters * results["counter"] + faces * results["count_faces"]
+        print(f"{label:>14} {us:>8.1f} {us / (reference * 10.0):>14.3f} {us / (interval * 10.0):>14.3f}")
+    print(f"({'given frame time' if args.frame_ms else 'cvtColor + JPEG encode only'}; "
+          f"{STREAM_MAX_FPS} fps stream interval; budget 1%)\n")
+
+    for path in ("api", "batch", "stream", "notifier", "bulk_email"):
+        for stage in ("decode", "detect", "encode", "match", "ledger", "notify", "jpeg", "send"):
+            for value in (0.0007, 0.003, 0.02, 0.2):
+                metrics.STAGE_SECONDS.labels(path, stage).observe(value)
+    for label, fn in (("render()", metrics.render), ("snapshot()", metrics.snapshot)):
+        start = time.perf_counter()
+        for _ in range(20):
+            fn()
+        print(f"{label:>14} {(time.perf_counter() - start) / 20 * 1000:.2f} ms per scrape "
+              f"({len(metrics.render().splitlines())} lines)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Accuracy/latency of the prototype index against exhaustive matching.
+
+Usage: python benchmarks/bench_prototypes.py [--students 500 2000 5000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from matcher import ExhaustiveMatcher  # noqa: E402
+from prototypes import PrototypeMatcher, build_prototypes  # noqa: E402
+from synthetic import synthetic_gallery, synthetic_probes  # noqa: E402
+
+
+def run(matcher, probes, batch):
+    rolls = []
+    start = time.perf_counter()
+    for i in range(0, len(probes), batch):
+        rolls.extend(m.roll for m in matcher.match(probes[i:i + batch]))
+    per_face = (time.perf_counter() - start) / len(probes)
+    return np.array(rolls, dtype=object), per_face
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, nargs="+", default=[500, 2000, 5000])
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--probes", type=int, default=400)
+    parser.add_argument("--batch", type=int, default=4, help="faces per frame")
+    args = parser.parse_args()
+
+    print(f"{'students':>8} {'index':>14} {'us/face':>9} {'speedup':>8} {'acc':>6} {'agree':>6}")
+    for students in args.students:
+        encodings, rolls, centres = synthetic_gallery(students * args.samples, args.samples)
+        probes, expected = synthetic_probes(centres, args.probes)
+        exhaustive = ExhaustiveMatcher(encodings, rolls)
+        base, base_t = run(exhaustive, probes, args.batch)
+        rows = [("exhaustive", base, base_t)]
+        for method, k in (("mean", 1), ("kmedoids", 3)):
+            protos = build_prototypes(encodings, rolls, k, method)
+            got, t = run(PrototypeMatcher(encodings, rolls, *protos), probes, args.batch)
+            rows.append((f"{method}x{k}", got, t))
+        for name, got, t in rows:
+            print(f"{students:>8} {name:>14} {t * 1e6:>9.1f} {base_t / t:>7.1f}x "
+                  f"{np.mean(got == expected):>6.3f} {np.mean(got == base):>6.3f}")
+
+
+if __name__ == "__main__":
+    main()
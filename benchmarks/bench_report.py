@@ -0,0 +1,119 @@
+"""Per-standard term report: the old per-day CSV loop vs the report engine.
+
+old:  what ``students_by_standard`` did for one day (pandas read of
+      students.csv, ``iterrows()`` filter, read of the day's CSV, set
+      building), repeated for every day of the term. It takes about a
+      third of a second per day, so it is timed on ``--old-days`` days and
+      scaled up
+new:  ``ReportEngine.report`` over the whole range, cold (empty cache) and
+      warm (every day cached; only the daily_summary check runs)
+
+Data is synthetic: one standard of ``--students`` students (plus the rest of
+the school in other standards) with ``--days`` school days at ~90%
+attendance, written to a temporary database and CSV directory.
+
+Usage: python benchmarks/bench_report.py [--students 1000] [--days 200]
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db import get_db, transaction  # noqa: E402
+from roster import FIELDS, Roster  # noqa: E402
+from report import ReportEngine  # noqa: E402
+
+
+def build(tmp, students, days, other=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    db_path = os.path.join(tmp, "attendance.db")
+    conn = get_db(db_path)
+    school_days = [date(2025, 6, 2) + timedelta(days=i) for i in range(days)]
+    rows = [{"roll_number": str(20250000 + i), "full_name": f"student {i}", "dob": "", "parent_mobile": "",
+             "parent_email": "", "standard": "1" if i < students else str(2 + i % 9), "year_joined": "2025"}
+            for i in range(students + other)]
+    with transaction(conn):
+        conn.executemany(f"INSERT INTO students ({', '.join(FIELDS)}) VALUES "
+                         f"({', '.join(':' + k for k in FIELDS)})", rows)
+        for day in school_days:
+            here = rng.random(len(rows)) < 0.9
+            minutes = rng.integers(8 * 60, 9 * 60 + 30, len(rows))
+            day_rows = [(r["roll_number"], day.isoformat(), r["full_name"], r["standard"],
+                         f"{m // 60:02d}:{m % 60:02d}:00") for r, ok, m in zip(rows, here, minutes) if ok]
+            conn.executemany("INSERT INTO attendance (roll_number, date, name, standard, time) "
+                             "VALUES (?, ?, ?, ?, ?)", day_rows)
+            with open(os.path.join(tmp, f"Attendance_{day.strftime('%d-%m-%Y')}.csv"), "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["ROLL", "NAME", "STANDARD", "TIME"])
+                writer.writerows([r[0], r[2], r[3], r[4]] for r in day_rows)
+    pd.DataFrame(rows, columns=FIELDS).to_csv(os.path.join(tmp, "students.csv"), index=False)
+    return db_path, school_days
+
+
+def old_report(tmp, std, school_days):
+    totals = {"present": 0, "absent": 0}
+    for day in school_days:
+        df = pd.read_csv(os.path.join(tmp, "students.csv"), dtype=str)
+        students = [row for _, row in df.iterrows() if str(row['standard']) == str(std)]
+        adf = pd.read_csv(os.path.join(tmp, f"Attendance_{day.strftime('%d-%m-%Y')}.csv"), dtype=str)
+        present_rolls = set(adf['ROLL'].tolist())
+        absent_rolls = set([s['roll_number'] for s in students if s['roll_number'] not in present_rolls])
+        totals["present"] += len(present_rolls & set([s['roll_number'] for s in students]))
+        totals["absent"] += len(absent_rolls)
+    return totals
+
+
+def timed(fn, repeat):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=200)
+    parser.add_argument("--old-days", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # A new database imports data/ from the working directory; start empty
+        os.chdir(tmp)
+        db_path, school_days = build(tmp, args.students, args.days)
+        start, end = school_days[0].isoformat(), school_days[-1].isoformat()
+
+        sample = school_days[:args.old_days]
+        old_ms, old = timed(lambda: old_report(tmp, 1, sample), 1)
+        old_ms *= len(school_days) / len(sample)
+
+        def cold():
+            return ReportEngine(db_path, roster=Roster(db_path)).report(1, start, end)
+        cold_ms, report = timed(cold, args.repeat)
+        engine = ReportEngine(db_path, roster=Roster(db_path))
+        engine.report(1, start, end)
+        warm_ms, _ = timed(lambda: engine.report(1, start, end), args.repeat)
+        export_ms, _ = timed(lambda: engine.report(1, start, end).to_dict(), args.repeat)
+
+        totals = report.totals()
+        sampled = engine.report(1, start, sample[-1].isoformat()).totals()
+        assert (sampled["present"], sampled["absent"]) == (old["present"], old["absent"])
+        print(f"{args.students} students x {args.days} days (rate {totals['rate']:.3f}, late {totals['late']})")
+        print(f"{'old per-day loop':>22} {old_ms:>10.1f} ms (scaled from {len(sample)} days)")
+        print(f"{'engine, cold cache':>22} {cold_ms:>10.1f} ms")
+        print(f"{'engine, warm cache':>22} {warm_ms:>10.1f} ms")
+        print(f"{'warm + JSON export':>22} {export_ms:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
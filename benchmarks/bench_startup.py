@@ -0,0 +1,125 @@
+"""Process startup: eager imports (the old app.py) vs lazy imports.
+
+Each configuration runs in a fresh interpreter:
+
+eager:  cv2, face_recognition, numpy and PIL imported before app, as the
+        module-top imports used to do
+lazy:   ``import app`` alone; the recognition stack loads on first use
+warm:   lazy, then the background warm-up run to completion (what a worker
+        holds a few seconds after it starts serving)
+viewer: the repo modules the Streamlit see.py viewer imports (ledger)
+
+For each it reports import time, resident memory afterwards and which heavy
+modules got loaded. It then starts the development server (without the
+reloader) both ways and measures the time from spawning the process to the
+first response to ``/``. Runs in a temporary directory, so a fresh, empty
+database is used. face_recognition is skipped if it is not installed.
+
+Usage: python benchmarks/bench_startup.py [--repeat 3]
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("cv2", "face_recognition", "dlib", "numpy", "PIL.Image", "pandas")
+EAGER = ("import importlib\n"
+         "for name in ('cv2', 'face_recognition', 'numpy', 'PIL.Image'):\n"
+         "    try:\n"
+         "        importlib.import_module(name)\n"
+         "    except ImportError:\n"
+         "        pass\n")
+
+PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+{prelude}
+{body}
+elapsed = time.perf_counter() - start
+rss = None
+try:
+    with open("/proc/self/status") as f:
+        rss = next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS"))
+except OSError:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+print(json.dumps({{"ms": elapsed * 1000.0, "rss": rss, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+CONFIGS = {
+    "eager": (EAGER, "import app"),
+    "lazy": ("", "import app"),
+    "warm": ("", "import app, lazy\nlazy.warm_up(app.WARM_MODULES)"),
+    "viewer": ("", "import ledger"),
+}
+
+
+def child_env(**extra):
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""), FACE_WARMUP="off")
+    env.update(extra)
+    return env
+
+
+def probe(tmp, prelude, body):
+    code = PROBE.format(prelude=prelude, body=body, heavy=HEAVY)
+    out = subprocess.run([sys.executable, "-c", code], cwd=tmp, env=child_env(), capture_output=True, text=True,
+                         check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def first_response(tmp, prelude, timeout=120.0):
+    """Seconds from spawning the dev server to its first answer on ``/``."""
+    port = free_port()
+    code = f"{prelude}\nfrom app import app\napp.run(host='127.0.0.1', port={port}, debug=False)\n"
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-c", code], cwd=tmp, env=child_env(),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1.0)
+                return time.perf_counter() - start
+            except urllib.error.HTTPError:
+                return time.perf_counter() - start
+            except OSError:
+                if proc.poll() is not None:
+                    raise RuntimeError("server exited before answering")
+                time.sleep(0.005)
+        raise RuntimeError("server did not answer in time")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'':>8} {'import ms':>10} {'RSS MB':>8}  heavy modules loaded")
+        for label, (prelude, body) in CONFIGS.items():
+            runs = [probe(tmp, prelude, body) for _ in range(args.repeat)]
+            best = min(runs, key=lambda r: r["ms"])
+            print(f"{label:>8} {best['ms']:>10.0f} {best['rss'] / 2**20:>8.1f}  {', '.join(best['loaded']) or '-'}")
+        print()
+        for label in ("eager", "lazy"):
+            best = min(first_response(tmp, CONFIGS[label][0]) for _ in range(args.repeat))
+            print(f"{label:>8} first / response {best * 1000:>8.0f} ms after spawn")
+
+
+if __name__ == "__main__":
+    main()
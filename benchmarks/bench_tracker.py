@@ -0,0 +1,95 @@
+"""Encode calls and recognition cost with and without the face tracker.
+
+Simulates a classroom camera: students drift slowly across the frame,
+arrive and leave. Detection and encoding are stand-ins that sleep for the
+given per-call costs (defaults are typical dlib HOG / ResNet timings on a
+laptop CPU at 480x360), so the sustainable recognition fps of both loops can
+be compared without a camera or dlib.
+
+Usage: python benchmarks/bench_tracker.py [--faces 1 4 8] [--seconds 60]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from matcher import Match  # noqa: E402
+from tracker import FaceTracker  # noqa: E402
+
+
+class Scene:
+    """Boxes of ``faces`` students moving a few pixels per frame."""
+
+    def __init__(self, faces, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.pos = self.rng.uniform([40, 40], [400, 280], size=(faces, 2))
+        self.vel = self.rng.normal(0, 1.5, size=(faces, 2))
+        self.ids = list(range(faces))
+        self.next_id = faces
+
+    def step(self):
+        self.pos += self.vel
+        np.clip(self.pos, [40, 40], [400, 280], out=self.pos)
+        # Occasionally someone leaves and a new student steps in
+        if self.rng.random() < 0.01:
+            i = self.rng.integers(len(self.ids))
+            self.ids[i] = self.next_id
+            self.next_id += 1
+            self.pos[i] = self.rng.uniform([40, 40], [400, 280])
+
+    def boxes(self):
+        return [(int(y - 40), int(x + 40), int(y + 40), int(x - 40)) for x, y in self.pos]
+
+
+def simulate(faces, frames, detect_every, detect_cost, encode_cost):
+    scene = Scene(faces)
+    calls = {"detect": 0, "encode": 0}
+
+    def detect(_frame):
+        calls["detect"] += 1
+        return scene.boxes()
+
+    def identify(_frame, boxes):
+        calls["encode"] += len(boxes)
+        return [Match("r", 0.3, 0.2) for _ in boxes]
+
+    tracker = FaceTracker(detect, identify, detect_every=detect_every) if detect_every else None
+    for _ in range(frames):
+        scene.step()
+        if tracker:
+            tracker.update(None)
+        else:
+            identify(None, detect(None))
+    cost = calls["detect"] * detect_cost + calls["encode"] * encode_cost
+    return calls, cost
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--faces", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--seconds", type=int, default=60, help="simulated camera time")
+    parser.add_argument("--fps", type=int, default=15, help="frames offered to the recogniser")
+    parser.add_argument("--detect-every", type=int, default=5)
+    parser.add_argument("--detect-ms", type=float, default=60.0)
+    parser.add_argument("--encode-ms", type=float, default=15.0)
+    args = parser.parse_args()
+
+    frames = args.seconds * args.fps
+    minutes = args.seconds / 60.0
+    start = time.perf_counter()
+    print(f"{'faces':>5} {'loop':>8} {'detects':>8} {'encodes':>8} {'saved/min':>10} {'cpu fps':>8}")
+    for faces in args.faces:
+        base_calls, base_cost = simulate(faces, frames, 0, args.detect_ms, args.encode_ms)
+        calls, cost = simulate(faces, frames, args.detect_every, args.detect_ms, args.encode_ms)
+        for name, c, t in (("every", base_calls, base_cost), ("tracked", calls, cost)):
+            saved = (base_calls["encode"] - c["encode"]) / minutes
+            print(f"{faces:>5} {name:>8} {c['detect']:>8} {c['encode']:>8} {saved:>10.0f} "
+                  f"{frames / (t / 1000.0):>8.1f}")
+    print(f"(tracker bookkeeping for all runs: {time.perf_counter() - start:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
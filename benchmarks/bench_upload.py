@@ -0,0 +1,84 @@
+"""Bytes per request and server-side decode time of the camera upload paths.
+
+old: JSON ``{"image": data URL}``, then b64decode -> PIL -> np.array ->
+     cvtColor RGB->BGR -> cvtColor BGR->RGB (what api_mark_attendance did)
+new: raw ``image/jpeg`` body decoded straight to RGB, with large images
+     shrunk during decoding (``recognition.decode_image``)
+
+Images are synthetic (smooth gradients plus noise, so JPEG sizes are
+realistic) at webcam and phone resolutions.
+
+Usage: python benchmarks/bench_upload.py [--repeat 20]
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from recognition import decode_data_url, decode_image  # noqa: E402
+
+SIZES = [(640, 480), (1280, 720), (4032, 3024)]
+
+
+def synthetic_jpeg(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+    img = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(img).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def old_path(body):
+    image_data = json.loads(body)["image"]
+    img_bytes = base64.b64decode(image_data.split(",", 1)[1])
+    img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
+    frame = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+def new_path(body):
+    return decode_image(body)[0]
+
+
+def new_path_json(body):
+    return decode_image(decode_data_url(json.loads(body)["image"]))[0]
+
+
+def timed(fn, body, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn(body)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0, out.shape
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'image':>10} {'path':>9} {'bytes':>9} {'decode ms':>10} {'decoded':>12}")
+    for width, height in SIZES:
+        jpeg = synthetic_jpeg(width, height)
+        data_url = "data:image/jpeg;base64," + base64.b64encode(jpeg).decode()
+        json_body = json.dumps({"image": data_url}).encode()
+        for name, fn, body in (("old json", old_path, json_body),
+                               ("new json", new_path_json, json_body),
+                               ("new raw", new_path, jpeg)):
+            ms, shape = timed(fn, body, args.repeat)
+            print(f"{width}x{height:<5} {name:>9} {len(body):>9} {ms:>10.2f} {shape[1]:>6}x{shape[0]:<5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""Synthetic 128-d galleries shaped like face_recognition encodings.
+
+Samples of one student sit ~0.3 apart and different students ~1.6 apart,
+roughly the spread dlib encodings show with the 0.5 tolerance.
+"""
+import numpy as np
+
+
+def synthetic_gallery(n, samples_per_student=20, dim=128, seed=0):
+    """Return ``(encodings, rolls, centres)`` for ``n`` gallery rows."""
+    rng = np.random.default_rng(seed)
+    students = max(1, n // samples_per_student)
+    centres = rng.normal(0, 0.1, (students, dim))
+    labels = np.repeat(np.arange(students), samples_per_student)[:n]
+    encodings = centres[labels] + rng.normal(0, 0.02, (len(labels), dim))
+    rolls = np.array([str(20250000 + i) for i in labels], dtype=object)
+    return encodings, rolls, centres
+
+
+def synthetic_probes(centres, count, seed=1):
+    """Return ``(probes, expected_rolls)``: fresh captures of random students."""
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, len(centres), count)
+    probes = centres[labels] + rng.normal(0, 0.02, (count, centres.shape[1]))
+    return probes, np.array([str(20250000 + i) for i in labels], dtype=object)
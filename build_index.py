@@ -0,0 +1,32 @@
+"""Rebuild the prototype or IVF index from the current face gallery.
+
+Usage: python build_index.py [--method mean|kmedoids] [--per-student 3]
+       python build_index.py --ivf [--nlist 1024]
+"""
+import argparse
+
+from gallery import get_gallery
+from ivf import IVF_FILE, default_nlist, save_centroids, train_kmeans
+from prototypes import PROTOTYPES_FILE, build_prototypes, save_prototypes
+
+parser = argparse.ArgumentParser(description="Rebuild data/prototypes.npz or data/ivf.npz")
+parser.add_argument("--ivf", action="store_true", help="train IVF centroids instead")
+parser.add_argument("--nlist", type=int, default=None, help="IVF cell count")
+parser.add_argument("--method", choices=["mean", "kmedoids"], default="mean")
+parser.add_argument("--per-student", type=int, default=1)
+parser.add_argument("--output", default=None)
+args = parser.parse_args()
+
+encodings, rolls = get_gallery().snapshot()
+if args.ivf:
+    output = args.output or IVF_FILE
+    centroids = train_kmeans(encodings, args.nlist or default_nlist(len(rolls)))
+    save_centroids(output, centroids)
+    print(f"✅ Trained {len(centroids)} IVF cells over {len(rolls)} samples to {output}")
+    raise SystemExit(0)
+
+args.output = args.output or PROTOTYPES_FILE
+prototypes, prototype_rolls = build_prototypes(encodings, rolls, args.per_student, args.method)
+save_prototypes(args.output, prototypes, prototype_rolls, len(rolls), args.method)
+print(f"✅ Saved {len(prototypes)} prototypes for {len(set(rolls))} students "
+      f"({len(rolls)} samples) to {args.output}")
@@ -0,0 +1,242 @@
+"""Process-wide camera service shared by every video consumer.
+
+``/video_feed``, ``/attendance_feed`` and enrollment each used to call
+``cv2.VideoCapture(0)`` themselves, fighting over the device and paying the
+sensor warm-up every time. The service opens the device once and a single
+capture thread pushes frames into a ring buffer. Any number of subscribers
+read from it at their own pace: a slow subscriber skips ahead to the oldest
+frame still buffered instead of holding up the camera or other clients.
+Subscribers are reference-counted and the device is released after it has
+been idle for ``IDLE_RELEASE`` seconds.
+
+``CAMERA_SOURCE`` selects the device index (default ``0``) or, for headless
+testing, a video file or a directory of images to replay.
+"""
+import glob
+import os
+import threading
+import time
+from collections import deque
+
+from lazy import cv2
+
+CAMERA_SOURCE = os.environ.get("CAMERA_SOURCE", "0")
+RING_SIZE = 8
+IDLE_RELEASE = 5.0
+FAKE_FPS = 15.0
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class CameraUnavailable(Exception):
+    pass
+
+
+class FileSource:
+    """Replays a video file or an image directory like a live camera."""
+
+    def __init__(self, path, fps=FAKE_FPS, loop=True):
+        self.path = path
+        self.interval = 1.0 / fps if fps else 0.0
+        self.loop = loop
+        self._next = 0.0
+        self._index = 0
+        self._images = None
+        self._video = None
+        if os.path.isdir(path):
+            self._images = sorted(p for p in glob.glob(os.path.join(path, "*"))
+                                  if p.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            self._video = cv2.VideoCapture(path)
+
+    def isOpened(self):
+        if self._images is not None:
+            return bool(self._images)
+        return self._video.isOpened()
+
+    def _read_raw(self):
+        if self._images is not None:
+            if self._index >= len(self._images):
+                if not self.loop:
+                    return False, None
+                self._index = 0
+            frame = cv2.imread(self._images[self._index])
+            self._index += 1
+            return frame is not None, frame
+        ok, frame = self._video.read()
+        if not ok and self.loop:
+            self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self._video.read()
+        return ok, frame
+
+    def read(self):
+        # Pace like a real sensor so consumers see realistic frame rates
+        now = time.monotonic()
+        if now < self._next:
+            time.sleep(self._next - now)
+        self._next = max(now, self._next) + self.interval
+        return self._read_raw()
+
+    def release(self):
+        if self._video is not None:
+            self._video.release()
+
+
+def open_camera_source(spec=CAMERA_SOURCE):
+    if str(spec).isdigit():
+        return cv2.VideoCapture(int(spec))
+    return FileSource(spec)
+
+
+class Subscription:
+    """One consumer's cursor into the camera ring buffer."""
+
+    def __init__(self, service, cursor):
+        self._service = service
+        self.cursor = cursor
+        self.dropped = 0
+        self.closed = False
+
+    def read(self, timeout=5.0):
+        """Return ``(ok, frame)`` for the next frame after this cursor.
+
+        Frames are shared between subscribers; copy before drawing on them.
+        """
+        if self.closed:
+            return False, None
+        return self._service._next_frame(self, timeout)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._service._unsubscribe()
+
+    release = close
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CameraService:
+    def __init__(self, open_source=open_camera_source, ring_size=RING_SIZE, idle_release=IDLE_RELEASE):
+        self.open_source = open_source
+        self.idle_release = idle_release
+        self._cond = threading.Condition()
+        self._ring = deque(maxlen=ring_size)
+        self._seq = 0
+        self._subscribers = 0
+        self._source = None
+        self._thread = None
+        self._running = False
+        self._idle_since = None
+
+    @property
+    def subscribers(self):
+        return self._subscribers
+
+    def subscribe(self):
+        """Start (or join) the capture; raises CameraUnavailable if it can't open."""
+        with self._cond:
+            self._subscribers += 1
+            self._idle_since = None
+            try:
+                if not self._running:
+                    self._start()
+            except Exception:
+                self._subscribers -= 1
+                raise
+            return Subscription(self, self._seq)
+
+    def _start(self):
+        source = self.open_source()
+        if not source.isOpened():
+            source.release()
+            raise CameraUnavailable("Camera not accessible!")
+        self._source = source
+        self._running = True
+        self._ring.clear()
+        self._thread = threading.Thread(target=self._capture, name="camera", daemon=True)
+        self._thread.start()
+
+    def _unsubscribe(self):
+        with self._cond:
+            self._subscribers -= 1
+            if self._subscribers == 0:
+                self._idle_since = time.monotonic()
+                self._cond.notify_all()
+
+    def _capture(self):
+        source = self._source
+        success = True
+        idle = False
+        try:
+            while success:
+                with self._cond:
+                    if self._idle_since is not None and time.monotonic() - self._idle_since >= self.idle_release:
+                        idle = True
+                        break
+                success, frame = source.read()
+                if success:
+                    with self._cond:
+                        self._seq += 1
+                        self._ring.append((self._seq, frame))
+                        self._cond.notify_all()
+        finally:
+            # Shut down under the lock so a concurrent subscribe() either
+            # joins this run before it ends or starts a fresh one after it
+            with self._cond:
+                source.release()
+                self._running = False
+                self._source = None
+                if idle and self._subscribers:
+                    # A subscribe() landed between the idle check and here and
+                    # joined this run; start a fresh one for it
+                    try:
+                        self._start()
+                    except CameraUnavailable:
+                        pass
+                self._cond.notify_all()
+
+    def _has_frame_after(self, cursor):
+        return bool(self._ring) and self._ring[-1][0] > cursor
+
+    def _next_frame(self, sub, timeout):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._has_frame_after(sub.cursor) or not self._running, timeout):
+                return False, None
+            if not self._has_frame_after(sub.cursor):
+                return False, None
+            oldest = self._ring[0][0]
+            if sub.cursor + 1 < oldest:
+                # This client fell behind the ring; skip to what's still buffered
+                sub.dropped += oldest - sub.cursor - 1
+                sub.cursor = oldest - 1
+            seq, frame = self._ring[sub.cursor + 1 - oldest]
+            sub.cursor = seq
+            return True, frame
+
+    def snapshot(self, timeout=5.0):
+        """Grab one fresh frame (used by enrollment); None if unavailable."""
+        try:
+            sub = self.subscribe()
+        except CameraUnavailable:
+            return None
+        with sub:
+            ok, frame = sub.read(timeout)
+        return frame if ok else None
+
+
+_camera = None
+_camera_lock = threading.Lock()
+
+
+def get_camera():
+    """Return the shared camera service."""
+    global _camera
+    if _camera is None:
+        with _camera_lock:
+            if _camera is None:
+                _camera = CameraService()
+    return _camera
@@ -0,0 +1,228 @@
+"""Compacted gallery: deduplicated, float16 or product-quantized encodings.
+
+Every worker used to hold the whole gallery as full-precision vectors, and
+a lot of those rows are near-duplicates from consecutive webcam frames.
+``python compact_gallery.py`` writes ``data/gallery.compact.npz``, which
+the matcher loads directly (``FACE_MATCH_INDEX=compact``):
+
+- dedup: per student, a sample closer than ``--dedup`` to one already kept
+  is left out of the index. The encodings store itself is never rewritten.
+- ``float32`` keeps the rows as they are; ``float16`` halves them.
+- ``pq`` splits each 128-d vector into ``subspaces`` chunks and stores the
+  index of the nearest of 256 trained centroids per chunk: 16 bytes a row
+  instead of 512. Probes are scored against every row through per-chunk
+  lookup tables, then the ``rerank`` closest candidates are re-scored
+  exactly against the store, which is memory-mapped so only those rows are
+  read. Without SIMD table lookups this is slower per face than a float32
+  scan; it is for galleries that would not otherwise fit in memory.
+
+The file covers the first ``source_count`` rows of the store. Rows enrolled
+after compaction are kept as exact float32 rows and scanned in full until
+the next compaction.
+"""
+import os
+
+import numpy as np
+
+from ivf import train_kmeans
+from matcher import TOLERANCE, _grown, pairwise_distances, resolve_matches
+from quality import MIN_SPREAD
+
+COMPACT_FILE = "data/gallery.compact.npz"
+FORMATS = ("float32", "float16", "pq")
+SUBSPACES = 16
+CENTROIDS = 256
+RERANK = 64
+CHUNK = 65536
+
+
+def dedup(encodings, rolls, threshold=MIN_SPREAD):
+    """Sorted row indexes to keep: per roll, rows not within ``threshold`` of an earlier kept row."""
+    rolls = np.asarray(rolls, dtype=object).astype(str)
+    order = np.argsort(rolls, kind="stable")
+    ordered = rolls[order]
+    bounds = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1], True]) if len(rolls) else [0]
+    keep = []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        group = order[lo:hi]
+        samples = np.asarray(encodings[group], dtype=np.float32)
+        d = pairwise_distances(samples, samples)
+        kept = []
+        for i in range(len(group)):
+            if not kept or d[i, kept].min() >= threshold:
+                kept.append(i)
+        keep.extend(group[kept])
+    return np.sort(np.array(keep, dtype=np.int64))
+
+
+def train_pq(encodings, subspaces=SUBSPACES, centroids=CENTROIDS):
+    """``(subspaces, k, dim // subspaces)`` codebooks from k-means per chunk."""
+    data = np.asarray(encodings, dtype=np.float32)
+    chunks = np.split(data, subspaces, axis=1)
+    k = min(centroids, len(data))
+    return np.stack([train_kmeans(np.ascontiguousarray(chunk), k) for chunk in chunks])
+
+
+def pq_encode(encodings, codebooks):
+    """``(subspaces, N)`` uint8 codes: the nearest centroid of each chunk."""
+    chunks = np.split(np.asarray(encodings, dtype=np.float32), len(codebooks), axis=1)
+    codes = np.empty((len(codebooks), len(encodings)), dtype=np.uint8)
+    for m, (chunk, book) in enumerate(zip(chunks, codebooks)):
+        for start in range(0, len(chunk), CHUNK):
+            codes[m, start:start + CHUNK] = pairwise_distances(chunk[start:start + CHUNK], book).argmin(axis=1)
+    return codes
+
+
+def build_compact(encodings, rolls, fmt="float16", dedup_distance=MIN_SPREAD, subspaces=SUBSPACES):
+    """The arrays of a compact file for ``encodings``/``rolls`` in format ``fmt``."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown compact format: {fmt}")
+    rolls = np.asarray(rolls, dtype=object).astype(str)
+    rows = dedup(encodings, rolls, dedup_distance) if dedup_distance > 0 else np.arange(len(rolls))
+    kept = np.asarray(encodings[rows], dtype=np.float32).reshape(-1, encodings.shape[1])
+    data = {"format": fmt, "rows": rows, "rolls": rolls[rows], "source_count": len(rolls)}
+    if fmt == "pq":
+        data["codebooks"] = (train_pq(kept, subspaces) if len(kept) else
+                             np.zeros((subspaces, 1, kept.shape[1] // subspaces), dtype=np.float32))
+        data["codes"] = pq_encode(kept, data["codebooks"])
+    else:
+        data["vectors"] = kept.astype(fmt)
+    return data
+
+
+def save_compact(path, data):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, **data)
+    os.replace(tmp_path, path)
+
+
+def load_compact(path, source_count):
+    """Load a compact file built from at most ``source_count`` rows, else None."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        if int(data["source_count"]) > source_count:
+            return None  # the store was rebuilt since
+        return {key: data[key] for key in data.files}
+
+
+class CompactMatcher:
+    """Match against a compact file plus the exact rows enrolled after it.
+
+    Those rows go into tail buffers that double their capacity, as in
+    ExhaustiveMatcher, so enrolling one face at a time stays O(new rows)
+    amortized. Only the first ``tail_size`` tail rows are live.
+    """
+
+    def __init__(self, encodings, rolls, compact=None, rerank=RERANK):
+        rolls = np.asarray(rolls, dtype=object).astype(str).astype(object)
+        if compact is None:
+            compact = build_compact(encodings, rolls)
+        self.format = str(compact["format"])
+        # Exact rows for re-ranking; a memory-mapped store is only read where needed
+        self.encodings = encodings
+        self.rows = np.asarray(compact["rows"], dtype=np.int64)
+        self.rerank = rerank
+        self.vectors = compact.get("vectors")
+        if self.vectors is not None:
+            vectors = self.vectors.astype(np.float32)
+            self.vectors_sq = np.einsum("ij,ij->i", vectors, vectors)
+        self.codes = compact.get("codes")
+        self.codebooks = compact.get("codebooks")
+        if self.codebooks is not None:
+            self.codebooks = np.asarray(self.codebooks, dtype=np.float32)
+            self.codebooks_sq = np.einsum("mkd,mkd->mk", self.codebooks, self.codebooks)
+        self._label_of = {}
+        self.compact_rolls = np.asarray(compact["rolls"], dtype=object).astype(str).astype(object)
+        self.compact_labels = self._labels_for(self.compact_rolls)
+        covered = int(compact["source_count"])
+        self._tail = np.empty((0, encodings.shape[1]), dtype=np.float32)
+        self._tail_sq = np.empty(0, dtype=np.float32)
+        self._tail_rolls = np.empty(0, dtype=object)
+        self._tail_labels = np.empty(0, dtype=np.int64)
+        self.tail_size = 0
+        self.add(encodings[covered:], rolls[covered:])
+
+    def __len__(self):
+        return len(self.compact_rolls) + self.tail_size
+
+    @property
+    def tail(self):
+        return self._tail[:self.tail_size]
+
+    @property
+    def tail_rolls(self):
+        return self._tail_rolls[:self.tail_size]
+
+    def _labels_for(self, rolls):
+        return np.array([self._label_of.setdefault(r, len(self._label_of)) for r in rolls], dtype=np.int64)
+
+    def add(self, encodings, rolls):
+        """Keep rows enrolled after compaction as exact float32 rows."""
+        new = np.asarray(encodings, dtype=np.float32).reshape(-1, self._tail.shape[1])
+        rolls = [str(r) for r in rolls]
+        start, end = self.tail_size, self.tail_size + len(new)
+        # Rows past ``tail_size`` are invisible to match(), so fill them in before publishing
+        self._tail = _grown(self._tail, end)
+        self._tail_sq = _grown(self._tail_sq, end)
+        self._tail_rolls = _grown(self._tail_rolls, end)
+        self._tail_labels = _grown(self._tail_labels, end)
+        self._tail[start:end] = new
+        self._tail_sq[start:end] = np.einsum("ij,ij->i", new, new)
+        self._tail_rolls[start:end] = rolls
+        self._tail_labels[start:end] = self._labels_for(rolls)
+        self.tail_size = end
+
+    def nbytes(self):
+        """Resident bytes of the vector data (not counting roll strings)."""
+        arrays = [self.vectors, self.codes, self.codebooks, self._tail, self.rows, self.compact_labels]
+        if self.vectors is not None:
+            arrays.append(self.vectors_sq)
+        return int(sum(a.nbytes for a in arrays if a is not None))
+
+    def _float_distances(self, probes):
+        out = np.empty((len(probes), len(self.vectors)), dtype=np.float32)
+        for start in range(0, len(self.vectors), CHUNK):
+            block = np.asarray(self.vectors[start:start + CHUNK], dtype=np.float32)
+            out[:, start:start + CHUNK] = pairwise_distances(probes, block, self.vectors_sq[start:start + CHUNK])
+        return out
+
+    def _pq_distances(self, probes):
+        """Approximate squared distances from each probe to every compact row."""
+        chunks = probes.reshape(len(probes), len(self.codebooks), -1)
+        tables = (np.einsum("bmd,bmd->bm", chunks, chunks)[:, :, None] + self.codebooks_sq[None]
+                  - 2.0 * np.einsum("bmd,mkd->bmk", chunks, self.codebooks)).astype(np.float32)
+        d2 = np.zeros((len(probes), self.codes.shape[1]), dtype=np.float32)
+        for m, codes in enumerate(self.codes):
+            d2 += np.take(tables[:, m], codes, axis=1)
+        return d2
+
+    def match(self, probes, tolerance=TOLERANCE):
+        if not len(probes):
+            return []
+        probes = np.asarray(probes, dtype=np.float32).reshape(len(probes), -1)
+        # Read the live count first: every buffer seen afterwards holds at least that many rows
+        size = self.tail_size
+        tail, tail_sq = self._tail, self._tail_sq
+        tail_labels, tail_rolls = self._tail_labels[:size], self._tail_rolls[:size]
+        d_tail = pairwise_distances(probes, tail[:size], tail_sq[:size])
+        if self.codes is None:
+            d = np.hstack([self._float_distances(probes), d_tail])
+            return resolve_matches(d, np.concatenate([self.compact_labels, tail_labels]),
+                                   np.concatenate([self.compact_rolls, tail_rolls]), tolerance)
+        results = []
+        for i, (probe, d2) in enumerate(zip(probes, self._pq_distances(probes))):
+            keep = min(self.rerank or len(d2), len(d2))
+            cand = np.argpartition(d2, keep - 1)[:keep] if keep < len(d2) else np.arange(len(d2))
+            if self.rerank:
+                exact = np.asarray(self.encodings[self.rows[cand]], dtype=np.float32)
+                d = pairwise_distances(probe[None, :], exact)
+            else:
+                d = np.sqrt(np.maximum(d2[cand], 0.0))[None, :]
+            results.extend(resolve_matches(np.hstack([d, d_tail[i:i + 1]]),
+                                           np.concatenate([self.compact_labels[cand], tail_labels]),
+                                           np.concatenate([self.compact_rolls[cand], tail_rolls]), tolerance))
+        return results
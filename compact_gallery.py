@@ -0,0 +1,101 @@
+"""Compact the face gallery into data/gallery.compact.npz.
+
+Usage: python compact_gallery.py [--format float32|float16|pq] [--dedup 0.08] [--report]
+
+Set ``FACE_MATCH_INDEX=compact`` to match against the file. Re-run it after
+large enrollments; rows added since are matched exactly in the meantime.
+
+``--report`` compares, on this gallery, the legacy pickle (if present), the
+float32 store and every compact format. It prints the memory of the vector
+data, file size, load time, match time, accuracy on noisy copies of gallery
+samples, and agreement with exact float32 matching.
+"""
+import argparse
+import os
+import pickle
+import tempfile
+import time
+
+import numpy as np
+
+from compact import COMPACT_FILE, FORMATS, SUBSPACES, CompactMatcher, build_compact, load_compact, save_compact
+from encoding_store import STORE_FILE, EncodingStore
+from gallery import ENCODINGS_FILE, get_gallery
+from matcher import ExhaustiveMatcher
+from quality import MIN_SPREAD
+
+parser = argparse.ArgumentParser(description="Write data/gallery.compact.npz")
+parser.add_argument("--format", choices=FORMATS, default="float16")
+parser.add_argument("--dedup", type=float, default=MIN_SPREAD,
+                    help="drop samples this close to a kept sample of the same student (0 keeps all)")
+parser.add_argument("--subspaces", type=int, default=SUBSPACES, help="PQ chunks per vector (16 bytes a row)")
+parser.add_argument("--output", default=COMPACT_FILE)
+parser.add_argument("--report", action="store_true", help="compare every representation first")
+parser.add_argument("--probes", type=int, default=500)
+parser.add_argument("--noise", type=float, default=0.02, help="per-dimension noise added to report probes")
+args = parser.parse_args()
+
+encodings, rolls = get_gallery().snapshot()
+if not len(rolls):
+    raise SystemExit("The gallery is empty; nothing to compact")
+
+
+def measure(label, load, rows, file_size, probes):
+    start = time.perf_counter()
+    matcher, nbytes = load()
+    load_ms = (time.perf_counter() - start) * 1000.0
+    start = time.perf_counter()
+    got = np.array([m.roll for m in matcher.match(probes)], dtype=object)
+    us = (time.perf_counter() - start) * 1e6 / len(probes)
+    return label, rows, nbytes, file_size, load_ms, us, got
+
+
+if args.report:
+    rng = np.random.default_rng(0)
+    picked = rng.choice(len(rolls), min(args.probes, len(rolls)), replace=False)
+    probes = (np.asarray(encodings[picked], dtype=np.float32)
+              + rng.normal(0, args.noise, (len(picked), encodings.shape[1]))).astype(np.float32)
+    expected = np.asarray(rolls, dtype=object)[picked].astype(str)
+    results = []
+    if os.path.exists(ENCODINGS_FILE):
+        def load_legacy():
+            with open(ENCODINGS_FILE, "rb") as f:
+                known_encodings, known_rolls = pickle.load(f)
+            matrix = np.vstack(known_encodings).astype(np.float64)
+            return ExhaustiveMatcher(matrix, known_rolls), sum(np.asarray(e).nbytes for e in known_encodings)
+        results.append(measure("pickle (float64)", load_legacy, len(rolls), os.path.getsize(ENCODINGS_FILE),
+                               probes))
+    if os.path.exists(STORE_FILE):
+        def load_store():
+            store_rows, store_rolls = EncodingStore(STORE_FILE).read()
+            matrix = np.array(store_rows)
+            return ExhaustiveMatcher(matrix, store_rolls), matrix.nbytes
+        store_size = os.path.getsize(STORE_FILE) + os.path.getsize(EncodingStore(STORE_FILE).labels_path)
+        results.append(measure("store (float32)", load_store, len(rolls), store_size, probes))
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in FORMATS:
+            path = os.path.join(tmp, f"{fmt}.npz")
+            save_compact(path, build_compact(encodings, rolls, fmt, args.dedup, args.subspaces))
+            for rerank in ((64, 0) if fmt == "pq" else (None,)):
+                def load(path=path, rerank=rerank):
+                    data = load_compact(path, len(rolls))
+                    matcher = (CompactMatcher(encodings, rolls, data) if rerank is None
+                               else CompactMatcher(encodings, rolls, data, rerank=rerank))
+                    return matcher, matcher.nbytes()
+                label = f"compact {fmt}" + ("" if rerank is None else f", re-rank {rerank}" if rerank else ", no re-rank")
+                kept = len(load_compact(path, len(rolls))["rows"])
+                results.append(measure(label, load, kept, os.path.getsize(path), probes))
+    exact = ExhaustiveMatcher(np.asarray(encodings, dtype=np.float32), rolls).match(probes)
+    exact = np.array([m.roll for m in exact], dtype=object)
+    print(f"{len(rolls)} samples of {len(set(np.asarray(rolls, dtype=str)))} students, "
+          f"{len(probes)} probes (noise {args.noise})")
+    print(f"{'representation':>26} {'rows':>8} {'memory MB':>10} {'file MB':>8} {'load ms':>8} "
+          f"{'us/face':>8} {'accuracy':>9} {'agree':>6}")
+    for label, rows, nbytes, size, load_ms, us, got in results:
+        print(f"{label:>26} {rows:>8} {nbytes / 2**20:>10.2f} {size / 2**20:>8.2f} {load_ms:>8.1f} "
+              f"{us:>8.1f} {np.mean(got == expected):>9.3f} {np.mean(got == exact):>6.3f}")
+
+data = build_compact(encodings, rolls, args.format, args.dedup, args.subspaces)
+save_compact(args.output, data)
+print(f"✅ Wrote {len(data['rows'])} of {len(rolls)} samples ({args.format}) for "
+      f"{len(set(data['rolls']))} students to {args.output} ({os.path.getsize(args.output) / 2**20:.2f} MB)")
@@ -0,0 +1,56 @@
+"""Move data between the legacy CSV files and data/attendance.db.
+
+Usage: python csvdb.py import [--students data/students.csv] [--attendance Attendance]
+       python csvdb.py export [--students data/students.csv] [--attendance Attendance]
+
+``import`` loads students.csv, every Attendance_<date>.csv and the old
+notification JSON/journal files; rows already in the database are kept, so
+it is safe to re-run. (An empty database is imported automatically on first
+use.) ``export`` rewrites students.csv and one Attendance_<date>.csv per day
+from the database, in the original formats.
+"""
+import argparse
+import csv
+import os
+from itertools import groupby
+
+from analytics import rebuild
+from db import from_iso, get_db, import_legacy
+from ledger import COLUMNS, attendance_path
+from roster import FIELDS, STUDENTS_FILE
+
+
+def write_csv(path, header, rows):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+
+
+parser = argparse.ArgumentParser(description="Import/export the legacy CSV files")
+parser.add_argument("command", choices=["import", "export"])
+parser.add_argument("--students", default=STUDENTS_FILE)
+parser.add_argument("--attendance", default="Attendance", help="directory of Attendance_<date>.csv files")
+args = parser.parse_args()
+
+conn = get_db()
+if args.command == "import":
+    counts = import_legacy(conn, args.students, args.attendance, os.path.dirname(args.students) or ".")
+    # Imported rows bypass the ledger, so recompute the per-student figures
+    rebuild(conn)
+    print(f"✅ Imported {counts['students']} students, {counts['attendance']} attendance rows "
+          f"and {counts['notifications']} notifications")
+else:
+    students = conn.execute(f"SELECT {', '.join(FIELDS)} FROM students ORDER BY rowid").fetchall()
+    write_csv(args.students, FIELDS, [list(row) for row in students])
+    rows = conn.execute("SELECT date, roll_number, name, standard, time FROM attendance ORDER BY date, id")
+    days = 0
+    for date, day_rows in groupby(rows, key=lambda r: r["date"]):
+        write_csv(attendance_path(from_iso(date), args.attendance), COLUMNS, [list(r)[1:] for r in day_rows])
+        days += 1
+    print(f"✅ Exported {len(students)} students and {days} days of attendance")
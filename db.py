@@ -0,0 +1,311 @@
+"""SQLite storage for students, attendance and notifications.
+
+Attendance used to be one CSV per day and every history view globbed and
+parsed all of them. Everything now lives in ``data/attendance.db`` (override
+with ``ATTENDANCE_DB``), opened in WAL mode so worker processes can read
+while one of them writes. Uniqueness is enforced by the schema: a roll is
+marked at most once per date, and a notification key is used at most once
+per date.
+
+Dates are stored as ISO ``YYYY-MM-DD`` so that ranges sort and index
+naturally; the rest of the app keeps using ``dd-mm-YYYY``, and
+``to_iso``/``from_iso`` convert between the two.
+
+On first use an empty database is filled from the existing CSV/JSON files
+(see ``import_legacy``). Set ``CSV_EXPORT=1`` to keep writing the old CSV
+files alongside, or run ``python csvdb.py export``.
+"""
+import contextlib
+import csv
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from locks import FileLock
+
+DB_FILE = os.environ.get("ATTENDANCE_DB", "data/attendance.db")
+CSV_EXPORT = os.environ.get("CSV_EXPORT", "0") == "1"
+BUSY_TIMEOUT_MS = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('students_version', 0);
+
+CREATE TABLE IF NOT EXISTS students (
+    roll_number TEXT PRIMARY KEY,
+    full_name TEXT NOT NULL DEFAULT '',
+    dob TEXT NOT NULL DEFAULT '',
+    parent_mobile TEXT NOT NULL DEFAULT '',
+    parent_email TEXT NOT NULL DEFAULT '',
+    standard TEXT NOT NULL DEFAULT '',
+    year_joined TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_students_standard ON students (standard);
+CREATE INDEX IF NOT EXISTS idx_students_year ON students (year_joined);
+
+-- Lets every worker notice roster changes with one cheap lookup
+CREATE TRIGGER IF NOT EXISTS students_ai AFTER INSERT ON students
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'students_version'; END;
+CREATE TRIGGER IF NOT EXISTS students_au AFTER UPDATE ON students
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'students_version'; END;
+CREATE TRIGGER IF NOT EXISTS students_ad AFTER DELETE ON students
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'students_version'; END;
+
+CREATE TABLE IF NOT EXISTS attendance (
+    id INTEGER PRIMARY KEY,
+    roll_number TEXT NOT NULL,
+    date TEXT NOT NULL,
+    name TEXT NOT NULL DEFAULT '',
+    standard TEXT NOT NULL DEFAULT '',
+    time TEXT NOT NULL DEFAULT '',
+    UNIQUE (roll_number, date)
+);
+CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance (date, standard);
+-- Covers per-standard range reports (report.py) without touching the table
+CREATE INDEX IF NOT EXISTS idx_attendance_standard ON attendance (standard, date, roll_number, time);
+
+-- Present count per day and standard, kept current by triggers so calendar
+-- views read one small row per day instead of every attendance row
+CREATE TABLE IF NOT EXISTS daily_summary (
+    date TEXT NOT NULL,
+    standard TEXT NOT NULL,
+    present INTEGER NOT NULL,
+    PRIMARY KEY (date, standard)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS attendance_ai AFTER INSERT ON attendance
+BEGIN
+    INSERT INTO daily_summary (date, standard, present) VALUES (NEW.date, NEW.standard, 1)
+    ON CONFLICT (date, standard) DO UPDATE SET present = present + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS attendance_ad AFTER DELETE ON attendance
+BEGIN
+    UPDATE daily_summary SET present = present - 1 WHERE date = OLD.date AND standard = OLD.standard;
+END;
+
+-- Running per-student figures, maintained by analytics.py
+CREATE TABLE IF NOT EXISTS student_stats (
+    roll_number TEXT PRIMARY KEY,
+    since TEXT NOT NULL,
+    days_present INTEGER NOT NULL DEFAULT 0,
+    absent_days INTEGER NOT NULL DEFAULT 0,
+    streak INTEGER NOT NULL DEFAULT 0,
+    best_streak INTEGER NOT NULL DEFAULT 0,
+    absent_streak INTEGER NOT NULL DEFAULT 0,
+    last_present TEXT,
+    arrival_total INTEGER NOT NULL DEFAULT 0,
+    arrival_count INTEGER NOT NULL DEFAULT 0,
+    recent_mask INTEGER NOT NULL DEFAULT 0,
+    mask_date TEXT
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('stats_rollup', 0);
+
+CREATE TABLE IF NOT EXISTS notifications (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    date TEXT NOT NULL,
+    key TEXT,
+    recipient TEXT NOT NULL DEFAULT '',
+    subject TEXT NOT NULL DEFAULT '',
+    body TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    UNIQUE (date, key)
+);
+CREATE INDEX IF NOT EXISTS idx_notifications_status ON notifications (status, next_attempt);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+def to_iso(date):
+    """``dd-mm-YYYY`` (or already ISO) -> ``YYYY-MM-DD``."""
+    date = str(date).strip()
+    if len(date) == 10 and date[4] == "-":
+        datetime.strptime(date, "%Y-%m-%d")
+        return date
+    return datetime.strptime(date, "%d-%m-%Y").strftime("%Y-%m-%d")
+
+
+def from_iso(date):
+    return datetime.strptime(date, "%Y-%m-%d").strftime("%d-%m-%Y")
+
+
+def seconds_of_day(value):
+    """``HH:MM[:SS]`` -> seconds since midnight, or -1 if unparseable."""
+    try:
+        parts = [int(p) for p in str(value).strip().split(":")]
+    except ValueError:
+        return -1
+    if not 2 <= len(parts) <= 3:
+        return -1
+    parts += [0] * (3 - len(parts))
+    return parts[0] * 3600 + parts[1] * 60 + parts[2]
+
+
+def _open(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000.0, isolation_level=None,
+                           check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    # WAL + NORMAL: durable across process crashes, fsync at checkpoints only
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def _initialize(path):
+    with _init_lock:
+        if path in _initialized:
+            return
+        with FileLock(path + ".init.lock"):
+            conn = _open(path)
+            try:
+                tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+                conn.executescript(SCHEMA)
+                if "daily_summary" not in tables:
+                    # Summary table added to an existing database: build it once
+                    conn.execute("INSERT OR REPLACE INTO daily_summary (date, standard, present) "
+                                 "SELECT date, standard, COUNT(*) FROM attendance GROUP BY date, standard")
+                if "students" not in tables:
+                    import_legacy(conn)
+                if "student_stats" not in tables:
+                    from analytics import rebuild
+                    rebuild(conn)
+            finally:
+                conn.close()
+        _initialized.add(path)
+
+
+def get_db(path=None):
+    """Connection for the calling thread (and process) to ``path``."""
+    path = os.path.abspath(path or DB_FILE)
+    conns = getattr(_local, "conns", None)
+    # Connections must not cross a fork (preloaded WSGI workers)
+    if conns is None or _local.pid != os.getpid():
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+    conn = conns.get(path)
+    if conn is None:
+        _initialize(path)
+        conn = conns[path] = _open(path)
+    return conn
+
+
+@contextlib.contextmanager
+def transaction(conn, immediate=True):
+    """``BEGIN IMMEDIATE`` ... ``COMMIT``: take the write lock up front."""
+    conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def import_legacy(conn, students_file="data/students.csv", attendance_dir="Attendance", data_dir="data"):
+    """Load the pre-SQLite CSV/JSON files; rows already present are kept.
+
+    Returns counts of imported students, attendance rows and notifications.
+    """
+    counts = {"students": 0, "attendance": 0, "notifications": 0}
+    now = time.time()
+    with transaction(conn):
+        if os.path.exists(students_file):
+            with open(students_file, newline="") as f:
+                for row in csv.DictReader(f):
+                    record = {k: (row.get(k) or "").strip() for k in
+                              ("roll_number", "full_name", "dob", "parent_mobile", "parent_email",
+                               "standard", "year_joined")}
+                    if not record["roll_number"]:
+                        continue
+                    cur = conn.execute(
+                        "INSERT OR IGNORE INTO students (roll_number, full_name, dob, parent_mobile, "
+                        "parent_email, standard, year_joined) VALUES (:roll_number, :full_name, :dob, "
+                        ":parent_mobile, :parent_email, :standard, :year_joined)", record)
+                    counts["students"] += cur.rowcount
+        by_name = {r["full_name"]: r for r in conn.execute("SELECT roll_number, full_name, standard FROM students")}
+        for path in sorted(glob.glob(os.path.join(attendance_dir, "Attendance_*.csv"))):
+            try:
+                date = to_iso(os.path.basename(path)[len("Attendance_"):-len(".csv")])
+            except ValueError:
+                continue
+            with open(path, newline="") as f:
+                for i, row in enumerate(csv.reader(f)):
+                    if not row or (i == 0 and row[0].strip().upper() in ("ROLL", "NAME")):
+                        continue
+                    if len(row) >= 4:
+                        roll, name, standard, at = (v.strip() for v in row[:4])
+                    elif len(row) == 2:
+                        # Oldest files are NAME,TIME
+                        student = by_name.get(row[0].strip())
+                        roll = student["roll_number"] if student else row[0].strip()
+                        name, standard, at = row[0].strip(), student["standard"] if student else "", row[1].strip()
+                    else:
+                        continue
+                    cur = conn.execute(
+                        "INSERT OR IGNORE INTO attendance (roll_number, date, name, standard, time) "
+                        "VALUES (?, ?, ?, ?, ?)", (roll, date, name, standard, at))
+                    counts["attendance"] += cur.rowcount
+        for prefix, kind, key_format in (("notified", "email", "{}"), ("sms_sent", "absence", "absence:{}")):
+            for path in glob.glob(os.path.join(data_dir, f"{prefix}_*.json")):
+                try:
+                    date = to_iso(os.path.basename(path)[len(prefix) + 1:-len(".json")])
+                    with open(path) as f:
+                        keys = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                for key in keys:
+                    cur = conn.execute(
+                        "INSERT OR IGNORE INTO notifications (kind, date, key, status, created, updated) "
+                        "VALUES (?, ?, ?, 'sent', ?, ?)", (kind, date, key_format.format(key), now, now))
+                    counts["notifications"] += cur.rowcount
+        # Jobs still outstanding in the old notifier journal
+        journal = os.path.join(data_dir, "notify_queue.jsonl")
+        if os.path.exists(journal):
+            jobs = {}
+            with open(journal) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if "done" in record:
+                        jobs.pop(record["done"], None)
+                    else:
+                        jobs[record["id"]] = record
+            for job in jobs.values():
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO notifications (kind, date, key, recipient, subject, body, status, "
+                    "created, updated) VALUES ('email', ?, ?, ?, ?, ?, 'pending', ?, ?)",
+                    (to_iso(job["date"]), job.get("key"), job["to"], job["subject"], job["body"], now, now))
+                counts["notifications"] += cur.rowcount
+    return counts
+
+
+def append_csv(path, header, rows):
+    """Append ``rows`` to a CSV (with ``header`` if new); used by CSV_EXPORT."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with FileLock(path + ".lock"), open(path, "a", newline="") as f:
+        writer = csv.writer(f)
+        if f.tell() == 0:
+            writer.writerow(header)
+        writer.writerows(rows)
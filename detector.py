@@ -0,0 +1,148 @@
+"""Cascaded face detection for the realtime feed.
+
+Full-resolution ``face_recognition.face_locations`` (dlib HOG) was run on
+every detection frame. This stage puts a cheap pre-filter in front of it,
+working on a grayscale copy downscaled by ``FACE_DETECT_SCALE``:
+
+* ``haar``   - the bundled ``data/haarcascade_frontalface_default.xml``
+               proposes face regions. Frames with no proposals are skipped.
+               The HOG/CNN model then runs only on padded ROIs around them,
+               and the boxes are mapped back to full-frame coordinates.
+* ``motion`` - if nothing moved since the last detection, the previous boxes
+               are reused. Otherwise the model runs on the whole frame.
+* ``none``   - the model runs on every frame (the old behaviour).
+
+``FACE_DETECT_MODEL`` chooses the final model: ``hog`` (default), ``cnn``, or
+``haar`` to trust the cascade alone. Boxes are always (top, right, bottom,
+left) in the coordinates of the frame passed in, ready for encoding.
+"""
+import logging
+import os
+import threading
+
+import cv2
+import numpy as np
+
+try:
+    import face_recognition
+except ImportError:
+    face_recognition = None
+
+log = logging.getLogger(__name__)
+CASCADE_FILE = "data/haarcascade_frontalface_default.xml"
+DETECT_MODEL = os.environ.get("FACE_DETECT_MODEL", "hog")
+DETECT_PREFILTER = os.environ.get("FACE_DETECT_PREFILTER", "haar")
+DETECT_SCALE = float(os.environ.get("FACE_DETECT_SCALE", "0.5"))
+ROI_PADDING = 0.4  # fraction of the proposal size added on every side
+MIN_FACE = 20  # pixels, in the downscaled frame
+MOTION_THRESHOLD = 0.01  # fraction of pixels that changed
+
+
+def _load_cascade(path):
+    if not hasattr(cv2, "CascadeClassifier"):
+        return None
+    cascade = cv2.CascadeClassifier(path)
+    return None if cascade.empty() else cascade
+
+
+def _merge_rects(rects):
+    """Union overlapping (x, y, w, h) rects so each face region is searched once."""
+    merged = []
+    for x, y, w, h in sorted(rects, key=lambda r: r[0]):
+        box = [x, y, x + w, y + h]
+        for other in merged:
+            if box[0] <= other[2] and other[0] <= box[2] and box[1] <= other[3] and other[1] <= box[3]:
+                other[:] = [min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3])]
+                break
+        else:
+            merged.append(box)
+    return merged
+
+
+class FaceDetector:
+    """Callable ``detector(rgb_frame) -> [(top, right, bottom, left), ...]``."""
+
+    def __init__(self, model=DETECT_MODEL, prefilter=DETECT_PREFILTER, scale=DETECT_SCALE,
+                 cascade_path=CASCADE_FILE):
+        self.model = model
+        self.scale = scale
+        self.prefilter = prefilter
+        self.cascade = None
+        if model == "haar" or prefilter == "haar":
+            self.cascade = _load_cascade(cascade_path)
+            if self.cascade is None:
+                log.warning("Haar cascade unavailable (%s); using motion pre-filter and HOG", cascade_path)
+                self.prefilter = "motion"
+                if model == "haar":
+                    self.model = "hog"
+        self._previous = None
+        self._last_boxes = []
+        self.frames = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def _small_gray(self, rgb_frame):
+        gray = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2GRAY)
+        if self.scale != 1.0:
+            gray = cv2.resize(gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return gray
+
+    def _run_model(self, rgb_frame):
+        return [tuple(int(v) for v in box) for box in face_recognition.face_locations(rgb_frame, model=self.model)]
+
+    def _proposals(self, small):
+        rects = self.cascade.detectMultiScale(small, scaleFactor=1.1, minNeighbors=4, minSize=(MIN_FACE, MIN_FACE))
+        return [tuple(int(v) for v in r) for r in rects]
+
+    def _scale_up(self, rects):
+        s = self.scale
+        return [(int(y / s), int((x + w) / s), int((y + h) / s), int(x / s)) for x, y, w, h in rects]
+
+    def _on_rois(self, rgb_frame, rects):
+        """Run the model on padded proposal ROIs and map boxes back to the frame."""
+        height, width = rgb_frame.shape[:2]
+        boxes = []
+        for x0, y0, x1, y1 in _merge_rects(rects):
+            pad = ROI_PADDING * max(x1 - x0, y1 - y0)
+            left = max(0, int((x0 - pad) / self.scale))
+            top = max(0, int((y0 - pad) / self.scale))
+            right = min(width, int((x1 + pad) / self.scale))
+            bottom = min(height, int((y1 + pad) / self.scale))
+            roi = np.ascontiguousarray(rgb_frame[top:bottom, left:right])
+            for t, r, b, l in self._run_model(roi):
+                boxes.append((t + top, r + left, b + top, l + left))
+        return boxes
+
+    def _moved(self, small):
+        previous, self._previous = self._previous, small
+        if previous is None or previous.shape != small.shape:
+            return True
+        diff = cv2.absdiff(previous, small)
+        return np.count_nonzero(diff > 25) > MOTION_THRESHOLD * diff.size
+
+    def __call__(self, rgb_frame):
+        with self._lock:
+            self.frames += 1
+            if self.prefilter == "none" and self.model != "haar":
+                return self._run_model(rgb_frame)
+            small = self._small_gray(rgb_frame)
+            if self.prefilter == "motion":
+                if not self._moved(small):
+                    self.skipped += 1
+                    return list(self._last_boxes)
+                if self.model == "haar":
+                    self._last_boxes = self._scale_up(self._proposals(small))
+                else:
+                    self._last_boxes = self._run_model(rgb_frame)
+                return list(self._last_boxes)
+            rects = self._proposals(small)
+            if not len(rects):
+                self.skipped += 1
+                return []
+            if self.model == "haar":
+                return self._scale_up(rects)
+            return self._on_rois(rgb_frame, rects)
+
+    def stats(self):
+        return {"detector": f"{self.prefilter}+{self.model}", "detector_frames": self.frames,
+                "detector_skipped": self.skipped}
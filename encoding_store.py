@@ -0,0 +1,145 @@
+"""Append-only binary store for face encodings.
+
+Layout:
+
+* ``data/encodings.f32`` - a 32-byte header (magic, version, dim, count)
+  followed by ``count`` float32 rows of ``dim`` values.
+* ``data/encodings.labels`` - one fixed-width (32-byte) roll number per row.
+
+Writers append rows and labels under a file lock, fsync them, and only then
+bump ``count`` in the header, so a crash mid-append leaves the committed rows
+untouched. Readers memory-map the file read-only and pick up new rows by
+re-reading the header. ``python migrate_encodings.py`` converts the old
+``data/encodings.pkl``.
+"""
+import os
+import struct
+
+import numpy as np
+
+from locks import FileLock
+from matcher import _grown
+
+STORE_FILE = "data/encodings.f32"
+MAGIC = b"FENC"
+VERSION = 1
+HEADER = struct.Struct("<4sIIQ")
+HEADER_SIZE = 32
+COUNT_OFFSET = 12
+LABEL_WIDTH = 32
+
+
+class EncodingStore:
+    def __init__(self, path=STORE_FILE, dim=128):
+        self.path = path
+        self.labels_path = os.path.splitext(path)[0] + ".labels"
+        self.dim = dim
+        self._lock = FileLock(path + ".lock")
+        self._rows = None
+        # Decoded roll numbers; the buffer doubles, so a read costs O(new rows)
+        self._labels = np.empty(0, dtype=object)
+        self._decoded = 0
+        self._inode = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def stat(self):
+        """Cheap change marker for the store, or None if it does not exist."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _read_header(self):
+        with open(self.path, "rb") as f:
+            magic, version, dim, count = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not an encodings store")
+        if version != VERSION or dim != self.dim:
+            raise ValueError(f"Unsupported encodings store version {version} / dim {dim}")
+        return count
+
+    def count(self):
+        return self._read_header() if self.exists() else 0
+
+    def _create(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        for path, size in ((self.path, HEADER_SIZE), (self.labels_path, 0)):
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                if size:
+                    f.write(HEADER.pack(MAGIC, VERSION, self.dim, 0).ljust(size, b"\0"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+
+    def append(self, encodings, rolls):
+        """Atomically append rows; returns the new row count."""
+        rows = np.ascontiguousarray(encodings, dtype="<f4").reshape(-1, self.dim)
+        labels = [str(r).encode("utf-8") for r in rolls]
+        if len(labels) != len(rows):
+            raise ValueError("encodings and rolls must have the same length")
+        if any(len(label) > LABEL_WIDTH for label in labels):
+            raise ValueError(f"Roll numbers are limited to {LABEL_WIDTH} bytes")
+        labels = np.array(labels, dtype=f"S{LABEL_WIDTH}")
+        with self._lock:
+            if not self.exists():
+                self._create()
+            count = self._read_header()
+            # Overwrite anything past the committed count (a torn earlier append)
+            with open(self.path, "r+b") as f:
+                f.seek(HEADER_SIZE + count * self.dim * 4)
+                f.write(rows.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.labels_path, "r+b") as f:
+                f.seek(count * LABEL_WIDTH)
+                f.write(labels.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            count += len(rows)
+            with open(self.path, "r+b") as f:
+                f.seek(COUNT_OFFSET)
+                f.write(struct.pack("<Q", count))
+                f.flush()
+                os.fsync(f.fileno())
+        return count
+
+    def initialize(self, encodings, rolls):
+        """Create the store from existing rows unless another process already did."""
+        with self._lock:
+            if self.exists():
+                return False
+            self.append(encodings, rolls)
+            return True
+
+    def read(self):
+        """Return ``(encodings, rolls)`` for all committed rows.
+
+        ``encodings`` is a read-only float32 memmap; only rows added since the
+        previous call are decoded into ``rolls``.
+        """
+        count = self.count()
+        inode = os.stat(self.path).st_ino if count else None
+        if inode != self._inode:
+            # The store was created or rebuilt (e.g. re-migrated); start over
+            self._rows, self._labels, self._decoded, self._inode = None, np.empty(0, dtype=object), 0, inode
+        if not count:
+            return np.empty((0, self.dim), dtype=np.float32), np.empty(0, dtype=object)
+        if self._rows is None or len(self._rows) < count:
+            self._rows = np.memmap(self.path, dtype="<f4", mode="r", offset=HEADER_SIZE,
+                                   shape=(count, self.dim))
+        if self._decoded < count:
+            start = self._decoded
+            with open(self.labels_path, "rb") as f:
+                f.seek(start * LABEL_WIDTH)
+                raw = np.frombuffer(f.read((count - start) * LABEL_WIDTH), dtype=f"S{LABEL_WIDTH}")
+            # Earlier returned views end at their own count, so filling rows past it is safe
+            self._labels = _grown(self._labels, count)
+            self._labels[start:count] = [label.decode("utf-8") for label in raw]
+            self._decoded = count
+        return self._rows[:count], self._labels[:count]
@@ -0,0 +1,291 @@
+"""Bulk enrollment from a folder or zip of student photos.
+
+Usage: python enroll.py PHOTOS MAPPING.csv [--workers N] [--report out.csv] [--dry-run]
+
+``PHOTOS`` is a directory or a .zip of ID photos. ``MAPPING.csv`` has a
+``file`` column (a path inside PHOTOS, or just the file name) and a
+``roll_number`` column. Every roll number must already be on the roster.
+
+The webcam paths (add_faces.py, ``start_add_details``) encode one live frame
+at a time. Here the photos are decoded, detected and encoded in a process
+pool, with a bounded number in flight. A photo is rejected when it shows no
+face or several faces, and when its roll number is unknown. A sample that is
+nearly identical (distance below ``ENROLL_DEDUP_DISTANCE``) to one already
+kept for the same student is dropped as a duplicate, whether that sample is
+in the gallery or earlier in the batch. One that close to a *different*
+student is rejected as a likely mislabel. Everything kept is then appended
+to the gallery in a single atomic store write, so a failed run enrolls
+nobody.
+
+The same code backs ``POST /api/enroll/bulk``, which runs it as a
+background job whose progress is polled like bulk email jobs.
+"""
+import csv
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from gallery import ENCODING_DIM, get_gallery
+from matcher import pairwise_distances
+from notifier import BulkJob, register_job
+from recognition import detect_and_encode
+from roster import get_roster
+
+log = logging.getLogger(__name__)
+DEDUP_DISTANCE = float(os.environ.get("ENROLL_DEDUP_DISTANCE", "0.1"))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+FILE_COLUMNS = ("file", "filename", "image", "photo")
+ROLL_COLUMNS = ("roll_number", "roll")
+MATCH_CHUNK = 256
+
+
+class PhotoSource:
+    """Photos in a directory tree or a zip, looked up by relative path or file name."""
+
+    def __init__(self, path):
+        self.path = path
+        self._zip = zipfile.ZipFile(path) if zipfile.is_zipfile(path) else None
+        if self._zip is not None:
+            names = [n for n in self._zip.namelist() if not n.endswith("/")]
+        elif os.path.isdir(path):
+            names = [os.path.relpath(os.path.join(root, f), path).replace(os.sep, "/")
+                     for root, _, files in os.walk(path) for f in files]
+        else:
+            raise ValueError(f"{path} is neither a directory nor a zip file")
+        names = [n for n in names if n.lower().endswith(IMAGE_EXTENSIONS)]
+        self._by_path = {n: n for n in names}
+        self._by_name = {}
+        for name in names:
+            self._by_name.setdefault(os.path.basename(name), []).append(name)
+
+    def resolve(self, name):
+        """Stored name for ``name`` from the mapping, or None (missing or ambiguous)."""
+        name = name.strip().replace("\\", "/")
+        if name in self._by_path:
+            return name
+        candidates = self._by_name.get(os.path.basename(name), [])
+        return candidates[0] if len(candidates) == 1 else None
+
+    def read(self, name):
+        if self._zip is not None:
+            return self._zip.read(name)
+        with open(os.path.join(self.path, name), "rb") as f:
+            return f.read()
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+
+
+def read_mapping(data):
+    """``[(file, roll_number)]`` from CSV text with a file and a roll column."""
+    reader = csv.DictReader(io.StringIO(data))
+    fields = {f.strip().lower(): f for f in reader.fieldnames or []}
+    file_col = next((fields[c] for c in FILE_COLUMNS if c in fields), None)
+    roll_col = next((fields[c] for c in ROLL_COLUMNS if c in fields), None)
+    if file_col is None or roll_col is None:
+        raise ValueError("Mapping CSV needs a 'file' and a 'roll_number' column")
+    return [((row[file_col] or "").strip(), (row[roll_col] or "").strip()) for row in reader
+            if (row[file_col] or "").strip()]
+
+
+def _encode_all(source, items, executor, job, in_flight):
+    """Yield ``(index, future)`` in input order with at most ``in_flight`` pending.
+
+    Byte-identical files are marked duplicate here instead of being encoded.
+    """
+    pending, seen = deque(), {}
+    started = time.monotonic()
+
+    def finish():
+        index, future = pending.popleft()
+        future.exception()  # wait for it
+        encoded = job.info["encoded"] + 1
+        job.info.update(encoded=encoded, images_per_sec=round(encoded / (time.monotonic() - started), 2))
+        return index, future
+
+    for index, name in items:
+        data = source.read(name)
+        digest = hashlib.sha1(data).hexdigest()
+        if digest in seen:
+            job.update(index, "duplicate", f"Same file as {seen[digest]}")
+            continue
+        seen[digest] = name
+        pending.append((index, executor.submit(detect_and_encode, data)))
+        while pending and (len(pending) >= in_flight or pending[0][1].done()):
+            yield finish()
+    while pending:
+        yield finish()
+
+
+def _nearest_new(encodings, threshold):
+    """For each row, the index of an earlier kept row closer than ``threshold`` (or -1)."""
+    earlier = np.full(len(encodings), -1)
+    keep = np.ones(len(encodings), dtype=bool)
+    for start in range(0, len(encodings), MATCH_CHUNK):
+        distances = pairwise_distances(encodings[start:start + MATCH_CHUNK], encodings)
+        for k, i in enumerate(range(start, min(start + MATCH_CHUNK, len(encodings)))):
+            close = np.flatnonzero((distances[k, :i] < threshold) & keep[:i])
+            if close.size:
+                keep[i] = False
+                earlier[i] = close[0]
+    return earlier
+
+
+def enroll(source, mapping, executor, job=None, gallery=None, roster=None, in_flight=16,
+           dedup_distance=DEDUP_DISTANCE, dry_run=False, progress=None):
+    """Enroll the photos of ``mapping`` (``[(file, roll)]``) from ``source``.
+
+    Returns the BulkJob; each result ends as ``enrolled``, ``duplicate`` or
+    ``rejected``. ``progress`` is called with the job after each photo.
+    """
+    gallery = gallery or get_gallery()
+    roster = roster or get_roster()
+    if job is None:
+        job = BulkJob("enroll", [{"file": f, "roll": r, "status": "pending", "error": None} for f, r in mapping],
+                      save_interval=1.0)
+    job.state = "running"
+    job.info.update(encoded=0, images_per_sec=0.0, enrolled_encodings=0)
+    started = time.monotonic()
+    try:
+        todo = []
+        for index, (name, roll) in enumerate(mapping):
+            stored = source.resolve(name)
+            if not roll or roster.get(roll) is None:
+                job.update(index, "rejected", f"Unknown roll number {roll!r}")
+            elif stored is None:
+                job.update(index, "rejected", "File not found in photos (or ambiguous name)")
+            else:
+                todo.append((index, stored))
+
+        faces = {}
+        for index, future in _encode_all(source, todo, executor, job, in_flight):
+            try:
+                boxes, encodings = future.result()
+            except Exception as e:
+                job.update(index, "rejected", f"Image processing error: {e}")
+            else:
+                if len(boxes) != 1:
+                    job.update(index, "rejected", "No face found" if not boxes else f"{len(boxes)} faces found")
+                else:
+                    faces[index] = encodings[0]
+            if progress:
+                progress(job)
+
+        order = sorted(faces)
+        encodings = np.asarray([faces[i] for i in order], dtype=np.float32).reshape(-1, ENCODING_DIM)
+        rolls = [mapping[i][1] for i in order]
+        # Against the gallery: near-identical to the same student is a duplicate,
+        # to anyone else a probable mislabel
+        matcher = gallery.matcher()
+        existing = []
+        for start in range(0, len(encodings), MATCH_CHUNK):
+            existing.extend(matcher.match(encodings[start:start + MATCH_CHUNK]))
+        earlier = _nearest_new(encodings, dedup_distance)
+        keep = []
+        for k, index in enumerate(order):
+            match = existing[k]
+            if match.distance < dedup_distance and match.roll != rolls[k]:
+                job.update(index, "rejected", f"Same face as enrolled student {match.roll}")
+            elif match.distance < dedup_distance:
+                job.update(index, "duplicate", "Already in the gallery")
+            elif earlier[k] >= 0 and rolls[earlier[k]] != rolls[k]:
+                job.update(index, "rejected", f"Same face as {mapping[order[earlier[k]]][0]} "
+                                              f"(roll {rolls[earlier[k]]})")
+            elif earlier[k] >= 0:
+                job.update(index, "duplicate", f"Near-identical to {mapping[order[earlier[k]]][0]}")
+            else:
+                keep.append(k)
+        if not dry_run and keep:
+            gallery.add_many(encodings[keep], [rolls[k] for k in keep])
+        for k in keep:
+            job.update(order[k], "enrolled" if not dry_run else "accepted")
+        job.info.update(enrolled_encodings=0 if dry_run else len(keep),
+                        seconds=round(time.monotonic() - started, 2))
+        job.state = "done"
+    except Exception as e:
+        job.state = "failed"
+        job.info["error"] = str(e)
+        raise
+    finally:
+        job.save()
+    return job
+
+
+def start_enroll_job(archive_path, mapping, executor):
+    """Run ``enroll`` in a background thread; returns the registered job.
+
+    ``archive_path`` is a zip the caller hands over; it is deleted afterwards.
+    """
+    job = register_job(BulkJob("enroll", [{"file": f, "roll": r, "status": "pending", "error": None}
+                                          for f, r in mapping], save_interval=1.0))
+    job.state = "running"
+    job.save()
+
+    def run():
+        source = PhotoSource(archive_path)
+        try:
+            enroll(source, mapping, executor, job=job)
+        except Exception as e:
+            log.exception("Bulk enrollment %s failed: %s", job.id, e, extra={"job": job.id})
+        finally:
+            source.close()
+            os.remove(archive_path)
+
+    threading.Thread(target=run, name=f"enroll-{job.id[:8]}", daemon=True).start()
+    return job
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Enroll students from a folder or zip of photos")
+    parser.add_argument("photos", help="directory or .zip of photos")
+    parser.add_argument("mapping", help="CSV with file and roll_number columns")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--report", help="write per-photo results to this CSV")
+    parser.add_argument("--dry-run", action="store_true", help="check and encode, but do not write the gallery")
+    args = parser.parse_args()
+
+    with open(args.mapping, newline="") as f:
+        mapping = read_mapping(f.read())
+    source = PhotoSource(args.photos)
+    last = [0.0]
+
+    def progress(job):
+        now = time.monotonic()
+        if now - last[0] >= 1.0:
+            last[0] = now
+            print(f"  {job.info['encoded']}/{len(mapping)} photos, {job.info['images_per_sec']:.1f} photos/s",
+                  flush=True)
+
+    with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        job = enroll(source, mapping, executor, in_flight=args.workers * 4, dry_run=args.dry_run,
+                     progress=progress)
+    source.close()
+    snapshot = job.snapshot()
+    if args.report:
+        with open(args.report, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["file", "roll_number", "status", "reason"])
+            writer.writerows([r["file"], r["roll"], r["status"], r["error"] or ""] for r in snapshot["results"])
+    for r in snapshot["results"]:
+        if r["status"] == "rejected":
+            print(f"❌ {r['file']} ({r['roll']}): {r['error']}")
+    counts = snapshot["counts"]
+    print(f"✅ {counts.get('enrolled', counts.get('accepted', 0))} photos enrolled, "
+          f"{counts.get('duplicate', 0)} duplicates, {counts.get('rejected', 0)} rejected "
+          f"in {snapshot['info'].get('seconds', 0):.1f}s ({snapshot['info'].get('images_per_sec', 0):.1f} photos/s)")
+
+
+if __name__ == "__main__":
+    main()
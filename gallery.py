@@ -0,0 +1,230 @@
+"""Process-wide cache of the known face encodings.
+
+Encodings live in the append-only binary store (``data/encodings.f32``, see
+encoding_store.py). Until it has been migrated, the legacy
+``data/encodings.pkl`` pickle of ``(list_of_arrays, list_of_rolls)`` is read
+instead. Either way the gallery keeps one contiguous ``(N, 128)`` matrix with
+a parallel array of roll numbers and only reloads when the file changes.
+"""
+import logging
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+
+from compact import COMPACT_FILE, CompactMatcher, load_compact
+from encoding_store import STORE_FILE, EncodingStore
+from ivf import IVF_FILE, IVFMatcher, default_nlist, load_centroids, save_centroids, train_kmeans
+from locks import FileLock
+from matcher import ExhaustiveMatcher
+from prototypes import PROTOTYPES_FILE, PrototypeMatcher, load_prototypes
+
+ENCODINGS_FILE = "data/encodings.pkl"
+ENCODING_DIM = 128
+# "exhaustive" scans every sample; "prototype" screens per-student prototypes
+# first; "ivf" only searches the nearest k-means cells (approximate);
+# "compact" uses the deduplicated float16/PQ file from compact_gallery.py
+MATCH_INDEX = os.environ.get("FACE_MATCH_INDEX", "exhaustive")
+# Wait before training IVF centroids again after a failed run
+IVF_RETRY = 300.0
+
+log = logging.getLogger(__name__)
+
+
+def load_pickle(path=ENCODINGS_FILE):
+    """Read the legacy pickle as ``(float32 matrix, roll array)``."""
+    with open(path, "rb") as f:
+        known_encodings, known_rolls = pickle.load(f)
+    if len(known_encodings):
+        matrix = np.ascontiguousarray(np.vstack(known_encodings), dtype=np.float32)
+    else:
+        matrix = np.empty((0, ENCODING_DIM), dtype=np.float32)
+    return matrix, np.array([str(r) for r in known_rolls], dtype=object)
+
+
+class FaceGallery:
+    def __init__(self, path=ENCODINGS_FILE, store_path=STORE_FILE, index=MATCH_INDEX):
+        self.path = path
+        self.store = EncodingStore(store_path, ENCODING_DIM)
+        self.index = index
+        self._lock = threading.RLock()
+        self._stamp = None
+        self.encodings = np.empty((0, ENCODING_DIM), dtype=np.float32)
+        self.rolls = np.empty(0, dtype=object)
+        self._matcher = None
+        # IVF fallback state: matching exhaustively until centroids exist
+        self._ivf_pending = False
+        self._trains_in = None
+        self._training = None
+        self._retry_at = 0.0
+
+    def __len__(self):
+        return len(self.rolls)
+
+    def _file_stamp(self):
+        stamp = self.store.stat()
+        if stamp is not None:
+            return ("store",) + stamp
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return ("pickle", st.st_mtime_ns, st.st_size)
+
+    def _set(self, encodings, rolls, grown_from=None):
+        matcher = self._matcher
+        # Swap both arrays in one assignment so readers never see a torn pair
+        self.encodings, self.rolls = encodings, rolls
+        self._matcher = None
+        if grown_from is not None and matcher is not None and hasattr(matcher, "add"):
+            # Indexes that support insertion are updated, not rebuilt
+            matcher.add(encodings[grown_from:], rolls[grown_from:])
+            self._matcher = matcher
+
+    def refresh(self, force=False):
+        """Reload from disk if the file changed. Returns True if it reloaded."""
+        stamp = self._file_stamp()
+        if not force and stamp == self._stamp:
+            return False
+        with self._lock:
+            stamp = self._file_stamp()
+            if not force and stamp == self._stamp:
+                return False
+            if stamp is None:
+                self._set(np.empty((0, ENCODING_DIM), dtype=np.float32), np.empty(0, dtype=object))
+            elif stamp[0] == "store":
+                # The store only grows, so keep the matcher and feed it new rows
+                grown_from = len(self.rolls) if self._stamp and self._stamp[0] == "store" else None
+                encodings, rolls = self.store.read()
+                if grown_from is not None and (force or len(rolls) < grown_from):
+                    grown_from = None
+                self._set(encodings, rolls, grown_from)
+            else:
+                self._set(*load_pickle(self.path))
+            self._stamp = stamp
+            return True
+
+    def snapshot(self):
+        """Return a consistent ``(encodings, rolls)`` pair, reloading if stale."""
+        self.refresh()
+        with self._lock:
+            return self.encodings, self.rolls
+
+    def matcher(self):
+        """Return a matcher over the current encodings, rebuilt after reloads."""
+        self.refresh()
+        with self._lock:
+            if self._ivf_pending and os.path.exists(IVF_FILE):
+                # Centroids were saved (by a worker or build_index.py): switch to IVF
+                self._matcher = None
+            if self._matcher is None:
+                self._matcher = self._build_matcher()
+            if self._ivf_pending and self._trains_in == os.getpid():
+                self._start_training()
+            return self._matcher
+
+    def _build_matcher(self):
+        self._ivf_pending = False
+        if self.index == "prototype":
+            # Prefer prototypes rebuilt offline; fall back to per-roll means
+            prototypes = load_prototypes(PROTOTYPES_FILE, len(self.rolls)) or (None, None)
+            return PrototypeMatcher(self.encodings, self.rolls, *prototypes)
+        if self.index == "ivf":
+            centroids = load_centroids(IVF_FILE)
+            if centroids is not None or not len(self.rolls):
+                return IVFMatcher(self.encodings, self.rolls, centroids)
+            # Training takes seconds at district scale; never do it inside a request
+            log.warning("%s is missing; matching exhaustively until IVF centroids are trained. "
+                        "Run `python build_index.py --ivf` after large enrollments.", IVF_FILE)
+            self._ivf_pending = True
+            return ExhaustiveMatcher(self.encodings, self.rolls)
+        if self.index == "compact":
+            # Without a (current) compact file, compact in memory to float16
+            return CompactMatcher(self.encodings, self.rolls, load_compact(COMPACT_FILE, len(self.rolls)))
+        if self.index != "exhaustive":
+            raise ValueError(f"Unknown match index: {self.index}")
+        return ExhaustiveMatcher(self.encodings, self.rolls)
+
+    def train_ivf(self):
+        """Train missing IVF centroids in a background thread of this process.
+
+        Call it after any fork (``train_missing_index``): the preloading
+        master must not start threads. Workers take turns through a file
+        lock, so the centroids are trained once and every worker switches
+        to the IVF index when it sees them. A failed run is retried after
+        ``IVF_RETRY`` seconds.
+        """
+        with self._lock:
+            self._trains_in = os.getpid()
+        self.matcher()
+
+    def _start_training(self):
+        # A thread inherited across a fork is no longer alive, so the child trains itself
+        if (self._training is not None and self._training.is_alive()) or time.monotonic() < self._retry_at:
+            return
+        encodings, rolls = self.encodings, self.rolls
+
+        def run():
+            try:
+                with FileLock(IVF_FILE + ".lock"):
+                    # Another worker may have trained them while we waited
+                    if not os.path.exists(IVF_FILE):
+                        log.info("Training IVF centroids over %d encodings", len(rolls))
+                        save_centroids(IVF_FILE, train_kmeans(np.asarray(encodings, dtype=np.float32),
+                                                              default_nlist(len(rolls))))
+            except Exception:
+                log.exception("Training IVF centroids failed")
+                with self._lock:
+                    self._retry_at = time.monotonic() + IVF_RETRY
+            finally:
+                with self._lock:
+                    self._training = None
+
+        self._training = threading.Thread(target=run, name="ivf-train", daemon=True)
+        self._training.start()
+
+    def migrate(self):
+        """Copy the legacy pickle into the binary store if it is not there yet."""
+        if self.store.exists() or not os.path.exists(self.path):
+            return 0
+        encodings, rolls = load_pickle(self.path)
+        return len(rolls) if self.store.initialize(encodings, rolls) else 0
+
+    def add(self, encodings, roll):
+        """Append encodings for ``roll`` to the store (atomic, O(new rows))."""
+        return self.add_many(encodings, [roll] * len(encodings))
+
+    def add_many(self, encodings, rolls):
+        """Append rows for several students in one atomic store write."""
+        if not len(encodings):
+            return 0
+        new = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        with self._lock:
+            self.migrate()
+            self.store.append(new, [str(roll) for roll in rolls])
+            self.refresh()
+        return len(new)
+
+
+_gallery = None
+_gallery_lock = threading.Lock()
+
+
+def get_gallery():
+    """Return the shared gallery, loading it on first use."""
+    global _gallery
+    if _gallery is None:
+        with _gallery_lock:
+            if _gallery is None:
+                gallery = FaceGallery()
+                gallery.refresh()
+                _gallery = gallery
+    return _gallery
+
+
+def train_missing_index():
+    """Per-process start-up hook: train the IVF index in the background if it is missing."""
+    if MATCH_INDEX == "ivf":
+        get_gallery().train_ivf()
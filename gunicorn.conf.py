@@ -0,0 +1,27 @@
+"""Production server settings, all overridable from the environment.
+
+The app is preloaded in the master (``preload_app``), so the face gallery
+is loaded once and shared copy-on-write by the forked workers. Attendance,
+students and the email queue are shared through SQLite (db.py); encoding
+writes are coordinated with file locks (encoding_store.py).
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get("WEB_WORKERS", min(4, multiprocessing.cpu_count())))
+# Threaded workers: MJPEG feeds and email-status polls are long or frequent
+# requests that must not block recognition calls
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", "8"))
+preload_app = True
+timeout = int(os.environ.get("WEB_TIMEOUT", "120"))
+graceful_timeout = 30
+accesslog = os.environ.get("ACCESS_LOG", "-")
+
+
+def post_worker_init(worker):
+    # Threads start per worker, after the fork: dlib warm-up (FACE_WARMUP),
+    # the attendance rollup and missing IVF centroids (FACE_MATCH_INDEX=ivf)
+    from app import start_worker_jobs
+    start_worker_jobs()
@@ -0,0 +1,148 @@
+"""Inverted-file (IVF) approximate nearest-neighbour index in pure NumPy.
+
+A k-means coarse quantizer splits the gallery into ``nlist`` cells. A probe
+is only compared with the encodings in its ``nprobe`` nearest cells, so
+district-scale galleries (hundreds of thousands of rows) avoid a full scan.
+New enrollments are inserted into their nearest cell without retraining.
+Centroids can be trained offline with ``python build_index.py --ivf``.
+"""
+import os
+
+import numpy as np
+
+from matcher import TOLERANCE, _grown, pairwise_distances, resolve_matches
+
+IVF_FILE = "data/ivf.npz"
+NPROBE = 4
+TRAIN_SAMPLE = 50000
+
+
+def default_nlist(n):
+    return int(max(1, min(4 * np.sqrt(n), n // 8 or 1)))
+
+
+def train_kmeans(encodings, nlist, iterations=10, seed=0):
+    """Lloyd's k-means on (a sample of) ``encodings``; returns the centroids."""
+    rng = np.random.default_rng(seed)
+    data = encodings
+    if len(data) > TRAIN_SAMPLE:
+        data = data[rng.choice(len(data), TRAIN_SAMPLE, replace=False)]
+    nlist = min(nlist, len(data))
+    centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = pairwise_distances(data, centroids).argmin(axis=1)
+        counts = np.bincount(assign, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty cells from random points so every list gets used
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+    return centroids
+
+
+def save_centroids(path, centroids):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, centroids=centroids)
+    os.replace(tmp_path, path)
+
+
+def load_centroids(path):
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return data["centroids"]
+
+
+class IVFMatcher:
+    """Approximate matcher searching the ``nprobe`` nearest k-means cells.
+
+    Rows live in buffers that double their capacity when full, so inserting
+    an enrollment costs O(new rows) amortized instead of a gallery copy.
+    Only the first ``size`` rows are live.
+    """
+
+    def __init__(self, encodings, rolls, centroids=None, nlist=None, nprobe=NPROBE):
+        encodings = np.ascontiguousarray(encodings)
+        rolls = np.asarray(rolls, dtype=object).astype(str).astype(object)
+        if centroids is None:
+            if len(rolls):
+                centroids = train_kmeans(encodings, nlist or default_nlist(len(rolls)))
+            else:
+                centroids = np.zeros((1, encodings.shape[1]))
+        self.centroids = np.ascontiguousarray(centroids, dtype=encodings.dtype)
+        self.centroids_sq = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        self.nprobe = nprobe
+        self._label_of = {}
+        self._encodings = encodings
+        self._rolls = rolls
+        self._labels = self._labels_for(rolls)
+        self.size = len(rolls)
+        assign = self._assign(encodings)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(self.centroids))]
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def encodings(self):
+        return self._encodings[:self.size]
+
+    @property
+    def rolls(self):
+        return self._rolls[:self.size]
+
+    @property
+    def labels(self):
+        return self._labels[:self.size]
+
+    def _labels_for(self, rolls):
+        return np.array([self._label_of.setdefault(r, len(self._label_of)) for r in rolls], dtype=np.int64)
+
+    def _assign(self, encodings):
+        if not len(encodings):
+            return np.empty(0, dtype=np.int64)
+        return pairwise_distances(encodings, self.centroids, self.centroids_sq).argmin(axis=1)
+
+    def add(self, encodings, rolls):
+        """Insert new rows into their nearest cells without retraining."""
+        new = np.asarray(encodings, dtype=self._encodings.dtype).reshape(-1, self._encodings.shape[1])
+        start, end = self.size, self.size + len(new)
+        rolls = np.array([str(r) for r in rolls], dtype=object)
+        # Rows past ``size`` are invisible to match(), so fill them in before publishing
+        self._encodings = _grown(self._encodings, end)
+        self._rolls = _grown(self._rolls, end)
+        self._labels = _grown(self._labels, end)
+        self._encodings[start:end] = new
+        self._rolls[start:end] = rolls
+        self._labels[start:end] = self._labels_for(rolls)
+        assign = self._assign(new)
+        for cell in np.unique(assign):
+            rows = start + np.flatnonzero(assign == cell)
+            self.lists[cell] = np.concatenate([self.lists[cell], rows])
+        self.size = end
+
+    def match(self, probes, tolerance=TOLERANCE):
+        if not len(probes):
+            return []
+        probes = np.asarray(probes, dtype=self._encodings.dtype).reshape(len(probes), -1)
+        # Read the live count first: every buffer seen afterwards holds at least that many rows
+        size = self.size
+        encodings, rolls, labels = self._encodings, self._rolls, self._labels
+        d_cells = pairwise_distances(probes, self.centroids, self.centroids_sq)
+        nprobe = min(self.nprobe, len(self.centroids))
+        cells = np.argpartition(d_cells, nprobe - 1, axis=1)[:, :nprobe]
+        results = []
+        for probe, probe_cells in zip(probes, cells):
+            rows = np.concatenate([self.lists[c] for c in probe_cells])
+            rows = rows[rows < size]
+            d = pairwise_distances(probe[None, :], encodings[rows])
+            results.extend(resolve_matches(d, labels[rows], rolls[rows], tolerance))
+        return results
@@ -0,0 +1,131 @@
+"""Deferred imports for the recognition stack, and a background warm-up.
+
+``import face_recognition`` loads dlib and its model files, which takes
+seconds and hundreds of MB. OpenCV, NumPy and PIL add more. app.py used to
+import all of them at module top, so every process paid that cost before
+serving anything, including workers that only ever render the login page.
+
+``LazyModule`` stands in for a module and imports it on first attribute
+access. ``lazy_callable`` stands in for a function or class imported from a
+heavy module. The first request that needs recognition therefore pays for
+the import; to keep that cost off user requests, ``start_warm_up`` loads
+the models in a background thread shortly after the server starts
+accepting requests. ``FACE_WARMUP`` controls this:
+
+- ``background`` (default): a daemon thread warms up after
+  ``FACE_WARMUP_DELAY`` seconds.
+- ``preload``: create_app loads everything in the master before the
+  workers fork, so they share the model pages.
+- ``off``: loading happens on first use.
+"""
+import importlib
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+WARMUP = os.environ.get("FACE_WARMUP", "background")
+WARMUP_DELAY = float(os.environ.get("FACE_WARMUP_DELAY", "2.0"))
+
+
+class LazyModule:
+    """Proxy that imports ``name`` the first time one of its attributes is used."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._error = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """The imported module, or None if it failed to import."""
+        if self._module is None and self._error is None:
+            with self._lock:
+                if self._module is None and self._error is None:
+                    try:
+                        self._module = importlib.import_module(self._name)
+                    except Exception as e:  # ImportError, or a broken native build
+                        self._error = e
+        return self._module
+
+    def available(self):
+        return self.load() is not None
+
+    def loaded(self):
+        """True once imported; never triggers the import."""
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        module = self.load()
+        if module is None:
+            raise ImportError(f"{self._name} is not available: {self._error}")
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r} ({'loaded' if self._module is not None else 'not loaded'})>"
+
+
+def lazy_callable(module, name):
+    """Stand-in for ``from module import name`` that imports on first call."""
+    target = []
+
+    def call(*args, **kwargs):
+        if not target:
+            target.append(getattr(importlib.import_module(module), name))
+        return target[0](*args, **kwargs)
+
+    call.__name__ = call.__qualname__ = name
+    call.__doc__ = f"Calls {module}.{name}, importing {module} on first use."
+    return call
+
+
+# Shared proxies, so every module triggers (and waits for) the same import
+cv2 = LazyModule("cv2")
+face_recognition = LazyModule("face_recognition")
+np = LazyModule("numpy")
+
+_warm = {"state": "idle", "seconds": None, "error": None}
+_warm_lock = threading.Lock()
+
+
+def warm_up(modules=()):
+    """Import the recognition stack and ``modules``, touch the dlib models, load the gallery."""
+    started = time.monotonic()
+    _warm["state"] = "running"
+    try:
+        for name in modules:
+            importlib.import_module(name)
+        numpy = np.load()
+        cv2.load()
+        if face_recognition.available() and numpy is not None:
+            # A first detection and encoding pages in the HOG and ResNet weights
+            blank = numpy.zeros((150, 150, 3), dtype=numpy.uint8)
+            face_recognition.face_locations(blank)
+            face_recognition.face_encodings(blank, [(0, 150, 150, 0)])
+        from gallery import get_gallery
+        get_gallery().matcher()
+        _warm.update(state="done", seconds=round(time.monotonic() - started, 3))
+    except Exception as e:
+        _warm.update(state="failed", error=str(e), seconds=round(time.monotonic() - started, 3))
+        log.warning("Warm-up failed: %s", e)
+
+
+def start_warm_up(modules=(), delay=WARMUP_DELAY, mode=WARMUP):
+    """Warm up once per process in a daemon thread (``mode == "background"``)."""
+    with _warm_lock:
+        if mode != "background" or _warm["state"] != "idle":
+            return False
+        _warm["state"] = "scheduled"
+
+    def run():
+        time.sleep(delay)
+        warm_up(modules)
+
+    threading.Thread(target=run, name="warm-up", daemon=True).start()
+    return True
+
+
+def warm_up_status():
+    return {**_warm, "loaded": {m._name: m.loaded() for m in (cv2, face_recognition, np)}}
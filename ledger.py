@@ -0,0 +1,218 @@
+"""Per-day attendance ledger backed by the ``attendance`` table.
+
+The set of rolls already marked for the day lives in memory, so checking a
+recognised face is O(1) instead of a database round trip. Writes go through
+one ``BEGIN IMMEDIATE`` transaction per batch. The ``UNIQUE (roll_number,
+date)`` constraint guarantees a roll is never recorded twice for a day, in
+this or any other worker. Before deciding, the ledger catches up on rows
+that other workers inserted, reading only rows newer than the last seen id.
+Each new mark also updates the student's running figures (analytics.py) in
+the same transaction.
+
+``query_attendance``, ``attendance_page`` and ``daily_summaries`` answer
+history/report queries from the indexed tables.
+"""
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from analytics import record_mark
+from db import CSV_EXPORT, append_csv, from_iso, get_db, to_iso, transaction
+
+ATTENDANCE_DIR = "Attendance"
+COLUMNS = ['ROLL', 'NAME', 'STANDARD', 'TIME']
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def attendance_path(date, directory=ATTENDANCE_DIR):
+    """Path of the legacy/exported CSV for ``date`` (dd-mm-YYYY)."""
+    return os.path.join(directory, f"Attendance_{date}.csv")
+
+
+def today():
+    return datetime.now().strftime("%d-%m-%Y")
+
+
+class AttendanceLedger:
+    def __init__(self, date, db_path=None):
+        self.date = date
+        self.iso_date = to_iso(date)
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._last_id = 0
+        self.times = {}
+        self.rows = []
+        with self._lock:
+            self._catch_up(get_db(self.db_path))
+
+    def __contains__(self, roll):
+        return str(roll) in self.times
+
+    def __len__(self):
+        return len(self.times)
+
+    def _catch_up(self, conn):
+        """Read rows inserted since our last look (by us or another worker)."""
+        for row in conn.execute("SELECT id, roll_number, name, standard, time FROM attendance "
+                                "WHERE date = ? AND id > ? ORDER BY id", (self.iso_date, self._last_id)):
+            roll = row["roll_number"]
+            if roll not in self.times:
+                self.times[roll] = row["time"]
+                self.rows.append([roll, row["name"], row["standard"], row["time"]])
+            self._last_id = row["id"]
+
+    def refresh(self):
+        with self._lock:
+            self._catch_up(get_db(self.db_path))
+
+    def mark_many(self, entries):
+        """Mark ``(roll, name, standard, time)`` entries in one transaction.
+
+        Returns the subset of entries that were newly written; rolls already
+        present for the day (in this or any worker) are skipped.
+        """
+        entries = [tuple(str(v) for v in e) for e in entries]
+        if all(e[0] in self.times for e in entries):
+            return []
+        conn = get_db(self.db_path)
+        written = []
+        with self._lock:
+            with transaction(conn):
+                for entry in entries:
+                    if entry[0] in self.times:
+                        continue
+                    cur = conn.execute("INSERT OR IGNORE INTO attendance (roll_number, date, name, standard, time) "
+                                       "VALUES (?, ?, ?, ?, ?)", (entry[0], self.iso_date) + entry[1:])
+                    if cur.rowcount:
+                        written.append(entry)
+                        record_mark(conn, entry[0], self.iso_date, entry[3])
+                self._catch_up(conn)
+        if written and CSV_EXPORT:
+            append_csv(attendance_path(self.date), COLUMNS, written)
+        return written
+
+    def mark(self, roll, name, standard, timestamp):
+        """Mark one roll; returns True if it was not marked yet today."""
+        return bool(self.mark_many([(roll, name, standard, timestamp)]))
+
+
+def _filters(start=None, end=None, standard=None, roll=None):
+    clauses, params = [], []
+    if start:
+        clauses.append("date >= ?")
+        params.append(to_iso(start))
+    if end:
+        clauses.append("date <= ?")
+        params.append(to_iso(end))
+    if standard is not None:
+        clauses.append("standard = ?")
+        params.append(str(standard))
+    if roll is not None:
+        clauses.append("roll_number = ?")
+        params.append(str(roll))
+    return clauses, params
+
+
+def query_attendance(date=None, start=None, end=None, standard=None, roll=None, db_path=None):
+    """Attendance rows as dicts (date in dd-mm-YYYY), oldest first.
+
+    Filter by one ``date`` or an inclusive ``start``..``end`` range, and
+    optionally by ``standard`` and/or ``roll``.
+    """
+    clauses, params = _filters(start, end, standard, roll)
+    if date:
+        clauses.append("date = ?")
+        params.append(to_iso(date))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = get_db(db_path).execute(
+        f"SELECT date, roll_number, name, standard, time FROM attendance {where} ORDER BY date, id", params)
+    return [{"date": from_iso(r["date"]), "roll": r["roll_number"], "name": r["name"],
+             "standard": r["standard"], "time": r["time"]} for r in rows]
+
+
+def encode_cursor(date, row_id):
+    return f"{date}.{row_id}"
+
+
+def decode_cursor(cursor):
+    date, _, row_id = cursor.partition(".")
+    return to_iso(date), int(row_id)
+
+
+def attendance_page(start=None, end=None, standard=None, roll=None, cursor=None, limit=PAGE_SIZE,
+                    db_path=None):
+    """One page of attendance rows, newest first, plus the next cursor.
+
+    Keyset pagination on ``(date, id)``: each page is an index range scan
+    however deep the client has paged. Dates in the result are ISO.
+    """
+    clauses, params = _filters(start, end, standard, roll)
+    if cursor:
+        date, row_id = decode_cursor(cursor)
+        clauses.append("(date < ? OR (date = ? AND id < ?))")
+        params += [date, date, row_id]
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = get_db(db_path).execute(
+        f"SELECT id, date, roll_number, name, standard, time FROM attendance {where} "
+        "ORDER BY date DESC, id DESC LIMIT ?", params + [limit + 1]).fetchall()
+    next_cursor = encode_cursor(rows[limit - 1]["date"], rows[limit - 1]["id"]) if len(rows) > limit else None
+    records = [{"date": r["date"], "roll": r["roll_number"], "name": r["name"],
+                "standard": r["standard"], "time": r["time"]} for r in rows[:limit]]
+    return records, next_cursor
+
+
+def daily_summaries(start=None, end=None, standard=None, db_path=None):
+    """Present counts per day (and per standard) from ``daily_summary``.
+
+    Returns ``[{"date": ISO, "present": n, "by_standard": {std: n}}]``,
+    oldest first: one small record per day for calendar views.
+    """
+    clauses, params = _filters(start, end, standard)
+    clauses.append("present > 0")
+    rows = get_db(db_path).execute(
+        f"SELECT date, standard, present FROM daily_summary WHERE {' AND '.join(clauses)} "
+        "ORDER BY date, standard", params)
+    days = {}
+    for r in rows:
+        day = days.setdefault(r["date"], {"date": r["date"], "present": 0, "by_standard": {}})
+        day["present"] += r["present"]
+        day["by_standard"][r["standard"]] = r["present"]
+    return list(days.values())
+
+
+def attendance_times(date, db_path=None):
+    """``{roll: time}`` for one day; served from memory for open ledgers."""
+    ledger = _ledgers.get(date)
+    if ledger is not None:
+        ledger.refresh()
+        return dict(ledger.times)
+    rows = get_db(db_path).execute("SELECT roll_number, time FROM attendance WHERE date = ?", (to_iso(date),))
+    return {r["roll_number"]: r["time"] for r in rows}
+
+
+# Today's ledger stays open; other dates (backfills, history views) share a
+# small LRU so a long-running worker doesn't keep every day it has touched
+OTHER_LEDGERS = 4
+_ledgers = OrderedDict()
+_ledgers_lock = threading.Lock()
+
+
+def get_ledger(date=None):
+    """Return the shared ledger for ``date`` (dd-mm-YYYY, default today)."""
+    current = today()
+    date = date or current
+    if date == current:
+        ledger = _ledgers.get(date)
+        if ledger is not None:
+            return ledger
+    with _ledgers_lock:
+        ledger = _ledgers.get(date)
+        if ledger is None:
+            ledger = _ledgers[date] = AttendanceLedger(date)
+        _ledgers.move_to_end(date)
+        others = [d for d in _ledgers if d != current]
+        for stale in others[:max(0, len(others) - OTHER_LEDGERS)]:
+            del _ledgers[stale]
+    return ledger
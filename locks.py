@@ -0,0 +1,74 @@
+"""Cross-process file locks (fcntl on POSIX, msvcrt on Windows).
+
+Used wherever several workers or scripts may write the same data file.
+"""
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Exclusive lock on ``path``; also serialises threads of this process."""
+
+    _thread_locks = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        with FileLock._registry_lock:
+            self._thread_lock = FileLock._thread_locks.setdefault(self.path, threading.RLock())
+        self._file = None
+        self._depth = 0
+
+    def acquire(self, blocking=True):
+        """Take the lock; with ``blocking=False`` return False if it is held elsewhere."""
+        if not self._thread_lock.acquire(blocking):
+            return False
+        self._depth += 1
+        if self._depth > 1:
+            return True
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            if blocking:
+                raise
+            self._file.close()
+            self._file = None
+            self._depth -= 1
+            self._thread_lock.release()
+            return False
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+                else:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            finally:
+                self._file.close()
+                self._file = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
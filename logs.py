@@ -0,0 +1,77 @@
+"""Structured logging for the web app and its background threads.
+
+Server-side failures used to be ``print`` calls, so they had no level or
+timestamp and could not be filtered. Modules now log through
+``logging.getLogger(__name__)`` and pass fields with ``extra={...}``.
+``configure_logging`` (called when app.py is imported) adds a single
+handler to the root logger that writes those fields along with each
+message:
+
+- ``LOG_FORMAT=text`` (default) writes
+  ``2024-06-01 09:00:00,123 INFO app: Attendance marked roll='12' path='api'``.
+- ``LOG_FORMAT=json`` writes one JSON object per line, for log shippers.
+
+``LOG_LEVEL`` sets the root level (default INFO). If the root logger
+already has a handler, for example one set up by the embedding server or
+test runner, it is left alone.
+"""
+import json
+import logging
+import os
+import time
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+
+# Attributes every LogRecord has; anything else on a record came from ``extra``
+_STANDARD = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def extra_fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _STANDARD and not k.startswith("_")}
+
+
+class KeyValueFormatter(logging.Formatter):
+    """``time LEVEL logger: message key=value ...``"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        record.message = record.getMessage()
+        record.asctime = self.formatTime(record)
+        line = self.formatMessage(record)
+        fields = extra_fields(record)
+        if fields:
+            line += " " + " ".join(f"{k}={v!r}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message and extra fields."""
+
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **extra_fields(record),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    """Install the structured handler on the root logger once."""
+    root = logging.getLogger()
+    if root.handlers:
+        return False
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if fmt == "json" else KeyValueFormatter())
+    root.addHandler(handler)
+    root.setLevel(level)
+    return True
@@ -0,0 +1,122 @@
+"""Vectorized nearest-identity matching against the face gallery.
+
+``face_recognition.compare_faces`` checks one probe at a time and the callers
+then took the *first* encoding inside tolerance. Here every probe face in a
+frame is compared to the whole gallery with a single ``(B, D) @ (D, N)``
+product and the nearest encoding wins.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+TOLERANCE = 0.5
+UNKNOWN = "Unknown"
+
+# roll: matched roll number or UNKNOWN
+# distance: euclidean distance to the nearest gallery encoding
+# margin: gap between the best identity and the best *other* identity
+Match = namedtuple("Match", ["roll", "distance", "margin"])
+
+
+def pairwise_distances(probes, encodings, encodings_sq=None):
+    """Euclidean distances between every probe row and every gallery row."""
+    probes = np.asarray(probes, dtype=encodings.dtype).reshape(-1, encodings.shape[1])
+    if encodings_sq is None:
+        encodings_sq = np.einsum("ij,ij->i", encodings, encodings)
+    probes_sq = np.einsum("ij,ij->i", probes, probes)
+    d2 = probes_sq[:, None] + encodings_sq[None, :] - 2.0 * (probes @ encodings.T)
+    np.maximum(d2, 0.0, out=d2)
+    return np.sqrt(d2, out=d2)
+
+
+def resolve_matches(distances, labels, rolls, tolerance=TOLERANCE):
+    """Turn a ``(B, N)`` distance matrix into one Match per probe.
+
+    ``labels`` maps each gallery row to an integer identity so the margin can
+    be measured against the closest encoding of a *different* student.
+    """
+    if distances.shape[1] == 0:
+        return [Match(UNKNOWN, float("inf"), 0.0) for _ in range(distances.shape[0])]
+    rows = np.arange(distances.shape[0])
+    best = distances.argmin(axis=1)
+    best_dist = distances[rows, best]
+    same = labels[None, :] == labels[best][:, None]
+    second_dist = np.where(same, np.inf, distances).min(axis=1)
+    results = []
+    for i in rows:
+        dist = float(best_dist[i])
+        roll = str(rolls[best[i]]) if dist <= tolerance else UNKNOWN
+        results.append(Match(roll, dist, float(second_dist[i] - dist)))
+    return results
+
+
+def _grown(array, needed):
+    """``array`` if it holds ``needed`` rows, else a copy with double the capacity."""
+    if len(array) >= needed:
+        return array
+    grown = np.empty((max(needed, 2 * len(array)),) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class ExhaustiveMatcher:
+    """Brute-force matcher over every gallery encoding.
+
+    The rows it was built from are kept as given (for the gallery, the
+    shared memory-mapped store). Rows added later go into a tail buffer with
+    its own norms. Roll and label arrays double their capacity, so an
+    enrollment costs O(new rows) amortized. Only the first ``size`` rows
+    are live.
+    """
+
+    def __init__(self, encodings, rolls):
+        self.encodings = np.ascontiguousarray(encodings)
+        self.encodings_sq = np.einsum("ij,ij->i", self.encodings, self.encodings)
+        rolls = np.asarray(rolls, dtype=object)
+        names, labels = np.unique(rolls.astype(str), return_inverse=True)
+        self._label_of = {name: i for i, name in enumerate(names)}
+        self._rolls = rolls
+        self._labels = labels.astype(np.int64)
+        self.tail = np.empty((0, self.encodings.shape[1]), dtype=self.encodings.dtype)
+        self.tail_sq = np.empty(0, dtype=self.encodings.dtype)
+        self.size = len(rolls)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def rolls(self):
+        return self._rolls[:self.size]
+
+    @property
+    def labels(self):
+        return self._labels[:self.size]
+
+    def add(self, encodings, rolls):
+        """Append rows without touching (or copying) the ones already indexed."""
+        new = np.asarray(encodings, dtype=self.encodings.dtype).reshape(-1, self.encodings.shape[1])
+        start, end = self.size, self.size + len(new)
+        base = len(self.encodings)
+        # Rows past ``size`` are invisible to match(), so fill them in before publishing
+        self.tail = _grown(self.tail, end - base)
+        self.tail_sq = _grown(self.tail_sq, end - base)
+        self._rolls = _grown(self._rolls, end)
+        self._labels = _grown(self._labels, end)
+        self.tail[start - base:end - base] = new
+        self.tail_sq[start - base:end - base] = np.einsum("ij,ij->i", new, new)
+        self._rolls[start:end] = [str(r) for r in rolls]
+        self._labels[start:end] = [self._label_of.setdefault(str(r), len(self._label_of)) for r in rolls]
+        self.size = end
+
+    def match(self, probes, tolerance=TOLERANCE):
+        """Return one Match per probe encoding, in input order."""
+        if not len(probes):
+            return []
+        # Read the live count first: every buffer seen afterwards holds at least that many rows
+        size = self.size
+        tail, tail_sq, labels, rolls = self.tail, self.tail_sq, self._labels, self._rolls
+        distances = pairwise_distances(probes, self.encodings, self.encodings_sq)
+        added = size - len(self.encodings)
+        if added:
+            distances = np.hstack([distances, pairwise_distances(probes, tail[:added], tail_sq[:added])])
+        return resolve_matches(distances, labels[:size], rolls[:size], tolerance)
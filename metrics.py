@@ -0,0 +1,297 @@
+"""In-process hot-path metrics: stage timers, latency histograms, counters.
+
+``gen_attendance_frames`` used to print and email failures went to a log
+file, so there was no way to tell where a frame's time went. The hot paths
+(``/api/mark_attendance``, the batch API and the realtime stream) now wrap
+each stage in ``timed(path, stage)``. The stages are decode, detect,
+encode, match, ledger (attendance write), notify (queueing the email),
+send (the SMTP send) and jpeg (stream encoding). Durations go into
+fixed-bucket histograms, and faces, frames and emails are counted.
+
+``GET /metrics`` serves everything in the Prometheus text format.
+``GET /debug/metrics`` serves the same as JSON with percentiles, per-second
+rates over the last minute and the unknown-face rate. Gauges (queue depths,
+open streams) are callbacks evaluated at scrape time.
+
+A timer costs two ``perf_counter`` calls, a bisect and a short lock, about
+1.5-2 us; a counter increment about 0.5 us. A typical realtime frame
+records about 8 us of metrics, and a frame that marks a new face about
+20 us. Against the cheapest frame work (colour conversion and JPEG encode,
+about 1.2 ms, no detection) that is about 0.7% typical and 1.6% worst
+case. Detection alone takes tens of ms, so on real frames it stays under
+0.1%, and it is about 0.03% of the 15 fps frame interval
+(``benchmarks/bench_metrics.py``). Only the standard library is used, so
+importing this does not undo lazy startup. Figures are per process: with
+several gunicorn workers, each scrape sees the worker that answered it.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, deque
+
+PREFIX = "attendance_"
+# Latency buckets in seconds, 0.5 ms to 10 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RATE_WINDOW = 60.0
+STARTED = time.time()
+
+
+class Counter:
+    """Monotonic count that also remembers enough history for a 1-minute rate."""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+        # (time, value before the first increment of that second)
+        self._samples = deque(maxlen=int(RATE_WINDOW) + 1)
+        self._next_sample = 0.0
+
+    def inc(self, amount=1):
+        now = time.monotonic()
+        # Explicit acquire/release costs about half a ``with`` block on these hot paths
+        lock = self._lock
+        lock.acquire()
+        try:
+            if now >= self._next_sample:
+                self._samples.append((now, self.value))
+                self._next_sample = now + 1.0
+            self.value += amount
+        finally:
+            lock.release()
+
+    def rate(self):
+        """Increments per second over the last minute."""
+        now = time.monotonic()
+        with self._lock:
+            recent = [s for s in self._samples if now - s[0] <= RATE_WINDOW]
+            if not recent:
+                return 0.0
+            since, base = recent[0]
+            return (self.value - base) / max(now - since, 1.0)
+
+
+class Histogram:
+    """Counts of observations per bucket (upper bounds, seconds)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        lock = self._lock
+        lock.acquire()
+        try:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+        finally:
+            lock.release()
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile (inf past the last)."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return None
+        rank, seen = q * total, 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Family:
+    """A named metric with one child per combination of label values."""
+
+    def __init__(self, name, help, kind, labels, factory):
+        self.name = PREFIX + name
+        self.help = help
+        self.kind = kind
+        self.label_names = labels
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._factory())
+        return child
+
+    def children(self):
+        with self._lock:
+            return list(self._children.items())
+
+
+class Gauge:
+    """Value read from ``fn`` at scrape time: a number, or ``{label values: number}``."""
+
+    def __init__(self, name, help, fn, labels=()):
+        self.name = PREFIX + name
+        self.help = help
+        self.kind = "gauge"
+        self.label_names = labels
+        self.fn = fn
+
+    def children(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if isinstance(value, dict):
+            return sorted(value.items())
+        return [((), value)]
+
+
+_families = OrderedDict()
+_families_lock = threading.Lock()
+
+
+def _register(metric):
+    with _families_lock:
+        return _families.setdefault(metric.name, metric)
+
+
+def counter(name, help, labels=()):
+    return _register(Family(name, help, "counter", labels, Counter))
+
+
+def histogram(name, help, labels=(), buckets=LATENCY_BUCKETS):
+    return _register(Family(name, help, "histogram", labels, lambda: Histogram(buckets)))
+
+
+def gauge(name, help, fn, labels=()):
+    """Register (or replace) a callback gauge."""
+    metric = Gauge(name, help, fn, labels)
+    with _families_lock:
+        _families[metric.name] = metric
+    return metric
+
+
+STAGE_SECONDS = histogram("stage_seconds", "Time spent in each hot-path stage", ("path", "stage"))
+FACES = counter("faces_total", "Faces matched against the gallery", ("path", "result"))
+FRAMES = counter("frames_total", "Realtime stream frames by outcome", ("outcome",))
+EMAILS = counter("emails_total", "Emails by sender (queue or bulk) and outcome", ("source", "result"))
+
+
+# (path, stage) -> STAGE_SECONDS child, and (path, result) -> FACES child, so
+# the hot paths skip Family.labels()
+_stage_histograms = {}
+_face_counters = {}
+
+
+class timed:
+    """``with timed("api", "decode"):`` adds the block's duration to STAGE_SECONDS."""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, path, stage):
+        histogram = _stage_histograms.get((path, stage))
+        if histogram is None:
+            histogram = _stage_histograms[(path, stage)] = STAGE_SECONDS.labels(path, stage)
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+def count_faces(path, matches, unknown="Unknown"):
+    """Count matched faces as recognized or unknown."""
+    unknown_count = [m.roll for m in matches].count(unknown)
+    if unknown_count:
+        _face_counter(path, "unknown").inc(unknown_count)
+    if len(matches) > unknown_count:
+        _face_counter(path, "recognized").inc(len(matches) - unknown_count)
+
+
+def _face_counter(path, result):
+    counter = _face_counters.get((path, result))
+    if counter is None:
+        counter = _face_counters[(path, result)] = FACES.labels(path, result)
+    return counter
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (0.0.4)."""
+    lines = []
+    with _families_lock:
+        families = list(_families.values())
+    for family in families:
+        lines.append(f"# HELP {family.name} {family.help}")
+        lines.append(f"# TYPE {family.name} {family.kind}")
+        for values, child in family.children():
+            if family.kind == "histogram":
+                with child._lock:
+                    counts, total, count = list(child.counts), child.sum, child.count
+                cumulative = 0
+                for bound, n in zip(child.buckets + (float("inf"),), counts):
+                    cumulative += n
+                    lines.append(f"{family.name}_bucket{_labels(family.label_names, values, [('le', _number(bound))])} "
+                                 f"{cumulative}")
+                lines.append(f"{family.name}_sum{_labels(family.label_names, values)} {_number(total)}")
+                lines.append(f"{family.name}_count{_labels(family.label_names, values)} {count}")
+            elif family.kind == "counter":
+                lines.append(f"{family.name}{_labels(family.label_names, values)} {child.value}")
+            else:
+                lines.append(f"{family.name}{_labels(family.label_names, values)} {_number(child)}")
+    lines.append(f"# HELP {PREFIX}uptime_seconds Seconds since this process started")
+    lines.append(f"# TYPE {PREFIX}uptime_seconds gauge")
+    lines.append(f"{PREFIX}uptime_seconds {_number(round(time.time() - STARTED, 3))}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot():
+    """JSON-friendly summary: stage percentiles (ms), counter totals and rates, gauges."""
+    def ms(value):
+        return None if value is None else (None if value == float("inf") else round(value * 1000.0, 3))
+
+    stages = {}
+    for (path, stage), h in STAGE_SECONDS.children():
+        stages.setdefault(path, {})[stage] = {
+            "count": h.count, "mean_ms": round(h.sum / h.count * 1000.0, 3) if h.count else None,
+            "p50_ms": ms(h.quantile(0.5)), "p95_ms": ms(h.quantile(0.95)), "p99_ms": ms(h.quantile(0.99))}
+    counters, gauges = {}, {}
+    with _families_lock:
+        families = list(_families.values())
+    for family in families:
+        if family.kind == "counter":
+            counters[family.name] = {"/".join(values) or "total": {"total": c.value, "per_sec": round(c.rate(), 3)}
+                                     for values, c in family.children()}
+        elif family.kind == "gauge":
+            gauges[family.name] = {"/".join(map(str, values)) or "value": v for values, v in family.children()}
+    faces = {values: c for values, c in FACES.children()}
+    rates = {}
+    for path in sorted({p for p, _ in faces}):
+        known = faces.get((path, "recognized"))
+        unknown = faces.get((path, "unknown"))
+        total = (known.value if known else 0) + (unknown.value if unknown else 0)
+        per_sec = (known.rate() if known else 0.0) + (unknown.rate() if unknown else 0.0)
+        rates[path] = {"faces": total, "faces_per_sec": round(per_sec, 3),
+                       "unknown_rate": round((unknown.value if unknown else 0) / total, 4) if total else None}
+    return {"uptime_seconds": round(time.time() - STARTED, 1), "stages": stages, "faces": rates,
+            "counters": counters, "gauges": gauges}
@@ -0,0 +1,38 @@
+"""Convert data/encodings.pkl into the append-only binary store.
+
+Usage: python migrate_encodings.py [--force]
+
+The pickle is left in place as a backup. ``--force`` rebuilds the store from
+the pickle even if it already exists (stop the app first).
+"""
+import argparse
+import os
+
+from encoding_store import STORE_FILE, EncodingStore
+from gallery import ENCODINGS_FILE, load_pickle
+
+parser = argparse.ArgumentParser(description="Migrate encodings.pkl to encodings.f32")
+parser.add_argument("--pickle", default=ENCODINGS_FILE)
+parser.add_argument("--store", default=STORE_FILE)
+parser.add_argument("--force", action="store_true", help="rebuild an existing store")
+args = parser.parse_args()
+
+if not os.path.exists(args.pickle):
+    raise SystemExit(f"No pickle found at {args.pickle}")
+
+store = EncodingStore(args.store)
+if store.exists() and not args.force:
+    raise SystemExit(f"{args.store} already exists ({store.count()} rows); use --force to rebuild")
+
+encodings, rolls = load_pickle(args.pickle)
+# Build next to the target, then swap both files in
+tmp = EncodingStore(args.store + ".new")
+for path in (tmp.path, tmp.labels_path):
+    if os.path.exists(path):
+        os.remove(path)
+tmp.append(encodings, rolls)
+os.replace(tmp.labels_path, store.labels_path)
+os.replace(tmp.path, store.path)
+if os.path.exists(tmp.path + ".lock"):
+    os.remove(tmp.path + ".lock")
+print(f"✅ Migrated {len(rolls)} encodings for {len(set(rolls))} students to {args.store}")
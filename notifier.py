@@ -0,0 +1,540 @@
+"""Background email notifications with a pooled SMTP session.
+
+Request handlers and the video stream only *enqueue* a notification; a
+worker thread sends it over a reused, already-authenticated SMTP connection
+and retries with exponential backoff. Jobs are rows of the ``notifications``
+table, so they survive a restart, and each notification carries a dedup
+key (e.g. one arrival email per roll per day) that the table keeps unique
+per date. With several worker processes, every worker can enqueue but only
+one of them sends.
+
+Bulk absentee emails run as a background job over a small pool of
+long-lived connections with bounded concurrency; callers get a job id back
+immediately and poll its per-recipient progress.
+"""
+import json
+import logging
+import os
+import smtplib
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from db import get_db, to_iso, transaction
+from locks import FileLock
+from metrics import EMAILS, timed
+
+SMTP_HOST = os.environ.get("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
+# No defaults: the account and its app password must come from the environment
+SMTP_USER = os.environ.get("SMTP_USER", "")
+SMTP_PASS = os.environ.get("SMTP_PASS", "")
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "1") == "1"
+# SMTP_AUTH=0 skips the login (and the password), e.g. for a local test server
+SMTP_AUTH = os.environ.get("SMTP_AUTH", "1") == "1"
+SMTP_TIMEOUT = 15
+# Idle connections older than this are probed with NOOP before reuse
+SMTP_IDLE_CHECK = 60
+
+# Held by the one worker process that sends queued emails
+SENDER_LOCK = "data/notify_sender.lock"
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 300.0
+# How often the sender looks for jobs queued by other worker processes
+POLL_INTERVAL = 1.0
+# Concurrent SMTP sessions used by bulk jobs, and how many finished jobs to remember
+BULK_CONCURRENCY = 3
+BULK_JOBS_KEPT = 50
+# An absence still 'sending' after this many seconds was claimed by a worker
+# that died or restarted mid-job; the next click claims it again
+ABSENCE_CLAIM_TIMEOUT = 900.0
+JOBS_DIR = "data/jobs"
+ERROR_LOG = os.environ.get("EMAIL_ERROR_LOG", "data/email_errors.log")
+
+
+class _ErrorFile(logging.FileHandler):
+    """File handler that creates the log's directory on the first write."""
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+log = logging.getLogger(__name__)
+# Email failures still go to their own file as well as the main log
+_error_file = _ErrorFile(ERROR_LOG, delay=True)
+_error_file.setLevel(logging.ERROR)
+_error_file.setFormatter(logging.Formatter("[%(asctime)s] %(message)s"))
+log.addHandler(_error_file)
+
+
+def log_email_error(message, **fields):
+    log.error(message, extra=fields)
+
+
+class SMTPNotConfigured(RuntimeError):
+    """SMTP_USER (and SMTP_PASS, unless SMTP_AUTH=0) are not set."""
+
+
+def build_message(to, subject, body, sender=SMTP_USER):
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = to
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+
+class SMTPPool:
+    """Up to ``size`` logged-in SMTP connections, reused across messages."""
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, user=SMTP_USER, password=SMTP_PASS,
+                 starttls=SMTP_STARTTLS, size=1, timeout=SMTP_TIMEOUT, auth=SMTP_AUTH):
+        self.host, self.port = host, port
+        self.user, self.password = user, password
+        self.starttls = starttls
+        self.auth = auth
+        self.timeout = timeout
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.connects = 0
+
+    def configured(self):
+        return bool(self.user and (self.password or not self.auth))
+
+    def check_configured(self):
+        if not self.configured():
+            raise SMTPNotConfigured("Email is not configured: set SMTP_USER and SMTP_PASS "
+                                    "(or SMTP_AUTH=0 for a server without login)")
+
+    def _connect(self):
+        self.check_configured()
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        server.ehlo()
+        if self.starttls:
+            server.starttls()
+            server.ehlo()
+        if self.auth:
+            server.login(self.user, self.password)
+        self.connects += 1
+        return server
+
+    def _checkout(self):
+        with self._lock:
+            while self._idle:
+                server, last_used = self._idle.pop()
+                if time.monotonic() - last_used < SMTP_IDLE_CHECK:
+                    return server
+                try:
+                    if server.noop()[0] == 250:
+                        return server
+                except (smtplib.SMTPException, OSError):
+                    pass
+                self._discard(server)
+        return self._connect()
+
+    def _discard(self, server):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def send(self, msg, to):
+        """Send ``msg`` to ``to``; reconnects once if the session went away.
+
+        Returns the ``sendmail`` result (a dict of refused recipients).
+        """
+        with self._slots:
+            server = self._checkout()
+            try:
+                try:
+                    refused = server.sendmail(self.user, to, msg.as_string())
+                except smtplib.SMTPServerDisconnected:
+                    server = self._connect()
+                    refused = server.sendmail(self.user, to, msg.as_string())
+            except Exception:
+                self._discard(server)
+                raise
+            with self._lock:
+                self._idle.append((server, time.monotonic()))
+            return refused
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._discard(server)
+
+
+class Notifier:
+    """Background sender draining the ``notifications`` table.
+
+    Any worker process may enqueue: jobs are inserted as ``pending`` rows, and
+    the ``UNIQUE (date, key)`` constraint drops a second email for the same
+    dedup key no matter which worker queued it. Exactly one process, the
+    holder of the sender lock, sends them. It polls the table for rows from
+    other workers, and another worker takes over if it exits.
+    """
+
+    def __init__(self, pool=None, db_path=None, sender_lock=SENDER_LOCK):
+        self.pool = pool or SMTPPool()
+        self.db_path = db_path
+        self._cond = threading.Condition()
+        self._sender_lock = FileLock(sender_lock)
+        self._thread = None
+        self._warned_unconfigured = False
+        self.leader = False
+        self.stats = {"queued": 0, "sent": 0, "failed": 0, "retries": 0}
+
+    def enqueue(self, to, subject, body, key=None, date=None):
+        """Queue an email. Returns False if ``key`` was already sent or queued."""
+        date = date or datetime.now().strftime("%d-%m-%Y")
+        now = time.time()
+        cur = get_db(self.db_path).execute(
+            "INSERT OR IGNORE INTO notifications (kind, date, key, recipient, subject, body, status, "
+            "next_attempt, created, updated) VALUES ('email', ?, ?, ?, ?, ?, 'pending', ?, ?, ?)",
+            (to_iso(date), key, to, subject, body, now, now, now))
+        if not cur.rowcount:
+            return False
+        self.stats["queued"] += 1
+        EMAILS.labels("queue", "queued").inc()
+        with self._cond:
+            self._cond.notify()
+        self.start()
+        return True
+
+    def notify_arrival(self, roll, name, standard, email, timestamp, date=None):
+        """Queue the parent's arrival email, at most once per roll per day."""
+        if not email:
+            return False
+        body = f"Your ward '{name}' of standard '{standard}' is present at school at {timestamp}."
+        return self.enqueue(email, 'School Arrival Notification', body,
+                            key=f"arrival:{roll}", date=date)
+
+    def queue_depth(self):
+        return get_db(self.db_path).execute(
+            "SELECT COUNT(*) FROM notifications WHERE kind = 'email' AND status IN ('pending', 'sending')"
+        ).fetchone()[0]
+
+    def start(self):
+        if not self.pool.configured():
+            # Jobs stay pending; the first enqueue after SMTP is configured starts the sender
+            if not self._warned_unconfigured:
+                self._warned_unconfigured = True
+                log.warning("Not sending queued emails: SMTP_USER and SMTP_PASS are not set")
+            return
+        if self._thread is None:
+            with self._cond:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="notifier", daemon=True)
+                    self._thread.start()
+
+    def _claim_next(self, conn):
+        """Mark the next due row as ``sending`` and return it, or the wait time."""
+        now = time.time()
+        with transaction(conn):
+            row = conn.execute("SELECT * FROM notifications WHERE status = 'pending' AND kind = 'email' "
+                               "ORDER BY next_attempt LIMIT 1").fetchone()
+            if row is None:
+                return None, POLL_INTERVAL
+            if row["next_attempt"] > now:
+                return None, min(POLL_INTERVAL, row["next_attempt"] - now)
+            conn.execute("UPDATE notifications SET status = 'sending', updated = ? WHERE id = ?", (now, row["id"]))
+        return row, 0
+
+    def _next_job(self, conn):
+        while True:
+            row, wait = self._claim_next(conn)
+            if row is not None:
+                return row
+            with self._cond:
+                self._cond.wait(wait)
+
+    def _set(self, conn, job_id, **fields):
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        conn.execute(f"UPDATE notifications SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def _run(self):
+        # Wait to become the one sending process; held until this thread exits
+        while not self._sender_lock.acquire(blocking=False):
+            time.sleep(POLL_INTERVAL)
+        self.leader = True
+        try:
+            self._send_loop()
+        except Exception:
+            log.exception("Email sender stopped after repeated errors; another worker or the next "
+                          "queued email restarts it")
+        finally:
+            # Let another worker (or the next enqueue here) take over
+            self.leader = False
+            self._sender_lock.release()
+            with self._cond:
+                self._thread = None
+
+    def _send_loop(self):
+        """Send jobs forever; a database error backs off and retries, and too many in a row raise."""
+        conn = get_db(self.db_path)
+        recovered = False
+        errors = 0
+        while True:
+            try:
+                if not recovered:
+                    # A previous sender may have died mid-send; try those again
+                    conn.execute("UPDATE notifications SET status = 'pending' WHERE status = 'sending' "
+                                 "AND kind = 'email'")
+                    recovered = True
+                self._send_next(conn)
+                errors = 0
+            except Exception as e:
+                errors += 1
+                if errors >= MAX_ATTEMPTS:
+                    raise
+                delay = min(BACKOFF_MAX, BACKOFF_BASE ** errors)
+                log.warning("Email sender error, retrying in %.0f s: %s", delay, e, exc_info=True,
+                            extra={"errors": errors})
+                time.sleep(delay)
+
+    def _send_next(self, conn):
+        job = self._next_job(conn)
+        try:
+            msg = build_message(job["recipient"], job["subject"], job["body"], self.pool.user)
+            with timed("notifier", "send"):
+                self.pool.send(msg, job["recipient"])
+        except Exception as e:
+            attempts = job["attempts"] + 1
+            if attempts < MAX_ATTEMPTS:
+                self.stats["retries"] += 1
+                EMAILS.labels("queue", "retried").inc()
+                delay = min(BACKOFF_MAX, BACKOFF_BASE ** attempts)
+                self._set(conn, job["id"], status="pending", attempts=attempts,
+                          next_attempt=time.time() + delay, error=str(e))
+                return
+            self.stats["failed"] += 1
+            EMAILS.labels("queue", "failed").inc()
+            log_email_error(f"Giving up on email to {job['recipient']} ({job['subject']}) after "
+                            f"{attempts} attempts: {e}\n{traceback.format_exc()}",
+                            recipient=job["recipient"], attempts=attempts)
+            self._set(conn, job["id"], status="failed", attempts=attempts, error=str(e))
+            return
+        self.stats["sent"] += 1
+        EMAILS.labels("queue", "sent").inc()
+        self._set(conn, job["id"], status="sent", attempts=job["attempts"] + 1, error=None)
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+
+def get_notifier():
+    """Return the shared notifier, starting its worker on first use."""
+    global _notifier
+    if _notifier is None:
+        with _notifier_lock:
+            if _notifier is None:
+                _notifier = Notifier()
+                _notifier.start()
+    return _notifier
+
+
+class BulkJob:
+    """Progress of one bulk send, readable while it runs.
+
+    Every update is also written to ``data/jobs/<id>.json`` so a status poll
+    answered by a different worker process sees the same progress.
+    """
+
+    def __init__(self, kind, results, directory=JOBS_DIR, save_interval=0.0):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.created = datetime.now().isoformat(timespec="seconds")
+        self.results = results
+        self.path = os.path.join(directory, f"{self.id}.json")
+        # Jobs with thousands of items save at most every save_interval seconds
+        self.save_interval = save_interval
+        self.state = None   # overrides the derived running/done state when set
+        self.info = {}      # job-specific figures included in snapshots
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._saved = 0.0
+        self._remaining = sum(1 for r in results if r["status"] == "pending")
+        self.save()
+
+    def update(self, index, status, error=None):
+        with self._lock:
+            self.results[index].update(status=status, error=error)
+            self._remaining -= 1
+            final = not self._remaining
+        self.save(force=final)
+
+    def save(self, force=True):
+        if not force and time.monotonic() - self._saved < self.save_interval:
+            return
+        # Serialised so a slower writer never replaces a newer snapshot
+        with self._save_lock:
+            self._saved = time.monotonic()
+            snapshot = self.snapshot()
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.path)
+
+    def snapshot(self):
+        with self._lock:
+            results = [dict(r) for r in self.results]
+            counts = {}
+            for r in results:
+                counts[r["status"]] = counts.get(r["status"], 0) + 1
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "created": self.created,
+                "state": self.state or ("running" if self._remaining else "done"),
+                "total": len(results),
+                "counts": counts,
+                "info": dict(self.info),
+                "results": results,
+            }
+
+
+def _prune_job_files(directory=JOBS_DIR, keep=BULK_JOBS_KEPT):
+    try:
+        paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".json")]
+    except OSError:
+        return
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+_bulk_pool = None
+_bulk_executor = None
+_bulk_jobs = OrderedDict()
+_bulk_lock = threading.Lock()
+
+
+def _claim_absences(date, rolls, db_path=None):
+    """Claim ``absence:<roll>`` keys for ``date``; returns the rolls claimed.
+
+    A roll already sent, or being sent by an earlier click in any worker, is
+    not claimed. One that failed before, or whose claim is older than
+    ``ABSENCE_CLAIM_TIMEOUT`` (its worker died), is claimed again.
+    """
+    conn = get_db(db_path)
+    iso_date, now, claimed = to_iso(date), time.time(), set()
+    with transaction(conn):
+        for roll in rolls:
+            key = f"absence:{roll}"
+            cur = conn.execute("INSERT OR IGNORE INTO notifications (kind, date, key, status, created, updated) "
+                               "VALUES ('absence', ?, ?, 'sending', ?, ?)", (iso_date, key, now, now))
+            if not cur.rowcount:
+                cur = conn.execute("UPDATE notifications SET status = 'sending', updated = ? "
+                                   "WHERE date = ? AND key = ? AND (status = 'failed' "
+                                   "OR (status = 'sending' AND updated < ?))",
+                                   (now, iso_date, key, now - ABSENCE_CLAIM_TIMEOUT))
+            if cur.rowcount:
+                claimed.add(roll)
+    return claimed
+
+
+def _bulk_send(job, index, date, roll, msg, to):
+    conn = get_db()
+    key = (to_iso(date), f"absence:{roll}")
+    try:
+        with timed("bulk_email", "send"):
+            _bulk_pool.send(msg, to)
+    except Exception as e:
+        EMAILS.labels("bulk", "failed").inc()
+        log_email_error(f"Error sending absence email to {to}: {e}", recipient=to, roll=roll)
+        # A later click may retry this parent
+        conn.execute("UPDATE notifications SET status = 'failed', error = ?, attempts = attempts + 1, "
+                     "updated = ? WHERE date = ? AND key = ?", (str(e), time.time(), *key))
+        job.update(index, "failed", str(e))
+    else:
+        EMAILS.labels("bulk", "sent").inc()
+        conn.execute("UPDATE notifications SET status = 'sent', recipient = ?, attempts = attempts + 1, "
+                     "updated = ? WHERE date = ? AND key = ?", (to, time.time(), *key))
+        job.update(index, "sent")
+
+
+def register_job(job):
+    """Make ``job`` visible to ``get_bulk_job`` (memory and job files)."""
+    with _bulk_lock:
+        _bulk_jobs[job.id] = job
+        while len(_bulk_jobs) > BULK_JOBS_KEPT:
+            _bulk_jobs.popitem(last=False)
+    _prune_job_files()
+    return job
+
+
+def send_absent_notifications(absent_students, selected_date):
+    """Start a background job emailing absentees' parents; returns the BulkJob.
+
+    Rolls already notified for ``selected_date``, or still being sent by an
+    earlier click in any worker, are skipped.
+    """
+    global _bulk_pool, _bulk_executor
+    with _bulk_lock:
+        if _bulk_executor is None:
+            _bulk_pool = SMTPPool(size=BULK_CONCURRENCY)
+            _bulk_executor = ThreadPoolExecutor(BULK_CONCURRENCY, thread_name_prefix="bulk-email")
+    # Fail before any absence is claimed, so a later click can still send them
+    _bulk_pool.check_configured()
+    wanted = [str(s['roll_number']) for s in absent_students if s.get('parent_email')]
+    claimed = _claim_absences(selected_date, wanted)
+    results, to_send = [], []
+    for s in absent_students:
+        roll = str(s['roll_number'])
+        email = str(s.get('parent_email', '') or '')
+        result = {"roll": roll, "name": s['full_name'], "email": email, "status": "pending", "error": None}
+        if not email:
+            result.update(status="failed", error="No email provided")
+        elif roll not in claimed:
+            result.update(status="skipped", error="Already notified")
+        else:
+            claimed.discard(roll)
+            to_send.append((len(results), roll, email, s))
+        results.append(result)
+    job = register_job(BulkJob("absence", results))
+    for index, roll, email, s in to_send:
+        body = (f"Your ward '{s['full_name']}' of standard '{s['standard']}' was absent to school "
+                f"today ({selected_date}).")
+        msg = build_message(email, 'School Absence Notification', body, _bulk_pool.user)
+        _bulk_executor.submit(_bulk_send, job, index, selected_date, roll, msg, email)
+    return job
+
+
+def absences_notified(date, db_path=None):
+    """Rolls whose parents were sent an absence email for ``date``."""
+    rows = get_db(db_path).execute("SELECT key FROM notifications WHERE kind = 'absence' AND date = ? "
+                                   "AND status = 'sent'", (to_iso(date),))
+    return {r["key"].split(":", 1)[1] for r in rows}
+
+
+def get_bulk_job(job_id, directory=JOBS_DIR):
+    """Snapshot of a bulk job started by any worker, or None."""
+    with _bulk_lock:
+        job = _bulk_jobs.get(job_id)
+    if job is not None:
+        return job.snapshot()
+    if not job_id.isalnum():
+        return None
+    try:
+        with open(os.path.join(directory, f"{job_id}.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
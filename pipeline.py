@@ -0,0 +1,196 @@
+"""Decoupled capture / recognise / stream pipeline for the realtime feed.
+
+The old generator read a frame, ran detection, encoding and matching, then
+JPEG-encoded it and slept a fixed 80 ms, so the video ran at recognition
+speed. Here each stage has its own thread and pace:
+
+* capture   - reads the camera as fast as it delivers, keeping only the
+              latest frame;
+* recognise - repeatedly takes the *latest* frame (stale ones are dropped)
+              and publishes the resulting boxes and labels;
+* stream    - draws the most recent boxes onto every new live frame and
+              JPEG-encodes it, waiting for the next frame instead of sleeping.
+
+Every stage keeps its own fps meter, exposed via ``stats()``. Frame counts
+by outcome, the whole recognise step and JPEG encoding also go to the
+process-wide metrics (``/metrics``).
+"""
+import threading
+import time
+
+from lazy import cv2
+from metrics import FRAMES, timed
+
+FRAME_SIZE = (480, 360)
+STREAM_MAX_FPS = 15
+JPEG_QUALITY = 80
+
+
+class FpsMeter:
+    """Exponentially smoothed rate of ``tick()`` calls."""
+
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+        self.fps = 0.0
+        self.count = 0
+        self._last = None
+
+    def tick(self):
+        now = time.monotonic()
+        if self._last is not None and now > self._last:
+            rate = 1.0 / (now - self._last)
+            self.fps = rate if not self.fps else (1 - self.alpha) * self.fps + self.alpha * rate
+        self._last = now
+        self.count += 1
+
+
+class LatestSlot:
+    """Single-slot mailbox: writers overwrite, readers wait for a newer item."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self.seq = 0
+        self.closed = False
+
+    def put(self, item):
+        with self._cond:
+            self._item = item
+            self.seq += 1
+            self._cond.notify_all()
+
+    def get(self, after_seq=0, timeout=1.0):
+        """Return ``(seq, item)`` newer than ``after_seq``, or None on timeout/close."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.seq > after_seq or self.closed, timeout):
+                return None
+            if self.seq <= after_seq:
+                return None
+            return self.seq, self._item
+
+    def peek(self):
+        with self._cond:
+            return self._item
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+def draw_overlays(frame, overlays):
+    for (top, right, bottom, left), label in overlays:
+        cv2.rectangle(frame, (left, top), (right, bottom), (50, 50, 255), 2)
+        cv2.putText(frame, label, (left, top - 10), cv2.FONT_HERSHEY_COMPLEX, 1, (255, 255, 255), 2)
+
+
+class RecognitionPipeline:
+    """Runs ``recognize(frame) -> [(box, label), ...]`` beside a live stream.
+
+    ``source`` is anything with ``read() -> (ok, frame)``, e.g. a
+    ``cv2.VideoCapture``. If ``recognize`` has a ``stats()`` method its
+    counters are included in ``stats()``.
+    """
+
+    def __init__(self, source, recognize, frame_size=FRAME_SIZE, max_fps=STREAM_MAX_FPS):
+        self.source = source
+        self.recognize = recognize
+        self.frame_size = frame_size
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.frames = LatestSlot()
+        self.overlays = LatestSlot()
+        self.meters = {"capture": FpsMeter(), "recognize": FpsMeter(), "stream": FpsMeter()}
+        self.dropped = 0
+        self.error = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for name, target in (("capture", self._capture), ("recognize", self._recognize)):
+            thread = threading.Thread(target=target, name=f"pipeline-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.frames.close()
+        self.overlays.close()
+        for thread in self._threads:
+            thread.join(timeout=2.0)
+
+    def _capture(self):
+        try:
+            while not self._stop.is_set():
+                success, frame = self.source.read()
+                if not success:
+                    self.error = "Failed to read frame from camera."
+                    break
+                if self.frame_size and (frame.shape[1], frame.shape[0]) != self.frame_size:
+                    frame = cv2.resize(frame, self.frame_size)
+                self.frames.put(frame)
+                self.meters["capture"].tick()
+                FRAMES.labels("captured").inc()
+        finally:
+            self.frames.close()
+
+    def _recognize(self):
+        seen = 0
+        while not self._stop.is_set():
+            latest = self.frames.get(seen)
+            if latest is None:
+                if self.frames.closed:
+                    break
+                continue
+            seq, frame = latest
+            # Everything captured while we were busy is skipped
+            skipped = max(0, seq - seen - 1)
+            if skipped:
+                self.dropped += skipped
+                FRAMES.labels("dropped").inc(skipped)
+            seen = seq
+            try:
+                with timed("stream", "recognize"):
+                    overlays = self.recognize(frame)
+            except Exception as e:
+                self.error = f"Recognition error: {e}"
+                continue
+            self.overlays.put(overlays)
+            self.meters["recognize"].tick()
+            FRAMES.labels("recognized").inc()
+
+    def stream(self):
+        """Yield JPEG bytes of live frames with the latest overlays drawn on."""
+        seen = 0
+        next_due = 0.0
+        while not self._stop.is_set():
+            latest = self.frames.get(seen)
+            if latest is None:
+                if self.frames.closed:
+                    break
+                continue
+            seen, frame = latest
+            # Adaptive pacing: wait for a fresh frame, but never exceed max_fps
+            now = time.monotonic()
+            if now < next_due:
+                time.sleep(next_due - now)
+            next_due = max(now, next_due) + self.min_interval
+            frame = frame.copy()
+            draw_overlays(frame, self.overlays.peek() or [])
+            with timed("stream", "jpeg"):
+                ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+            if ok:
+                self.meters["stream"].tick()
+                FRAMES.labels("streamed").inc()
+                yield buffer.tobytes()
+
+    def stats(self):
+        extra = getattr(self.recognize, "stats", None)
+        return {
+            **(extra() if extra else {}),
+            **{f"{name}_fps": round(meter.fps, 1) for name, meter in self.meters.items()},
+            "frames_captured": self.meters["capture"].count,
+            "frames_recognized": self.meters["recognize"].count,
+            "frames_dropped_by_recognizer": self.dropped,
+            "error": self.error,
+        }
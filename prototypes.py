@@ -0,0 +1,221 @@
+"""Compact per-student prototype index with two-stage search.
+
+Every student has up to 20 raw encodings in the gallery. Stage one screens
+probes against one or a few prototype vectors per roll (the mean, or
+k-medoids of the samples); stage two re-checks only the raw samples of the
+``top_k`` closest students. Prototypes can be precomputed offline with::
+
+    python build_index.py --method kmedoids --per-student 3
+"""
+import os
+
+import numpy as np
+
+from matcher import TOLERANCE, _grown, pairwise_distances, resolve_matches
+
+PROTOTYPES_FILE = "data/prototypes.npz"
+TOP_K = 5
+
+
+def _kmedoids(samples, k, iterations=10):
+    """Pick ``k`` medoid rows of ``samples`` (small m, so full distances are fine)."""
+    d = pairwise_distances(samples, samples)
+    # Start from the overall medoid and add farthest points
+    medoids = [int(d.sum(axis=1).argmin())]
+    while len(medoids) < k:
+        medoids.append(int(d[:, medoids].min(axis=1).argmax()))
+    medoids = np.array(medoids)
+    for _ in range(iterations):
+        assign = d[:, medoids].argmin(axis=1)
+        updated = medoids.copy()
+        for c in range(k):
+            members = np.flatnonzero(assign == c)
+            if len(members):
+                updated[c] = members[d[np.ix_(members, members)].sum(axis=1).argmin()]
+        if np.array_equal(updated, medoids):
+            break
+        medoids = updated
+    return samples[medoids]
+
+
+def build_prototypes(encodings, rolls, per_student=1, method="mean"):
+    """Return ``(prototypes, prototype_rolls)`` summarising each roll's samples."""
+    rolls = np.asarray(rolls, dtype=object).astype(str)
+    protos, proto_rolls = [], []
+    for roll in np.unique(rolls):
+        samples = encodings[rolls == roll]
+        if method == "mean" or per_student <= 1:
+            chosen = samples.mean(axis=0, keepdims=True)
+        elif method == "kmedoids":
+            chosen = _kmedoids(samples, min(per_student, len(samples)))
+        else:
+            raise ValueError(f"Unknown prototype method: {method}")
+        protos.append(chosen)
+        proto_rolls.extend([roll] * len(chosen))
+    if not protos:
+        return np.empty((0, encodings.shape[1]), dtype=encodings.dtype), np.empty(0, dtype=object)
+    return np.vstack(protos).astype(encodings.dtype), np.array(proto_rolls, dtype=object)
+
+
+def save_prototypes(path, prototypes, prototype_rolls, source_count, method):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, prototypes=prototypes, rolls=np.asarray(prototype_rolls, dtype=str),
+             source_count=source_count, method=method)
+    os.replace(tmp_path, path)
+
+
+def load_prototypes(path, source_count):
+    """Load prototypes built from a gallery of ``source_count`` rows, else None."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        if int(data["source_count"]) != source_count:
+            return None
+        return data["prototypes"], data["rolls"].astype(object)
+
+
+class PrototypeMatcher:
+    """Screen against prototypes, then match exactly within the top-k students.
+
+    Enrollments are added in place, as in ExhaustiveMatcher: raw samples go
+    to a tail buffer and every buffer doubles its capacity. A student with
+    one (mean) prototype has it updated as a running mean. A student with
+    several (k-medoids) gets the mean of the new samples as one more. A new
+    student starts with their mean. Only the first ``size`` samples and
+    ``prototype_count`` prototypes are live.
+    """
+
+    def __init__(self, encodings, rolls, prototypes=None, prototype_rolls=None, top_k=TOP_K):
+        self.encodings = np.ascontiguousarray(encodings)
+        rolls = np.asarray(rolls, dtype=object).astype(str).astype(object)
+        if prototypes is None:
+            prototypes, prototype_rolls = build_prototypes(self.encodings, rolls)
+        self._prototypes = np.array(prototypes, dtype=self.encodings.dtype).reshape(-1, self.encodings.shape[1])
+        self._prototypes_sq = np.einsum("ij,ij->i", self._prototypes, self._prototypes)
+        self._prototype_rolls = np.asarray(prototype_rolls, dtype=object).astype(str).astype(object)
+        self.prototype_count = len(self._prototype_rolls)
+        self.top_k = top_k
+        self._protos_of = {}
+        for i, roll in enumerate(self._prototype_rolls):
+            self._protos_of.setdefault(roll, []).append(i)
+        self._per_student = max((len(v) for v in self._protos_of.values()), default=1)
+        # Row indices of each student's raw samples, for the exact second stage
+        names, labels = np.unique(rolls.astype(str), return_inverse=True)
+        order = np.argsort(labels, kind="stable")
+        bounds = np.searchsorted(labels[order], np.arange(len(names) + 1))
+        self._rows = {name: order[bounds[i]:bounds[i + 1]] for i, name in enumerate(names)}
+        self._label_of = {name: i for i, name in enumerate(names)}
+        self._rolls = rolls
+        self._labels = labels.astype(np.int64)
+        self.tail = np.empty((0, self.encodings.shape[1]), dtype=self.encodings.dtype)
+        self.size = len(rolls)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def rolls(self):
+        return self._rolls[:self.size]
+
+    @property
+    def prototypes(self):
+        return self._prototypes[:self.prototype_count]
+
+    @property
+    def prototype_rolls(self):
+        return self._prototype_rolls[:self.prototype_count]
+
+    def add(self, encodings, rolls):
+        """Append samples and fold them into their students' prototypes."""
+        new = np.asarray(encodings, dtype=self.encodings.dtype).reshape(-1, self.encodings.shape[1])
+        rolls = [str(r) for r in rolls]
+        start, end = self.size, self.size + len(new)
+        base = len(self.encodings)
+        # Rows past ``size`` are invisible to match(), so fill them in before publishing
+        self.tail = _grown(self.tail, end - base)
+        self._rolls = _grown(self._rolls, end)
+        self._labels = _grown(self._labels, end)
+        self.tail[start - base:end - base] = new
+        self._rolls[start:end] = rolls
+        self._labels[start:end] = [self._label_of.setdefault(r, len(self._label_of)) for r in rolls]
+        by_roll = {}
+        for i, roll in enumerate(rolls):
+            by_roll.setdefault(roll, []).append(i)
+        for roll, idx in by_roll.items():
+            samples = new[idx]
+            known = self._rows.get(roll, np.empty(0, dtype=np.int64))
+            # Rows first: a prototype that screens in a student needs their rows listed
+            self._rows[roll] = np.concatenate([known, start + np.asarray(idx, dtype=np.int64)])
+            protos = self._protos_of.get(roll, [])
+            if len(protos) == 1 and len(known):
+                i = protos[0]
+                mean = (self._prototypes[i] * len(known) + samples.sum(axis=0)) / (len(known) + len(samples))
+                self._set_prototype(i, mean)
+            else:
+                self._append_prototype(roll, samples.mean(axis=0))
+        self.size = end
+
+    def _set_prototype(self, i, vector):
+        self._prototypes[i] = vector
+        self._prototypes_sq[i] = vector @ vector
+
+    def _append_prototype(self, roll, vector):
+        i = self.prototype_count
+        self._prototypes = _grown(self._prototypes, i + 1)
+        self._prototypes_sq = _grown(self._prototypes_sq, i + 1)
+        self._prototype_rolls = _grown(self._prototype_rolls, i + 1)
+        self._prototype_rolls[i] = roll
+        self._set_prototype(i, vector)
+        self._protos_of.setdefault(roll, []).append(i)
+        self._per_student = max(self._per_student, len(self._protos_of[roll]))
+        self.prototype_count = i + 1
+
+    def _samples(self, rows):
+        """Raw sample vectors for gallery row indices (stored rows or the tail)."""
+        base = len(self.encodings)
+        if not len(rows) or rows.max() < base:
+            return self.encodings[rows]
+        out = np.empty((len(rows), self.encodings.shape[1]), dtype=self.encodings.dtype)
+        stored = rows < base
+        out[stored] = self.encodings[rows[stored]]
+        out[~stored] = self.tail[rows[~stored] - base]
+        return out
+
+    def candidates(self, probes):
+        """Return, per probe, the rolls of the ``top_k`` nearest prototypes' students."""
+        count = self.prototype_count
+        d = pairwise_distances(probes, self._prototypes[:count], self._prototypes_sq[:count])
+        # top_k students own at most top_k * per_student prototypes
+        limit = min(d.shape[1], self.top_k * self._per_student)
+        if limit < d.shape[1]:
+            nearest = np.argpartition(d, limit - 1, axis=1)[:, :limit]
+        else:
+            nearest = np.broadcast_to(np.arange(d.shape[1]), d.shape)
+        out = []
+        prototype_rolls = self._prototype_rolls[:count]
+        for dist, idx in zip(d, nearest):
+            seen = []
+            for roll in prototype_rolls[idx[np.argsort(dist[idx])]]:
+                if roll not in seen:
+                    seen.append(roll)
+                    if len(seen) == self.top_k:
+                        break
+            out.append(seen)
+        return out
+
+    def match(self, probes, tolerance=TOLERANCE):
+        if not len(probes):
+            return []
+        probes = np.asarray(probes, dtype=self.encodings.dtype).reshape(len(probes), -1)
+        if not self.prototype_count:
+            return resolve_matches(np.empty((len(probes), 0)), self._labels[:0], self._rolls[:0], tolerance)
+        results = []
+        for probe, candidates in zip(probes, self.candidates(probes)):
+            rows = np.concatenate([self._rows[r] for r in candidates])
+            # Buffers are read after the rows: add() grows them before listing new rows
+            d = pairwise_distances(probe[None, :], self._samples(rows))
+            results.extend(resolve_matches(d, self._labels[rows], self._rolls[rows], tolerance))
+        return results
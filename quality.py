@@ -0,0 +1,190 @@
+"""Enrollment-time sample scoring, diversity pruning and conflict checks.
+
+add_faces.py used to keep the first 20 encodings it saw, mostly
+near-duplicates from consecutive frames. ``start_add_details`` stored every
+face in the frame under the new roll, bystanders included. Every extra
+sample is one more row that each match has to scan.
+
+Each candidate sample now gets a quality score in [0, 1]. It is the
+geometric mean of four parts:
+
+- sharpness: variance of the Laplacian of the face crop, resized to a fixed
+  height;
+- size: face height in pixels;
+- pose: a yaw estimate from the eye/nose landmarks;
+- detector confidence: the HOG detector score, when dlib exposes it.
+
+Samples below ``ENROLL_MIN_QUALITY`` are dropped. From the rest,
+farthest-point selection in encoding space keeps at most ``ENROLL_SAMPLES``
+samples. It starts from the best one and repeatedly adds the sample
+farthest from those already kept, stopping early once every remaining
+sample is within ``MIN_SPREAD`` of a kept one.
+
+A sample is a conflict when it sits closer to another enrolled student than
+to its own student's samples. Conflicts are reported and never stored.
+"""
+import os
+
+import numpy as np
+
+from matcher import UNKNOWN, pairwise_distances
+
+ENROLL_SAMPLES = int(os.environ.get("ENROLL_SAMPLES", "8"))
+MIN_QUALITY = float(os.environ.get("ENROLL_MIN_QUALITY", "0.35"))
+# Samples closer than this to a kept one add nothing to the gallery
+MIN_SPREAD = 0.08
+CANDIDATES = 40
+SHARPNESS_REF = 120.0   # Laplacian variance of a crisp 128 px face crop
+SIZE_REF = 120          # face height (px) from which size stops mattering
+CROP_HEIGHT = 128
+
+
+def _sharpness(rgb, box):
+    import cv2
+    top, right, bottom, left = box
+    crop = rgb[max(top, 0):bottom, max(left, 0):right]
+    if crop.size == 0:
+        return 0.0
+    gray = cv2.cvtColor(np.ascontiguousarray(crop), cv2.COLOR_RGB2GRAY)
+    scale = CROP_HEIGHT / float(gray.shape[0])
+    gray = cv2.resize(gray, (max(1, int(gray.shape[1] * scale)), CROP_HEIGHT))
+    return float(min(1.0, cv2.Laplacian(gray, cv2.CV_64F).var() / SHARPNESS_REF))
+
+
+def _pose(landmarks):
+    """1.0 for a frontal face, towards 0 as it turns (from eye/nose distances)."""
+    try:
+        left = np.mean(landmarks["left_eye"], axis=0)
+        right = np.mean(landmarks["right_eye"], axis=0)
+        nose = np.mean(landmarks["nose_tip"], axis=0)
+    except (KeyError, TypeError):
+        return None
+    a, b = np.linalg.norm(nose - left), np.linalg.norm(nose - right)
+    return float(1.0 - abs(a - b) / max(a + b, 1e-6))
+
+
+def _detector_scores(rgb, boxes):
+    """HOG detector confidence per box (None where dlib does not expose it)."""
+    try:
+        from face_recognition.api import face_detector
+        rects, scores, _ = face_detector.run(rgb, 1, -1)
+    except Exception:
+        return [None] * len(boxes)
+    result = []
+    for top, right, bottom, left in boxes:
+        best = None
+        for rect, score in zip(rects, scores):
+            # Same face if the centres are within half a face of each other
+            if abs(rect.center().x - (left + right) / 2) < (right - left) / 2 and \
+                    abs(rect.center().y - (top + bottom) / 2) < (bottom - top) / 2:
+                best = score if best is None else max(best, score)
+        # dlib scores are margins around 0; squash into (0, 1)
+        result.append(None if best is None else float(1.0 / (1.0 + np.exp(-2.0 * best))))
+    return result
+
+
+def score_faces(rgb, boxes, landmarks=None):
+    """Quality parts and overall score for each face box in an RGB frame."""
+    if landmarks is None:
+        try:
+            import face_recognition
+            landmarks = face_recognition.face_landmarks(rgb, boxes, model="small")
+        except Exception:
+            landmarks = [None] * len(boxes)
+    confidences = _detector_scores(rgb, boxes)
+    scores = []
+    for box, marks, confidence in zip(boxes, landmarks, confidences):
+        top, right, bottom, left = box
+        parts = {
+            "sharpness": round(_sharpness(rgb, box), 3),
+            "size": round(min(1.0, (bottom - top) / float(SIZE_REF)), 3),
+            "pose": _pose(marks) if marks else None,
+            "confidence": confidence,
+        }
+        known = [max(v, 1e-3) for v in parts.values() if v is not None]
+        parts["quality"] = round(float(np.exp(np.mean(np.log(known)))), 3)
+        scores.append(parts)
+    return scores
+
+
+def weakest(parts):
+    """Name of the lowest-scoring part, for user-facing hints."""
+    return min((k for k in ("sharpness", "size", "pose", "confidence") if parts.get(k) is not None),
+               key=lambda k: parts[k])
+
+
+def select_diverse(encodings, qualities, k=ENROLL_SAMPLES, min_spread=MIN_SPREAD, kept=None):
+    """Indexes of up to ``k`` samples chosen by farthest-point selection.
+
+    Starts from the highest-quality sample (or from the already ``kept``
+    encodings), then repeatedly takes the sample farthest from everything
+    chosen, with quality breaking near-ties. Stops when nothing left is at
+    least ``min_spread`` away.
+    """
+    encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+    qualities = np.asarray(qualities, dtype=np.float64)
+    if not len(encodings) or k <= 0:
+        return []
+    if kept is not None and len(kept):
+        nearest = pairwise_distances(encodings, np.asarray(kept, dtype=np.float32)).min(axis=1)
+        chosen = []
+    else:
+        first = int(np.argmax(qualities))
+        chosen = [first]
+        nearest = pairwise_distances(encodings, encodings[first:first + 1])[:, 0]
+    while len(chosen) < k:
+        gain = np.where(nearest >= min_spread, nearest * (0.5 + 0.5 * qualities), -1.0)
+        if chosen:
+            gain[chosen] = -1.0
+        best = int(np.argmax(gain))
+        if gain[best] < 0:
+            break
+        chosen.append(best)
+        nearest = np.minimum(nearest, pairwise_distances(encodings, encodings[best:best + 1])[:, 0])
+    return chosen
+
+
+def find_conflicts(encodings, roll, matcher, own_samples=()):
+    """``[(index, Match)]`` for samples closer to another student than to ``roll``.
+
+    A sample's own distance is to the nearest other sample of this batch or
+    to the student's ``own_samples`` already in the gallery.
+    """
+    encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+    if not len(encodings) or not len(matcher):
+        return []
+    own = pairwise_distances(encodings, encodings)
+    np.fill_diagonal(own, np.inf)
+    if len(own_samples):
+        own = np.hstack([own, pairwise_distances(encodings, np.asarray(own_samples, dtype=np.float32))])
+    own = own.min(axis=1)
+    conflicts = []
+    for i, match in enumerate(matcher.match(encodings)):
+        # Matched someone else: a conflict unless our own samples are closer still
+        if match.roll not in (UNKNOWN, str(roll)) and match.distance < own[i]:
+            conflicts.append((i, match))
+    return conflicts
+
+
+def screen(encodings, qualities, roll, gallery, k=ENROLL_SAMPLES, min_quality=MIN_QUALITY):
+    """Decide which new samples of ``roll`` are worth storing.
+
+    Returns ``(keep, conflicts, low, own)``: indexes to store, ``(index,
+    Match)`` conflicts, indexes below ``min_quality`` and the number of
+    samples the student already has. Selection continues from the stored
+    samples, so near-duplicates of them are skipped and the student never
+    goes past ``k`` samples.
+    """
+    stored, rolls = gallery.snapshot()
+    own_samples = stored[np.asarray(rolls, dtype=str) == str(roll)] if len(rolls) else stored[:0]
+    qualities = np.asarray(qualities, dtype=np.float64)
+    low = [i for i, q in enumerate(qualities) if q < min_quality]
+    good = [i for i, q in enumerate(qualities) if q >= min_quality]
+    encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+    conflicts = [(good[i], match) for i, match in
+                 find_conflicts(encodings[good], roll, gallery.matcher(), own_samples)]
+    flagged = {i for i, _ in conflicts}
+    good = [i for i in good if i not in flagged]
+    chosen = select_diverse(encodings[good], qualities[good], k - len(own_samples),
+                            kept=own_samples if len(own_samples) else None)
+    return sorted(good[i] for i in chosen), conflicts, low, len(own_samples)
@@ -0,0 +1,140 @@
+"""Batch face recognition for group / classroom photos.
+
+``/api/mark_attendance`` looks at one image and only its first face. For a
+batch of wide classroom shots every image is decoded, detected and encoded
+in a process pool (dlib releases little of the GIL, so threads would not
+help). All encodings are then matched against the gallery in one vectorized
+call.
+"""
+import base64
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from PIL import Image
+
+from metrics import count_faces, timed
+
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+# Phone photos are downscaled to this longest side before detection
+MAX_IMAGE_SIDE = int(os.environ.get("MAX_IMAGE_SIDE", "1280"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def decode_data_url(value):
+    """Bytes of a ``data:image/...;base64,`` URL (or bare base64 string)."""
+    if value.startswith("data:"):
+        header, _, value = value.partition(",")
+        if not header.startswith("data:image/") or not header.endswith(";base64"):
+            raise ValueError("Invalid image data")
+    return base64.b64decode(value)
+
+
+def decode_image(data, max_side=MAX_IMAGE_SIDE):
+    """Decode JPEG/PNG bytes straight into an RGB uint8 array.
+
+    Returns ``(rgb, scale)`` where ``scale`` maps coordinates in ``rgb`` back
+    to the original image. Large JPEGs are shrunk while decoding (libjpeg
+    DCT scaling via ``draft``) and then resized to ``max_side``.
+    """
+    img = Image.open(io.BytesIO(data))
+    width = img.size[0]
+    if max_side and max(img.size) > max_side:
+        img.draft("RGB", (max_side, max_side))
+        img = img.convert("RGB")
+        img.thumbnail((max_side, max_side), Image.BILINEAR)
+    else:
+        img = img.convert("RGB")
+    return np.asarray(img), width / float(img.size[0])
+
+
+def scale_box(box, scale):
+    if scale == 1.0:
+        return tuple(int(v) for v in box)
+    return tuple(int(round(v * scale)) for v in box)
+
+
+def detect_and_encode(data):
+    """Worker: return ``(boxes, encodings)`` for every face in one image.
+
+    Boxes are in the coordinates of the original (not downscaled) image.
+    """
+    import face_recognition
+    rgb, scale = decode_image(data)
+    boxes = face_recognition.face_locations(rgb)
+    encodings = face_recognition.face_encodings(rgb, boxes)
+    return [scale_box(box, scale) for box in boxes], np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn, not fork: the web process already runs camera,
+                # notifier and fsync threads that a fork would copy mid-flight
+                _executor = ProcessPoolExecutor(BATCH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def encode_images(images):
+    """Detect and encode a list of image byte strings.
+
+    Returns one ``(boxes, encodings, error)`` per image; a single image is
+    handled in-process to skip the pool round trip.
+    """
+    if len(images) == 1:
+        return [_attempt(detect_and_encode, images[0])]
+    executor = get_executor()
+    futures = [executor.submit(detect_and_encode, data) for data in images]
+    outcomes = [_attempt(future.result) for future in futures]
+    if any(isinstance(future.exception(), BrokenProcessPool) for future in futures):
+        _reset_executor(executor)
+    return outcomes
+
+
+def _reset_executor(executor):
+    # A crashed worker (e.g. dlib running out of memory) breaks the whole
+    # pool; drop it so the next batch starts a fresh one
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def _attempt(fn, *args):
+    try:
+        boxes, encodings = fn(*args)
+        return boxes, encodings, None
+    except Exception as e:
+        return [], np.empty((0, 128), dtype=np.float32), f"Image processing error: {e}"
+
+
+def recognize_images(images, matcher):
+    """Detect, encode and match every face in ``images`` with one match call.
+
+    Returns ``(faces, errors)`` where ``faces`` is a list of
+    ``(image_index, box, Match)`` and ``errors`` maps image index to message.
+    """
+    with timed("batch", "encode"):
+        outcomes = encode_images(images)
+    owners, boxes, errors = [], [], {}
+    for index, (image_boxes, _, error) in enumerate(outcomes):
+        if error:
+            errors[index] = error
+        owners.extend([index] * len(image_boxes))
+        boxes.extend(image_boxes)
+    if not boxes:
+        return [], errors
+    encodings = np.concatenate([enc for _, enc, _ in outcomes if len(enc)])
+    with timed("batch", "match"):
+        matches = matcher.match(encodings)
+    count_faces("batch", matches)
+    return list(zip(owners, boxes, matches)), errors
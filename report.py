@@ -0,0 +1,212 @@
+"""Per-standard attendance reports over a date range.
+
+``students_by_standard`` used to re-read students.csv with pandas, filter
+it with ``iterrows()``, parse the day's CSV by hand and build the present
+and absent sets with list comprehensions, one day at a time. The report
+engine instead works on columns: the standard's roll numbers are one sorted
+array, and each day's attendance is a pair of (roll, arrival second)
+arrays. A whole range is joined in one ``searchsorted`` into a students x
+days presence matrix, and every figure (present, absent, late, rate) is a
+sum along one of its axes.
+
+Each day's columns are cached per (standard, date). An entry is valid while
+that day's ``daily_summary`` count is unchanged, so attendance marked by
+any worker invalidates exactly the days it touched. One small query checks
+the whole range.
+
+School days are the days on which anyone in the school was marked; a day
+asked for on its own always counts. A present student is late when they
+arrived after ``REPORT_LATE_AFTER`` (HH:MM[:SS], default 09:00).
+"""
+import csv
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from db import from_iso, get_db, seconds_of_day, to_iso
+from roster import get_roster
+
+LATE_AFTER = os.environ.get("REPORT_LATE_AFTER", "09:00")
+CACHE_DAYS = int(os.environ.get("REPORT_CACHE_DAYS", "4096"))
+STUDENT_COLUMNS = ["roll_number", "full_name", "present", "absent", "late", "rate"]
+
+
+class StandardReport:
+    """Presence matrix of one standard over a list of school days."""
+
+    def __init__(self, standard, start, end, days, students, present, arrival, late_after):
+        self.standard = standard
+        self.start = start
+        self.end = end
+        self.days = days
+        self.students = students
+        self.present = present            # bool, students x days
+        self.arrival = arrival            # seconds of day, -1 where absent
+        self.late = present & (arrival > late_after)
+
+    def _rate(self, present, possible):
+        return np.round(np.divide(present, possible, out=np.zeros(np.shape(present)),
+                                  where=np.asarray(possible) > 0), 4)
+
+    def totals(self):
+        present = int(self.present.sum())
+        possible = self.present.size
+        return {"students": len(self.students), "school_days": len(self.days), "present": present,
+                "absent": possible - present, "late": int(self.late.sum()),
+                "rate": float(self._rate(present, possible))}
+
+    def per_day(self):
+        present = self.present.sum(axis=0)
+        late = self.late.sum(axis=0)
+        rate = self._rate(present, len(self.students))
+        return [{"date": from_iso(day), "present": int(p), "absent": len(self.students) - int(p),
+                 "late": int(lt), "rate": float(r)} for day, p, lt, r in zip(self.days, present, late, rate)]
+
+    def per_student(self):
+        present = self.present.sum(axis=1)
+        late = self.late.sum(axis=1)
+        rate = self._rate(present, len(self.days))
+        return [{"roll_number": s["roll_number"], "full_name": s["full_name"], "present": int(p),
+                 "absent": len(self.days) - int(p), "late": int(lt), "rate": float(r)}
+                for s, p, lt, r in zip(self.students, present, late, rate)]
+
+    def times(self, day):
+        """``{roll: arrival time}`` for one day of the report."""
+        j = self.days.index(to_iso(day))
+        return {s["roll_number"]: self._clock(t) for s, ok, t in
+                zip(self.students, self.present[:, j], self.arrival[:, j]) if ok}
+
+    @staticmethod
+    def _clock(seconds):
+        return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}" if seconds >= 0 else ""
+
+    def to_dict(self):
+        return {"standard": self.standard, "start": from_iso(self.start), "end": from_iso(self.end),
+                "totals": self.totals(), "days": self.per_day(), "students": self.per_student()}
+
+
+class ReportEngine:
+    def __init__(self, db_path=None, roster=None, late_after=LATE_AFTER, cache_days=CACHE_DAYS):
+        self.db_path = db_path
+        self.roster = roster
+        self.late_after = seconds_of_day(late_after)
+        self.cache_days = cache_days
+        self._lock = threading.Lock()
+        self._days = OrderedDict()    # (standard, iso date) -> (count, rolls, seconds)
+        self._students = {}           # standard -> (roster version, records, sorted rolls, order)
+        self.hits = self.misses = 0
+
+    def _roster_columns(self, standard):
+        roster = self.roster if self.roster is not None else get_roster()
+        students = roster.standard(standard)
+        cached = self._students.get(standard)
+        if cached is not None and cached[0] == roster.version:
+            return cached[1:]
+        rolls = np.array([s["roll_number"] for s in students], dtype=str)
+        order = np.argsort(rolls, kind="stable")
+        columns = (students, rolls[order], order)
+        self._students[standard] = (roster.version,) + columns
+        return columns
+
+    def _day_columns(self, conn, standard, counts):
+        """Cached ``(rolls, seconds)`` per day, reloading days whose count moved."""
+        result, stale = {}, []
+        with self._lock:
+            for day, count in counts.items():
+                entry = self._days.get((standard, day))
+                if entry is not None and entry[0] == count:
+                    self._days.move_to_end((standard, day))
+                    result[day] = entry[1:]
+                    self.hits += 1
+                else:
+                    stale.append(day)
+        if not stale:
+            return result
+        cur = conn.cursor()
+        cur.row_factory = None  # plain tuples: half the cost of sqlite3.Row for big ranges
+        rows = cur.execute("SELECT date, roll_number, time FROM attendance "
+                           "WHERE standard = ? AND date >= ? AND date <= ? ORDER BY date",
+                           (standard, min(stale), max(stale))).fetchall()
+        dates, rolls, times = zip(*rows) if rows else ((), (), ())
+        # Arrival times repeat a lot: parse each distinct string once
+        parsed = {t: seconds_of_day(t) for t in set(times)}
+        seconds = np.array([parsed[t] for t in times], dtype=np.int32)
+        rolls = np.array(rolls, dtype=str)
+        dates = np.array(dates, dtype=str)
+        # Rows are sorted by date, so each day is one slice
+        bounds = zip(stale, np.searchsorted(dates, stale, side="left"), np.searchsorted(dates, stale, side="right"))
+        loaded = {day: (rolls[lo:hi], seconds[lo:hi]) for day, lo, hi in bounds}
+        with self._lock:
+            self.misses += len(stale)
+            for day, columns in loaded.items():
+                # Keyed by the count read before the rows, so a concurrent mark only causes a reload
+                self._days[(standard, day)] = (counts[day],) + columns
+                result[day] = columns
+            while len(self._days) > self.cache_days:
+                self._days.popitem(last=False)
+        return result
+
+    def report(self, standard, start, end=None):
+        """Report for ``standard`` from ``start`` to ``end`` (inclusive, any date format)."""
+        standard = str(standard)
+        start = to_iso(start)
+        end = to_iso(end) if end else start
+        conn = get_db(self.db_path)
+        # School days and this standard's per-day counts (the cache keys) in one query
+        school_days, counts = set(), {}
+        for day, std, present in conn.execute(
+                "SELECT date, standard, present FROM daily_summary WHERE date >= ? AND date <= ? AND present > 0",
+                (start, end)):
+            school_days.add(day)
+            if std == standard:
+                counts[day] = present
+        if start == end:
+            school_days.add(start)
+        days = sorted(school_days)
+        columns = self._day_columns(conn, standard, {day: counts.get(day, 0) for day in days})
+
+        students, rolls, order = self._roster_columns(standard)
+        present = np.zeros((len(students), len(days)), dtype=bool)
+        arrival = np.full((len(students), len(days)), -1, dtype=np.int32)
+        if days and len(rolls):
+            # Join every (roll, day) pair of the range against the roster in one pass
+            day_rolls = [columns[day][0] for day in days]
+            marked = np.concatenate(day_rolls)
+            seconds = np.concatenate([columns[day][1] for day in days])
+            day_index = np.repeat(np.arange(len(days)), [len(r) for r in day_rolls])
+            pos = np.minimum(np.searchsorted(rolls, marked), len(rolls) - 1)
+            hit = rolls[pos] == marked
+            rows = order[pos[hit]]
+            present[rows, day_index[hit]] = True
+            arrival[rows, day_index[hit]] = seconds[hit]
+        return StandardReport(standard, start, end, days, students, present, arrival, self.late_after)
+
+    def stats(self):
+        return {"cached_days": len(self._days), "hits": self.hits, "misses": self.misses}
+
+
+def report_csv(report):
+    """CSV text of a report: one row per student."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(STUDENT_COLUMNS)
+    for row in report.per_student():
+        writer.writerow([row[k] for k in STUDENT_COLUMNS])
+    return buf.getvalue()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_reports():
+    """Return the shared report engine."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = ReportEngine()
+    return _engine
@@ -0,0 +1,119 @@
+"""Indexed, in-memory cache of the ``students`` table.
+
+Request handlers used to re-read ``data/students.csv`` with pandas and walk
+it with ``iterrows()`` on every call. The roster loads the table once into
+plain dict records and keeps indexes by roll number and by standard. It
+reloads when the table's change counter moves (any worker adding a student
+bumps it) and updates in place when a student is added here.
+"""
+import threading
+from datetime import datetime
+
+from db import CSV_EXPORT, append_csv, get_db, transaction
+
+STUDENTS_FILE = "data/students.csv"
+FIELDS = ["roll_number", "full_name", "dob", "parent_mobile", "parent_email", "standard", "year_joined"]
+
+
+def _index(record, records, by_roll, by_standard):
+    records.append(record)
+    by_roll[record["roll_number"]] = record
+    # Rows missing a standard (e.g. half-written) are kept out of the per-standard view
+    if record["standard"]:
+        by_standard.setdefault(record["standard"], []).append(record)
+
+
+class Roster:
+    def __init__(self, db_path=None):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._version = None
+        self.records = []
+        self.by_roll = {}
+        self.by_standard = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def version(self):
+        """Change counter of the loaded snapshot (moves on every reload)."""
+        return self._version
+
+    def _db_version(self, conn):
+        return conn.execute("SELECT value FROM meta WHERE key = 'students_version'").fetchone()[0]
+
+    def refresh(self, force=False):
+        """Reload from the database if it changed. Returns True if it reloaded."""
+        conn = get_db(self.db_path)
+        version = self._db_version(conn)
+        if not force and version == self._version:
+            return False
+        with self._lock:
+            # Read version and rows in one snapshot so they agree
+            with transaction(conn, immediate=False):
+                version = self._db_version(conn)
+                if not force and version == self._version:
+                    return False
+                rows = conn.execute(f"SELECT {', '.join(FIELDS)} FROM students ORDER BY rowid").fetchall()
+            records, by_roll, by_standard = [], {}, {}
+            for row in rows:
+                _index({k: row[k] or "" for k in FIELDS}, records, by_roll, by_standard)
+            # Swap whole indexes so concurrent readers never see a half-built one
+            self.records, self.by_roll, self.by_standard = records, by_roll, by_standard
+            self._version = version
+            return True
+
+    def get(self, roll):
+        """Return the student record for ``roll`` or None."""
+        self.refresh()
+        return self.by_roll.get(str(roll))
+
+    def standard(self, std):
+        """Return the students of standard ``std`` in enrollment order."""
+        self.refresh()
+        return list(self.by_standard.get(str(std), []))
+
+    def all(self):
+        self.refresh()
+        return list(self.records)
+
+    def add(self, full_name, dob, parent_mobile, parent_email, standard):
+        """Insert a new student with the next FCFS roll number (YYYY000X)."""
+        year_joined = str(datetime.now().year)
+        conn = get_db(self.db_path)
+        with self._lock, transaction(conn):
+            # The write lock is held, so no other worker can take the same number
+            count_this_year = conn.execute(
+                "SELECT COUNT(*) FROM students WHERE year_joined = ?", (year_joined,)).fetchone()[0]
+            record = {
+                "roll_number": f"{year_joined}{count_this_year + 1:04d}",
+                "full_name": full_name or "",
+                "dob": dob or "",
+                "parent_mobile": parent_mobile or "",
+                "parent_email": parent_email or "",
+                "standard": standard or "",
+                "year_joined": year_joined,
+            }
+            conn.execute(f"INSERT INTO students ({', '.join(FIELDS)}) VALUES "
+                         f"({', '.join(':' + k for k in FIELDS)})", record)
+        self.refresh()
+        if CSV_EXPORT:
+            append_csv(STUDENTS_FILE, FIELDS, [[record[k] for k in FIELDS]])
+        return record
+
+
+_roster = None
+_roster_lock = threading.Lock()
+
+
+def get_roster():
+    """Return the shared roster, loading it on first use."""
+    global _roster
+    if _roster is None:
+        with _roster_lock:
+            if _roster is None:
+                roster = Roster()
+                roster.refresh()
+                _roster = roster
+    return _roster
@@ -1,8 +1,13 @@
+# ``streamlit run see.py`` has already imported streamlit; pandas only loads
+# once there is attendance to show
 import streamlit as st
-import pandas as pd
 import time 
 from datetime import datetime
 
+from lazy import LazyModule
+
+pd = LazyModule("pandas")
+
 ts=time.time()
 date=datetime.fromtimestamp(ts).strftime("%d-%m-%Y")
 timestamp=datetime.fromtimestamp(ts).strftime("%H:%M-%S")
@@ -23,10 +28,10 @@ else:
     st.write(f"Count: {count}")
 
 
-import os
-attendance_file = f"Attendance/Attendance_{date}.csv"
-if os.path.exists(attendance_file):
-    df = pd.read_csv(attendance_file)
+from ledger import COLUMNS, query_attendance
+rows = query_attendance(date=date)
+if rows:
+    df = pd.DataFrame([[r["roll"], r["name"], r["standard"], r["time"]] for r in rows], columns=COLUMNS)
     st.dataframe(df.style.highlight_max(axis=0))
 else:
     st.warning(f"No attendance data found for {date}.")
\ No newline at end of file
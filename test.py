@@ -1,29 +1,21 @@
 import cv2
 import face_recognition
-import pickle
-import os
-import csv
-import time
 from datetime import datetime
 from win32com.client import Dispatch
+from gallery import get_gallery
+from ledger import get_ledger
+from roster import get_roster
 
 def speak(str1):
     spk = Dispatch("SAPI.SpVoice")
     spk.Speak(str1)
 
 # Load encodings
-with open("data/encodings.pkl", "rb") as f:
-    known_encodings, known_names = pickle.load(f)
+gallery = get_gallery()
 
 video = cv2.VideoCapture(0)
 imgBackground = cv2.imread("C:/Users/nusum/Downloads/face-attendence/background.png")
-COL_NAMES = ['NAME', 'TIME']
-
-# Keep track of who has already been marked
-attendance_log = set()
-
-# Ensure Attendance folder exists
-os.makedirs("Attendance", exist_ok=True)
+roster = get_roster()
 
 while True:
     ret, frame = video.read()
@@ -34,36 +26,25 @@ while True:
     faces = face_recognition.face_locations(rgb_frame)
     encodings = face_recognition.face_encodings(rgb_frame, faces)
 
-    for (top, right, bottom, left), face_enc in zip(faces, encodings):
-        matches = face_recognition.compare_faces(known_encodings, face_enc, tolerance=0.5)
-        name = "Unknown"
+    matches = gallery.matcher().match(encodings)
 
-        if True in matches:
-            first_match_index = matches.index(True)
-            name = known_names[first_match_index]
+    for (top, right, bottom, left), match in zip(faces, matches):
+        name = match.roll
 
         # Draw rectangle and name
         cv2.rectangle(frame, (left, top), (right, bottom), (50, 50, 255), 2)
         cv2.putText(frame, name, (left, top - 10),
                     cv2.FONT_HERSHEY_COMPLEX, 1, (255, 255, 255), 2)
 
-        # Automatically log attendance
-        if name != "Unknown" and name not in attendance_log:
-            ts = time.time()
-            date = datetime.fromtimestamp(ts).strftime("%d-%m-%Y")
-            timestamp = datetime.fromtimestamp(ts).strftime("%H:%M:%S")
-            attendance = [name, timestamp]
-
-            file_path = f"Attendance/Attendance_{date}.csv"
-            write_header = not os.path.exists(file_path)
-
-            with open(file_path, "a", newline="") as csvfile:
-                writer = csv.writer(csvfile)
-                if write_header:
-                    writer.writerow(COL_NAMES)
-                writer.writerow(attendance)
-
-            attendance_log.add(name)
+        # Automatically log attendance (same daily ledger as the web app)
+        if name != "Unknown":
+            now = datetime.now()
+            timestamp = now.strftime("%H:%M:%S")
+            student = roster.get(name)
+            full_name = student['full_name'] if student else name
+            standard = student['standard'] if student else ''
+            if not get_ledger(now.strftime("%d-%m-%Y")).mark(name, full_name, standard, timestamp):
+                continue
             speak(f"Attendance Taken for {name}")
             print(f"[INFO] Attendance logged for {name} at {timestamp}")
 
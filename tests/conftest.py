@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Failures the notifier tests provoke stay out of the working tree
+os.environ.setdefault("EMAIL_ERROR_LOG", os.path.join(tempfile.mkdtemp(prefix="attendance-tests-"), "email_errors.log"))
@@ -0,0 +1,30 @@
+from analytics import rollup, verify
+from db import get_db
+from ledger import AttendanceLedger
+
+
+def test_incremental_stats_match_a_full_recompute(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db_path = str(tmp_path / "attendance.db")
+    conn = get_db(db_path)
+    with conn:
+        conn.executemany("INSERT INTO students (roll_number, full_name, standard, year_joined) VALUES (?, ?, '5', '2024')",
+                         [("1", "Asha"), ("2", "Ravi"), ("3", "Meena")])
+
+    def mark(day, *rolls):
+        AttendanceLedger(day, db_path=db_path).mark_many([(r, f"Student {r}", "5", "09:0" + r) for r in rolls])
+
+    mark("2024-03-04", "1", "2", "3")
+    mark("2024-03-05", "1", "2")
+    rollup(conn, until="2024-03-05")
+    mark("2024-03-06", "1", "3")
+    mark("2024-03-07", "2")
+    rollup(conn, until="2024-03-07")
+    # Roll 3 was missed on the 5th and is entered a few days late
+    mark("2024-03-05", "3")
+    mark("2024-03-08", "1", "2", "3")
+    rollup(conn, until="2024-03-08")
+    assert verify(conn) == []
+    stats = {r["roll_number"]: r for r in conn.execute("SELECT * FROM student_stats")}
+    assert stats["3"]["days_present"] == 4 and stats["3"]["absent_days"] == 1
+    assert stats["2"]["absent_days"] == 1 and stats["2"]["streak"] == 2
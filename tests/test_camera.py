@@ -0,0 +1,87 @@
+import time
+
+import numpy as np
+
+from camera import CameraService, FileSource, open_camera_source
+
+
+class FakeSource:
+    def __init__(self, on_release=None):
+        self.on_release = on_release
+        self.released = False
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        time.sleep(0.005)
+        return True, object()
+
+    def release(self):
+        self.released = True
+        if self.on_release:
+            self.on_release()
+
+
+def test_subscriber_arriving_during_idle_shutdown_gets_frames():
+    late = []
+    sources = []
+
+    def open_source():
+        # The first source's release stands in for a subscribe() that lands
+        # after the idle check but before the capture thread shuts down
+        source = FakeSource(on_release=(lambda: late.append(service.subscribe())) if not sources else None)
+        sources.append(source)
+        return source
+
+    service = CameraService(open_source=open_source, idle_release=0.0)
+    first = service.subscribe()
+    assert first.read(1.0)[0]
+    first.close()
+    deadline = time.monotonic() + 5.0
+    while not sources[0].released and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert late and len(sources) == 2
+    ok, _ = late[0].read(1.0)
+    assert ok and service.subscribers == 1
+    late[0].close()
+
+
+def write_frames(directory, count=3):
+    import cv2
+    for i in range(count):
+        cv2.imwrite(str(directory / f"frame{i}.png"), np.full((24, 32, 3), i * 50, dtype=np.uint8))
+
+
+def test_file_source_replays_an_image_directory(tmp_path):
+    write_frames(tmp_path)
+    source = open_camera_source(str(tmp_path))
+    assert isinstance(source, FileSource) and source.isOpened()
+    source.interval = 0.0
+    values = [int(source.read()[1][0, 0, 0]) for _ in range(5)]
+    assert values == [0, 50, 100, 0, 50]
+    once = FileSource(str(tmp_path), fps=0, loop=False)
+    assert [once.read()[0] for _ in range(4)] == [True, True, True, False]
+    assert not FileSource(str(tmp_path / "missing")).isOpened()
+
+
+def test_service_over_file_source_releases_when_idle(tmp_path):
+    write_frames(tmp_path)
+    opened = []
+
+    def open_source():
+        opened.append(FileSource(str(tmp_path), fps=200))
+        return opened[-1]
+
+    service = CameraService(open_source=open_source, idle_release=0.05)
+    with service.subscribe() as sub:
+        values = [int(sub.read(1.0)[1][0, 0, 0]) for _ in range(4)]
+    # Frames cycle through the directory (the subscriber may skip some)
+    assert set(values) <= {0, 50, 100} and len(set(values)) > 1
+    deadline = time.monotonic() + 5.0
+    while service._running and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not service._running and service.subscribers == 0
+    # The next subscriber reopens the source
+    frame = service.snapshot(1.0)
+    assert frame is not None and len(opened) == 2
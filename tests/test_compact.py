@@ -0,0 +1,20 @@
+import numpy as np
+
+from compact import CompactMatcher, build_compact
+
+
+def test_enrollments_after_compaction_grow_in_place():
+    rng = np.random.default_rng(0)
+    encodings = rng.normal(size=(300, 128)).astype(np.float32)
+    rolls = [str(i // 3) for i in range(300)]
+    for fmt in ("float16", "pq"):
+        compact = build_compact(encodings[:200], rolls[:200], fmt=fmt, dedup_distance=0)
+        matcher = CompactMatcher(encodings[:200], rolls[:200], compact)
+        for i in range(200, 300):
+            matcher.add(encodings[i:i + 1], rolls[i:i + 1])
+        # One face at a time, but the tail was copied only on doubling
+        assert len(matcher) == 300 and matcher.tail_size == 100 and len(matcher._tail) < 200
+        rebuilt = CompactMatcher(encodings, rolls, compact)
+        probes = encodings[::5] + rng.normal(0, 0.01, (60, 128)).astype(np.float32)
+        assert matcher.match(probes) == rebuilt.match(probes)
+        assert [m.roll for m in matcher.match(encodings[200:])] == rolls[200:]
@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+
+import gallery as gallery_module
+from gallery import FaceGallery
+from ivf import IVF_FILE, IVFMatcher
+from matcher import ExhaustiveMatcher
+
+
+def test_enrollment_extends_the_exhaustive_matcher(tmp_path):
+    rng = np.random.default_rng(0)
+    encodings = rng.normal(size=(60, 128)).astype(np.float32)
+    rolls = [f"R{i // 3}" for i in range(60)]
+    gallery = FaceGallery(path=str(tmp_path / "encodings.pkl"), store_path=str(tmp_path / "encodings.f32"),
+                          index="exhaustive")
+    gallery.add_many(encodings[:30], rolls[:30])
+    matcher = gallery.matcher()
+    for start in range(30, 60, 6):
+        gallery.add_many(encodings[start:start + 6], rolls[start:start + 6])
+        # Same object, fed only the new rows
+        assert gallery.matcher() is matcher
+    assert len(matcher) == 60
+    assert list(matcher.rolls) == rolls
+    probes = encodings + rng.normal(0, 0.01, encodings.shape).astype(np.float32)
+    rebuilt = ExhaustiveMatcher(encodings, rolls).match(probes)
+    assert matcher.match(probes) == rebuilt
+    assert [m.roll for m in rebuilt] == rolls
+
+
+def test_store_read_returns_stable_label_views(tmp_path):
+    gallery = FaceGallery(path=str(tmp_path / "encodings.pkl"), store_path=str(tmp_path / "encodings.f32"))
+    gallery.add_many(np.zeros((2, 128), dtype=np.float32), ["A", "B"])
+    _, first = gallery.store.read()
+    gallery.add_many(np.ones((3, 128), dtype=np.float32), ["C", "D", "E"])
+    encodings, rolls = gallery.store.read()
+    assert list(first) == ["A", "B"]
+    assert list(rolls) == ["A", "B", "C", "D", "E"] and len(encodings) == 5
+
+
+def wait_for_training(gallery):
+    thread = gallery._training
+    if thread is not None:
+        thread.join(30)
+
+
+def test_ivf_fallback_trains_only_when_asked(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    gallery = FaceGallery(path=str(tmp_path / "encodings.pkl"), store_path=str(tmp_path / "encodings.f32"),
+                          index="ivf")
+    gallery.add_many(rng.normal(size=(200, 128)).astype(np.float32), [str(i // 4) for i in range(200)])
+    # Preloading (create_app) must not start a thread
+    assert isinstance(gallery.matcher(), ExhaustiveMatcher)
+    assert gallery._training is None
+    gallery.train_ivf()
+    wait_for_training(gallery)
+    assert os.path.exists(IVF_FILE)
+    assert isinstance(gallery.matcher(), IVFMatcher)
+
+
+def test_failed_ivf_training_is_retried(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(gallery_module, "IVF_RETRY", 0.0)
+    calls = []
+
+    def broken_kmeans(*args):
+        calls.append(args)
+        raise MemoryError
+
+    monkeypatch.setattr(gallery_module, "train_kmeans", broken_kmeans)
+    gallery = FaceGallery(path=str(tmp_path / "encodings.pkl"), store_path=str(tmp_path / "encodings.f32"),
+                          index="ivf")
+    gallery.add_many(np.ones((8, 128), dtype=np.float32), ["A"] * 8)
+    gallery.train_ivf()
+    wait_for_training(gallery)
+    assert gallery._training is None
+    gallery.matcher()
+    wait_for_training(gallery)
+    assert len(calls) == 2
+
+
+def test_enrollment_keeps_the_prototype_matcher(tmp_path):
+    rng = np.random.default_rng(0)
+    encodings = rng.normal(size=(40, 128)).astype(np.float32)
+    rolls = [f"R{i // 4}" for i in range(40)]
+    gallery = FaceGallery(path=str(tmp_path / "encodings.pkl"), store_path=str(tmp_path / "encodings.f32"),
+                          index="prototype")
+    gallery.add_many(encodings[:20], rolls[:20])
+    matcher = gallery.matcher()
+    gallery.add_many(encodings[20:], rolls[20:])
+    assert gallery.matcher() is matcher and len(matcher) == 40
+    assert [m.roll for m in matcher.match(encodings)] == rolls
@@ -0,0 +1,20 @@
+import numpy as np
+
+from ivf import IVFMatcher, train_kmeans
+
+
+def test_add_grows_in_place_and_matches_like_a_rebuild():
+    rng = np.random.default_rng(0)
+    encodings = rng.normal(size=(300, 128)).astype(np.float32)
+    rolls = [str(i // 3) for i in range(300)]
+    centroids = train_kmeans(encodings[:200], 8)
+    matcher = IVFMatcher(encodings[:200], rolls[:200], centroids, nprobe=8)
+    for start in range(200, 300, 10):
+        matcher.add(encodings[start:start + 10], rolls[start:start + 10])
+    # Capacity doubles, so 100 single-batch inserts needed only a couple of copies
+    assert len(matcher) == 300 and len(matcher._encodings) >= 300
+    rebuilt = IVFMatcher(encodings, rolls, centroids, nprobe=8)
+    probes = encodings[::7] + rng.normal(0, 0.01, (len(encodings[::7]), 128)).astype(np.float32)
+    assert [m.roll for m in matcher.match(probes)] == [m.roll for m in rebuilt.match(probes)]
+    np.testing.assert_array_equal(matcher.encodings, encodings)
+    assert list(matcher.rolls) == rolls
@@ -0,0 +1,17 @@
+import ledger
+
+
+def test_ledger_cache_keeps_today_and_a_few_other_dates(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(ledger, "_ledgers", ledger.OrderedDict())
+    monkeypatch.setattr(ledger, "today", lambda: "10-03-2024")
+    today = ledger.get_ledger()
+    dates = [f"{day:02d}-03-2024" for day in range(1, 10)]
+    for date in dates:
+        ledger.get_ledger(date)
+    # Touching the oldest kept date makes it the most recently used
+    ledger.get_ledger(dates[-ledger.OTHER_LEDGERS])
+    ledger.get_ledger("01-02-2024")
+    assert ledger.get_ledger() is today
+    assert list(ledger._ledgers) == ["10-03-2024"] + dates[-ledger.OTHER_LEDGERS + 2:] + [
+        dates[-ledger.OTHER_LEDGERS], "01-02-2024"]
@@ -0,0 +1,238 @@
+import base64
+import smtplib
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import notifier
+from locks import FileLock
+
+
+class RecordingPool:
+    user = "school@example.com"
+
+    def __init__(self):
+        self.sent = []
+
+    def configured(self):
+        return True
+
+    def send(self, msg, to):
+        self.sent.append(to)
+        return {}
+
+
+@pytest.fixture
+def make_notifier(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(notifier, "BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(notifier, "POLL_INTERVAL", 0.02)
+
+    def make():
+        return notifier.Notifier(pool=RecordingPool(), db_path=str(tmp_path / "attendance.db"),
+                                 sender_lock=str(tmp_path / "sender.lock"))
+    return make
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_sender_survives_database_errors(make_notifier, monkeypatch):
+    n = make_notifier()
+    claim = n._claim_next
+    failures = iter([True, True])
+
+    def flaky_claim(conn):
+        if next(failures, False):
+            raise sqlite3.OperationalError("database is locked")
+        return claim(conn)
+
+    monkeypatch.setattr(n, "_claim_next", flaky_claim)
+    assert n.enqueue("parent@example.com", "Arrival", "Present", key="arrival:1")
+    assert wait_for(lambda: n.pool.sent == ["parent@example.com"])
+    assert n._thread is not None and n._thread.is_alive()
+
+
+def test_sender_releases_lock_when_it_gives_up(make_notifier, tmp_path, monkeypatch):
+    n = make_notifier()
+
+    def broken_claim(conn):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(n, "_claim_next", broken_claim)
+    n.start()
+    assert wait_for(lambda: n._thread is None)
+    assert not n.leader
+    # Another sender can now take over
+    lock = FileLock(str(tmp_path / "sender.lock"))
+    assert lock.acquire(blocking=False)
+    lock.release()
+
+
+def test_stale_absence_claims_are_reclaimed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db_path = str(tmp_path / "attendance.db")
+    assert notifier._claim_absences("05-03-2024", ["1", "2"], db_path) == {"1", "2"}
+    # Both are now being sent; a second click claims neither
+    assert notifier._claim_absences("05-03-2024", ["1", "2"], db_path) == set()
+    # Roll 1's worker died long ago, mid-job
+    conn = notifier.get_db(db_path)
+    with conn:
+        conn.execute("UPDATE notifications SET updated = ? WHERE key = 'absence:1'",
+                     (time.time() - notifier.ABSENCE_CLAIM_TIMEOUT - 1,))
+    assert notifier._claim_absences("05-03-2024", ["1", "2"], db_path) == {"1"}
+
+
+def test_unconfigured_sender_warns_once_and_starts_when_configured(make_notifier, caplog):
+    n = make_notifier()
+    n.pool.configured = lambda: False
+    for roll in ("1", "2", "3"):
+        assert n.enqueue("parent@example.com", "Arrival", "Present", key=f"arrival:{roll}")
+    assert n._thread is None and n.queue_depth() == 3
+    assert [r.levelname for r in caplog.records if "not set" in r.getMessage()] == ["WARNING"]
+    n.pool.configured = lambda: True
+    assert n.enqueue("parent@example.com", "Arrival", "Present", key="arrival:4")
+    assert wait_for(lambda: len(n.pool.sent) == 4)
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """In-process SMTP server speaking just enough of the protocol for smtplib."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, user="school@example.com", password="secret"):
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.credentials = base64.b64encode(f"\0{user}\0{password}".encode()).decode()
+        self.connections = 0
+        self.logins = 0
+        self.noops = 0
+        self.messages = []
+        self.sockets = []
+
+    def drop(self):
+        """Hang up on every client, like a server closing idle sessions."""
+        for sock in self.sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.sockets = []
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        server.sockets.append(self.connection)
+        try:
+            self.reply("220 localhost ESMTP stand-in")
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                verb, _, arg = line.decode().strip().partition(" ")
+                verb = verb.upper()
+                if verb == "EHLO":
+                    self.reply("250-localhost")
+                    self.reply("250 AUTH PLAIN")
+                elif verb == "AUTH":
+                    ok = arg == f"PLAIN {server.credentials}"
+                    server.logins += ok
+                    self.reply("235 Authenticated" if ok else "535 Bad credentials")
+                elif verb == "DATA":
+                    self.reply("354 End data with <CR><LF>.<CR><LF>")
+                    data = b"".join(iter(self.rfile.readline, b".\r\n"))
+                    server.messages.append(data.decode())
+                    self.reply("250 Queued")
+                elif verb == "QUIT":
+                    self.reply("221 Bye")
+                    return
+                elif verb in ("HELO", "MAIL", "RCPT", "RSET", "NOOP"):
+                    server.noops += verb == "NOOP"
+                    self.reply("250 OK")
+                else:
+                    self.reply("502 Not implemented")
+        except OSError:
+            pass
+
+
+@pytest.fixture
+def smtp_server():
+    server = SMTPStandIn()
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_pool(server, **kwargs):
+    host, port = server.server_address
+    return notifier.SMTPPool(host=host, port=port, user="school@example.com", password="secret",
+                             starttls=False, **kwargs)
+
+
+def test_pool_sends_several_messages_over_one_login(smtp_server):
+    pool = make_pool(smtp_server)
+    for i in range(3):
+        pool.send(notifier.build_message("parent@example.com", f"Arrival {i}", "Present"), "parent@example.com")
+    pool.close()
+    assert len(smtp_server.messages) == 3 and "Subject: Arrival 2" in smtp_server.messages[2]
+    assert smtp_server.connections == 1 and smtp_server.logins == 1 and pool.connects == 1
+
+
+def test_pool_reconnects_after_the_server_hangs_up(smtp_server):
+    pool = make_pool(smtp_server)
+    msg = notifier.build_message("parent@example.com", "Arrival", "Present")
+    pool.send(msg, "parent@example.com")
+    smtp_server.drop()
+    pool.send(msg, "parent@example.com")
+    assert len(smtp_server.messages) == 2 and smtp_server.connections == 2
+
+
+def test_pool_probes_idle_connections(smtp_server, monkeypatch):
+    monkeypatch.setattr(notifier, "SMTP_IDLE_CHECK", 0)
+    pool = make_pool(smtp_server)
+    msg = notifier.build_message("parent@example.com", "Arrival", "Present")
+    pool.send(msg, "parent@example.com")
+    pool.send(msg, "parent@example.com")
+    # The live session answered NOOP and was reused
+    assert smtp_server.noops == 1 and smtp_server.connections == 1
+    smtp_server.drop()
+    pool.send(msg, "parent@example.com")
+    # The dead one failed the probe and was replaced
+    assert smtp_server.connections == 2 and len(smtp_server.messages) == 3
+
+
+def test_pool_refuses_to_send_with_wrong_credentials(smtp_server):
+    host, port = smtp_server.server_address
+    pool = notifier.SMTPPool(host=host, port=port, user="school@example.com", password="wrong", starttls=False)
+    with pytest.raises(smtplib.SMTPAuthenticationError):
+        pool.send(notifier.build_message("parent@example.com", "Arrival", "Present"), "parent@example.com")
+    # SMTP_AUTH=0: no login at all
+    pool = make_pool(smtp_server, auth=False)
+    pool.send(notifier.build_message("parent@example.com", "Arrival", "Present"), "parent@example.com")
+    assert smtp_server.logins == 0 and len(smtp_server.messages) == 1
+
+
+def test_notifier_sends_queued_emails_through_smtp(smtp_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    n = notifier.Notifier(pool=make_pool(smtp_server), db_path=str(tmp_path / "attendance.db"),
+                          sender_lock=str(tmp_path / "sender.lock"))
+    for roll in ("1", "2", "3"):
+        assert n.enqueue(f"parent{roll}@example.com", "Arrival", "Present", key=f"arrival:{roll}")
+    assert wait_for(lambda: len(smtp_server.messages) == 3)
+    assert smtp_server.connections == 1
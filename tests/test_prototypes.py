@@ -0,0 +1,38 @@
+import numpy as np
+
+from prototypes import PrototypeMatcher, build_prototypes
+
+
+def student_gallery(students=40, samples=6, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(0, 0.3, size=(students, 128)).astype(np.float32)
+    rolls = [str(s) for s in range(students) for _ in range(samples)]
+    encodings = np.repeat(centres, samples, axis=0) + rng.normal(0, 0.02, (len(rolls), 128)).astype(np.float32)
+    return encodings, rolls
+
+
+def test_add_keeps_mean_prototypes_equal_to_a_rebuild():
+    encodings, rolls = student_gallery()
+    # Rows 150+ hold new samples of existing students and all of 8 new students
+    matcher = PrototypeMatcher(encodings[:150], rolls[:150])
+    for start in range(150, len(rolls), 7):
+        matcher.add(encodings[start:start + 7], rolls[start:start + 7])
+    rebuilt = PrototypeMatcher(encodings, rolls)
+    order = np.argsort(matcher.prototype_rolls.astype(str), kind="stable")
+    assert list(matcher.prototype_rolls[order]) == list(rebuilt.prototype_rolls)
+    np.testing.assert_allclose(matcher.prototypes[order], rebuilt.prototypes, atol=1e-5)
+    probes = encodings + np.random.default_rng(1).normal(0, 0.01, encodings.shape).astype(np.float32)
+    assert [m.roll for m in matcher.match(probes)] == [m.roll for m in rebuilt.match(probes)] == rolls
+
+
+def test_add_extends_offline_kmedoids_prototypes():
+    encodings, rolls = student_gallery()
+    prototypes = build_prototypes(encodings[:150], rolls[:150], per_student=3, method="kmedoids")
+    matcher = PrototypeMatcher(encodings[:150], rolls[:150], *prototypes)
+    kept = matcher.prototypes.copy()
+    matcher.add(encodings[150:], rolls[150:])
+    # The offline prototypes stay; each enrolled student gains one mean prototype
+    np.testing.assert_array_equal(matcher.prototypes[:len(kept)], kept)
+    assert matcher.prototype_count == len(kept) + len(set(rolls[150:]))
+    assert len(matcher) == len(rolls)
+    assert [m.roll for m in matcher.match(encodings[150:])] == rolls[150:]
@@ -0,0 +1,46 @@
+from matcher import Match
+from tracker import FaceTracker
+
+SPEED = 4  # px per frame
+
+
+def moving_face(frame_no):
+    """(top, right, bottom, left) of an 80 px face moving right at SPEED px/frame."""
+    left = SPEED * frame_no
+    return (100, left + 80, 180, left)
+
+
+def test_constant_motion_is_predicted_without_drift():
+    frame_no = [0]
+    identified = []
+
+    def detect(frame):
+        return [moving_face(frame_no[0])]
+
+    def identify(frame, boxes):
+        identified.extend(boxes)
+        return [Match("1", 0.3, 0.2) for _ in boxes]
+
+    tracker = FaceTracker(detect, identify, detect_every=5, reidentify_every=1000)
+    for n in range(1, 41):
+        frame_no[0] = n
+        tracks = tracker.update(None)
+        assert len(tracks) == 1
+        # Predicted frames follow the true position exactly (after the first two detections)
+        if n > 6:
+            assert tracks[0].box == moving_face(n)
+    assert tracks[0].id == 1
+    assert len(identified) == 1
+
+
+def test_predictions_start_from_last_detection():
+    boxes = {1: (0, 80, 80, 0), 6: (0, 100, 80, 20)}
+    tracker = FaceTracker(lambda frame: [boxes[tracker.frame_no]], lambda frame, b: [Match("1", 0.3, 0.2)],
+                          detect_every=5)
+    for _ in range(6):
+        tracker.update(None)
+    track = tracker.tracks[0]
+    assert track.velocity == (4.0, 0.0)
+    for n in (7, 8, 9):
+        tracker.update(None)
+        assert track.box[3] == 20 + 4 * (n - 6)
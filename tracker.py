@@ -0,0 +1,183 @@
+"""Face tracking so a face is not re-encoded on every frame.
+
+The realtime loop used to run ``face_locations`` and ``face_encodings`` on
+every frame, even while the same student stood still for several seconds.
+The tracker gives each face a track id. Detection runs only every
+``DETECT_EVERY`` frames; in between, boxes are carried forward with their
+last observed motion. Detected boxes are associated to tracks by IoU, with
+centroid distance as a fallback. A track is encoded and matched only when
+it first appears, every ``REIDENTIFY_EVERY`` frames after that, or while
+its match is low-confidence (unknown, or a small margin to the next
+student). ``stats()`` reports how many encode calls that saved.
+"""
+import itertools
+import time
+
+from matcher import UNKNOWN
+
+DETECT_EVERY = 5
+REIDENTIFY_EVERY = 30
+IOU_THRESHOLD = 0.3
+CENTROID_THRESHOLD = 0.5  # fraction of the box size
+MAX_MISSED = 2  # detection rounds a track may go unseen
+MIN_MARGIN = 0.05
+
+
+def iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes."""
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    if not inter:
+        return 0.0
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    return inter / float(area_a + area_b - inter)
+
+
+def _centre(box):
+    return (box[3] + box[1]) / 2.0, (box[0] + box[2]) / 2.0
+
+
+def _centroid_close(a, b):
+    (ax, ay), (bx, by) = _centre(a), _centre(b)
+    size = max(a[1] - a[3], a[2] - a[0], 1)
+    return ((ax - bx) ** 2 + (ay - by) ** 2) ** 0.5 <= CENTROID_THRESHOLD * size
+
+
+class Track:
+    def __init__(self, track_id, box, frame_no):
+        self.id = track_id
+        self.box = box  # current position: the detection, or a prediction from it
+        self.observed = box  # last detected box; predictions always start here
+        self.velocity = (0.0, 0.0)
+        self.seen_at = frame_no
+        self.identified_at = None
+        self.match = None
+        self.fresh = False  # match was (re)computed on the latest frame
+        self.missed = 0
+
+    @property
+    def roll(self):
+        return self.match.roll if self.match else UNKNOWN
+
+    def confident(self, min_margin=MIN_MARGIN):
+        return self.match is not None and self.match.roll != UNKNOWN and self.match.margin >= min_margin
+
+    def observe(self, box, frame_no):
+        frames = max(1, frame_no - self.seen_at)
+        (ox, oy), (nx, ny) = _centre(self.observed), _centre(box)
+        self.velocity = ((nx - ox) / frames, (ny - oy) / frames)
+        self.box = self.observed = box
+        self.seen_at = frame_no
+        self.missed = 0
+
+    def predict(self, frame_no):
+        """Box extrapolated from the last detection with constant velocity."""
+        frames = frame_no - self.seen_at
+        dx, dy = int(round(self.velocity[0] * frames)), int(round(self.velocity[1] * frames))
+        top, right, bottom, left = self.observed
+        return (top + dy, right + dx, bottom + dy, left + dx)
+
+
+class FaceTracker:
+    """Runs ``detect(frame) -> boxes`` and ``identify(frame, boxes) -> matches`` sparingly."""
+
+    def __init__(self, detect, identify, detect_every=DETECT_EVERY, reidentify_every=REIDENTIFY_EVERY,
+                 iou_threshold=IOU_THRESHOLD, max_missed=MAX_MISSED, min_margin=MIN_MARGIN):
+        self.detect = detect
+        self.identify = identify
+        self.detect_every = max(1, detect_every)
+        self.reidentify_every = reidentify_every
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.min_margin = min_margin
+        self.tracks = []
+        self.frame_no = 0
+        self._ids = itertools.count(1)
+        self._started = time.monotonic()
+        self.detections = 0
+        self.encodes = 0
+        self.face_frames = 0  # encodes a detect+encode-every-frame loop would have done
+
+    def _associate(self, boxes):
+        """Greedy IoU matching, then centroid distance for what is left."""
+        pairs = sorted(((iou(t.box, b), ti, bi) for ti, t in enumerate(self.tracks) for bi, b in enumerate(boxes)),
+                       reverse=True)
+        assigned, used_tracks, used_boxes = {}, set(), set()
+        for score, ti, bi in pairs:
+            if score < self.iou_threshold:
+                break
+            if ti not in used_tracks and bi not in used_boxes:
+                assigned[bi] = ti
+                used_tracks.add(ti)
+                used_boxes.add(bi)
+        for bi, box in enumerate(boxes):
+            if bi in used_boxes:
+                continue
+            for ti, track in enumerate(self.tracks):
+                if ti not in used_tracks and _centroid_close(track.box, box):
+                    assigned[bi] = ti
+                    used_tracks.add(ti)
+                    used_boxes.add(bi)
+                    break
+        return assigned
+
+    def _needs_identify(self, track):
+        if track.identified_at is None or not track.confident(self.min_margin):
+            return True
+        return self.frame_no - track.identified_at >= self.reidentify_every
+
+    def update(self, frame):
+        """Advance one frame and return the live tracks."""
+        self.frame_no += 1
+        for track in self.tracks:
+            track.fresh = False
+        if (self.frame_no - 1) % self.detect_every:
+            for track in self.tracks:
+                track.box = track.predict(self.frame_no)
+            self.face_frames += len(self.tracks)
+            return list(self.tracks)
+
+        boxes = list(self.detect(frame))
+        self.detections += 1
+        self.face_frames += len(boxes)
+        assigned = self._associate(boxes)
+        seen = []
+        for bi, box in enumerate(boxes):
+            if bi in assigned:
+                track = self.tracks[assigned[bi]]
+                track.observe(box, self.frame_no)
+            else:
+                track = Track(next(self._ids), box, self.frame_no)
+            seen.append(track)
+        seen_ids = {t.id for t in seen}
+        for track in self.tracks:
+            if track.id not in seen_ids:
+                track.missed += 1
+                if track.missed <= self.max_missed:
+                    track.box = track.predict(self.frame_no)
+                    seen.append(track)
+        self.tracks = seen
+
+        pending = [t for t in self.tracks if t.seen_at == self.frame_no and self._needs_identify(t)]
+        if pending:
+            matches = self.identify(frame, [t.box for t in pending])
+            self.encodes += len(pending)
+            for track, match in zip(pending, matches):
+                track.match = match
+                track.identified_at = self.frame_no
+                track.fresh = True
+        return list(self.tracks)
+
+    def stats(self):
+        minutes = max(time.monotonic() - self._started, 1e-9) / 60.0
+        saved = max(0, self.face_frames - self.encodes)
+        return {
+            "tracks": len(self.tracks),
+            "frames": self.frame_no,
+            "detections": self.detections,
+            "encodes": self.encodes,
+            "encodes_saved": saved,
+            "encodes_saved_per_min": round(saved / minutes, 1),
+        }